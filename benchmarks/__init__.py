@@ -0,0 +1 @@
+"""Offline benchmarks for scpscraper. See run.py."""
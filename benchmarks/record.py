@@ -0,0 +1,43 @@
+"""
+Records article and series pages from the wiki into benchmarks/corpus/, so benchmarks can be run against real pages without touching the network again.
+
+Usage:
+  python -m benchmarks.record [min_skip] [max_skip]
+"""
+import os, sys
+from tqdm import tqdm
+
+import scpscraper
+from benchmarks.wiki import CORPUS_DIR, corpus_filename
+
+def record(min_skip: int=0, max_skip: int=200, directory: str=CORPUS_DIR, rate_limit: float=2) -> None:
+  """
+  Downloads SCPs min_skip to max_skip - 1 and their series pages into the corpus. Pages that don't exist are left out.
+
+  Parameters:
+    min_skip: The SCP number to start at. Default: 0
+    max_skip: The SCP number to end at plus one. Default: 200
+    directory: Directory to save the pages to. Default: benchmarks/corpus/
+    rate_limit: Maximum requests per second sent to the wiki. Default: 2
+  """
+  os.makedirs(directory, exist_ok=True)
+  scpscraper.rate_limiter.rate = rate_limit
+
+  numbers = range(scpscraper.SeriesIndex.series_number(min_skip), scpscraper.SeriesIndex.series_number(max_skip - 1) + 1)
+  paths = [scpscraper.SeriesIndex.series_url(number) for number in numbers]
+  paths += [f'/scp-{i:03d}' for i in range(min_skip, max_skip)]
+
+  for path in tqdm(paths, "Recording pages", ncols=150, unit="page", file=sys.stdout):
+    try:
+      body = scpscraper.session.get(path).content
+
+    # Error handling.
+    except Exception as e:
+      # print(f'Failed to record {path}! Error: {e}')
+      continue
+
+    with open(os.path.join(directory, corpus_filename(path)), 'wb') as outfile:
+      outfile.write(body)
+
+if __name__ == '__main__':
+  record(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,203 @@
+"""
+Offline benchmarks for scpscraper. Serves the recorded corpus (or a synthetic one, if nothing has been recorded) from a local stand-in for the wiki and times get_scp(), parse_scp(), scrape_scps() and scrape_scps_html() against it.
+
+Each benchmark runs in its own process, so peak memory use is measured separately. Results are saved as JSON, and can be compared against an earlier run with --compare.
+
+Usage:
+  python -m benchmarks.run [--pages 200] [--latency 0.02] [--error-rate 0] [--workers 8] [--output bench-results.json] [--compare old-results.json]
+"""
+import argparse, functools, json, multiprocessing, os, platform, sys, tempfile, threading, time
+
+from benchmarks.wiki import CORPUS_DIR, StandInWiki, load_corpus, synthetic_corpus
+
+BENCHMARKS = ('get_scp', 'parse_scp[lxml]', 'parse_scp[bs4]', 'scrape_scps', 'scrape_scps_html')
+
+def _percentile(values: list, percent: float) -> float:
+  if not values:
+    return
+  values = sorted(values)
+  return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+def _peak_rss_mb() -> float:
+  try:
+    import resource
+
+  # Not available on Windows.
+  except ImportError:
+    return
+
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux reports KiB, macOS reports bytes.
+  return round(peak / (1 << 20 if sys.platform == 'darwin' else 1 << 10), 1)
+
+class _Recorder:
+  """Collects how long calls to wrapped functions take, from any thread. Calls that raise or return None are counted as failed."""
+  def __init__(self):
+    self.times = {}
+    self.failed = {}
+    self._lock = threading.Lock()
+
+  def wrap(self, module, name: str, key: str) -> None:
+    func = getattr(module, name)
+
+    @functools.wraps(func)
+    def timed(*args, **kwargs):
+      start = time.perf_counter()
+      result = None
+      try:
+        result = func(*args, **kwargs)
+        return result
+      finally:
+        with self._lock:
+          self.times.setdefault(key, []).append(time.perf_counter() - start)
+          if result is None:
+            self.failed[key] = self.failed.get(key, 0) + 1
+
+    setattr(module, name, timed)
+
+def _corpus(args: argparse.Namespace) -> dict:
+  return load_corpus(args.corpus) or synthetic_corpus(args.pages)
+
+def _scp_ids(corpus: dict, pages: int) -> list:
+  ids = sorted(int(path[len('/scp-'):]) for path in corpus if path[len('/scp-'):].isdigit())
+  return ids[:pages]
+
+def _bench(name: str, args: argparse.Namespace, base_url: str) -> dict:
+  """Runs one benchmark in the current process. Returns its raw numbers."""
+  import scpscraper
+  import importlib
+  core = importlib.import_module('scpscraper.scpscraper')
+
+  scpscraper.session.base_url = base_url
+  corpus = _corpus(args)
+  ids = _scp_ids(corpus, args.pages)
+  start_id, stop_id = (ids[0], ids[-1] + 1) if ids else (0, 0)
+  recorder = _Recorder()
+
+  # The scrapers write their output files to the current directory.
+  os.chdir(tempfile.mkdtemp(prefix='scpscraper-bench-'))
+
+  start = time.perf_counter()
+
+  if name == 'get_scp':
+    recorder.wrap(core, 'parse_scp', 'parse')
+    recorder.wrap(core, 'get_scp', 'page')
+    for i in ids:
+      try:
+        core.get_scp(i)
+
+      # Injected errors make get_scp() raise, which the recorder counts.
+      except Exception:
+        pass
+
+  elif name.startswith('parse_scp'):
+    engine = name[len('parse_scp['):-1]
+    recorder.wrap(core, 'parse_scp', 'page')
+    for i in ids:
+      core.parse_scp(corpus[f'/scp-{i:03d}'], f'{i:03d}', engine)
+    recorder.times['parse'] = recorder.times.get('page', [])
+
+  elif name == 'scrape_scps':
+    recorder.wrap(core, 'parse_scp', 'parse')
+    recorder.wrap(core, '_get_scp_or_none', 'page')
+    core.scrape_scps(start_id, stop_id, workers=args.workers, checkpoint_every=0)
+
+  elif name == 'scrape_scps_html':
+    # Pages are split up by lxml and only the page-content div goes through BeautifulSoup, so time both.
+    recorder.wrap(core, '_page_regions', 'parse')
+    recorder.wrap(core, '_get_page_by_number', 'page')
+    core.scrape_scps_html(start_id, stop_id, workers=args.workers, checkpoint_every=0)
+
+  seconds = time.perf_counter() - start
+  failed = recorder.failed.get('page', 0)
+  pages = len(recorder.times.get('page', [])) - failed
+
+  return {
+    'pages': pages,
+    'failed': failed,
+    'seconds': round(seconds, 4),
+    'pages_per_sec': round(pages / seconds, 2) if seconds else None,
+    'latency_p50_ms': _ms(_percentile(recorder.times.get('page', []), 50)),
+    'latency_p99_ms': _ms(_percentile(recorder.times.get('page', []), 99)),
+    'parse_mean_ms': _ms(sum(recorder.times['parse']) / len(recorder.times['parse'])) if recorder.times.get('parse') else None,
+    'parse_p99_ms': _ms(_percentile(recorder.times.get('parse', []), 99)),
+    'peak_rss_mb': _peak_rss_mb(),
+    'errors': scpscraper.metrics.summary()['errors'],
+  }
+
+def _ms(seconds: float) -> float:
+  return None if seconds is None else round(seconds * 1000, 3)
+
+def _child(name: str, args: argparse.Namespace, base_url: str, queue: multiprocessing.Queue) -> None:
+  # Keep progress bars out of the report.
+  sys.stdout = open(os.devnull, 'w')
+  try:
+    queue.put(_bench(name, args, base_url))
+  except Exception as e:
+    queue.put({'error': repr(e)})
+
+def run(args: argparse.Namespace) -> dict:
+  """Runs every selected benchmark against a stand-in wiki and returns the results."""
+  corpus = _corpus(args)
+  ctx = multiprocessing.get_context('spawn')
+  results = {}
+
+  with StandInWiki(corpus, args.latency, args.error_rate, args.seed) as wiki:
+    for name in args.only or BENCHMARKS:
+      queue = ctx.Queue()
+      process = ctx.Process(target=_child, args=(name, args, wiki.url, queue))
+      process.start()
+      results[name] = queue.get()
+      process.join()
+
+    server = {'requests': wiki.requests, 'injected_errors': wiki.errors}
+
+  return {
+    'meta': {
+      'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'corpus': 'recorded' if load_corpus(args.corpus) else 'synthetic',
+      'pages': args.pages,
+      'latency': args.latency,
+      'error_rate': args.error_rate,
+      'workers': args.workers,
+      'server': server,
+    },
+    'results': results,
+  }
+
+def compare(old: dict, new: dict) -> str:
+  """Returns a table of how each benchmark's numbers changed between two runs."""
+  lines = []
+  for name, result in new['results'].items():
+    before = old['results'].get(name, {})
+    for metric, value in result.items():
+      if isinstance(value, (int, float)) and isinstance(before.get(metric), (int, float)) and before[metric]:
+        lines.append(f'{name:<20} {metric:<16} {before[metric]:>12} -> {value:<12} ({value / before[metric]:.2f}x)')
+  return '\n'.join(lines)
+
+def main(argv: list=None) -> None:
+  parser = argparse.ArgumentParser(description='Offline scpscraper benchmarks.')
+  parser.add_argument('--pages', type=int, default=200, help='Number of SCP pages to use. Default: 200')
+  parser.add_argument('--latency', type=float, default=0.02, help='Seconds the stand-in wiki waits before each answer. Default: 0.02')
+  parser.add_argument('--error-rate', type=float, default=0, help='Fraction of requests the stand-in wiki fails with a 503. Default: 0')
+  parser.add_argument('--seed', type=int, default=0, help='Seed for picking which requests fail. Default: 0')
+  parser.add_argument('--workers', type=int, default=8, help='workers passed to scrape_scps() and scrape_scps_html(). Default: 8')
+  parser.add_argument('--corpus', default=CORPUS_DIR, help='Directory of recorded pages (see benchmarks.record). A synthetic corpus is used if it is empty.')
+  parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help='Benchmarks to run. Default: all of them')
+  parser.add_argument('--output', default='bench-results.json', help='JSON file to save the results to. Default: bench-results.json')
+  parser.add_argument('--compare', help='JSON results of an earlier run to compare against.')
+  args = parser.parse_args(argv)
+
+  results = run(args)
+  with open(args.output, 'w') as outfile:
+    json.dump(results, outfile, indent=2)
+  print(json.dumps(results['results'], indent=2))
+
+  if args.compare:
+    with open(args.compare, 'r') as infile:
+      print(compare(json.load(infile), results))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,161 @@
+import gzip, os, random, socketserver, threading, time, urllib.parse
+import http.server
+
+# Where record.py saves pages downloaded from the wiki.
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'corpus')
+
+def corpus_filename(path: str) -> str:
+  """Returns the file a page is stored in inside the corpus (ex. /scp-173 -> scp-173.html)."""
+  return urllib.parse.quote(path.lstrip('/'), safe='-') + '.html'
+
+def load_corpus(directory: str=CORPUS_DIR) -> dict:
+  """Loads recorded pages into a path -> HTML bytes dictionary. Returns an empty dictionary if nothing has been recorded."""
+  pages = {}
+  if not os.path.isdir(directory):
+    return pages
+
+  for name in os.listdir(directory):
+    if name.endswith('.html'):
+      with open(os.path.join(directory, name), 'rb') as infile:
+        pages['/' + urllib.parse.unquote(name[:-len('.html')])] = infile.read()
+
+  return pages
+
+def _synthetic_page(scp_id: int, paragraphs: int, boilerplate: str) -> str:
+  j = f'{scp_id:03d}'
+  object_class = ['Safe', 'Euclid', 'Keter'][scp_id % 3]
+  body = ''.join(f'<p>SCP-{j} paragraph {n}. Testing of SCP-{j} is <em>ongoing</em>; see <a href="/scp-173">SCP-173</a> for the procedure used during incident {j}-{n}.</p>\n' for n in range(paragraphs))
+
+  return f'''<!DOCTYPE html>
+<html><head><title>SCP-{j} - SCP Foundation</title></head><body>
+<div id="side-bar">{boilerplate}</div>
+<div id="main-content">
+<div class="page-rate-widget-box"><span class="rate-points">rating:&nbsp;<span class="number prw54353">+{scp_id * 7 % 900}</span></span></div>
+<div id="page-content">
+<div class="scp-image-block block-right" style="width:300px;"><img src="http://scp-wiki.wdfiles.com/local--files/scp-{j}/image.jpg" style="width:300px;" alt="image.jpg" class="image" />
+<div class="scp-image-caption" style="width:300px;">
+<p>SCP-{j} in containment.</p>
+</div>
+</div>
+<p><strong>Item #:</strong> SCP-{j}</p>
+<p><strong>Object Class:</strong> {object_class}</p>
+<p><strong>Special Containment Procedures:</strong> SCP-{j} is to be kept in a standard containment locker.</p>
+<p>Personnel are not to interact with SCP-{j} without clearance.</p>
+<p><strong>Description:</strong> SCP-{j} is an anomalous object.</p>
+{body}<p><strong>Addendum {j}-1:</strong> Nothing happened.</p>
+</div>
+<div class="page-tags"><span><a href="/system:page-tags/tag/{object_class.lower()}">{object_class.lower()}</a><a href="/system:page-tags/tag/scp">scp</a></span></div>
+<div id="page-info">page revision: {scp_id % 40 + 1}, last edited: <span class="odate time_{1600000000 + scp_id} format_%25e%20%25b%20%25Y%2C%20%25H%3A%25M%7Cagohover">17 Sep 2020</span></div>
+<div id="page-options-bottom"><a id="discuss-button" href="/forum/t-{scp_id}/scp-{j}">Discuss</a></div>
+</div></body></html>'''
+
+def synthetic_corpus(count: int=200, paragraphs: int=25, seed: int=0) -> dict:
+  """
+  Generates a path -> HTML bytes corpus laid out like the wiki's, for when no pages have been recorded.
+
+  Parameters:
+    count: Number of SCP pages to generate, starting at SCP-000. Every 20th one is left unwritten on the series page. Default: 200
+    paragraphs: Extra paragraphs per page, on top of the usual sections. Default: 25
+    seed: Seed for the page sizes. Default: 0
+  """
+  rng = random.Random(seed)
+
+  # Real pages carry a lot of navigation around the article itself.
+  boilerplate = ''.join(f'<div class="menu-item"><a href="/page-{n}">Navigation link {n}</a></div>\n' for n in range(600))
+
+  pages = {}
+  for scp_id in range(count):
+    if scp_id % 20 != 19:
+      pages[f'/scp-{scp_id:03d}'] = _synthetic_page(scp_id, rng.randint(paragraphs // 2, paragraphs * 2), boilerplate).encode('utf-8')
+
+  for number in range(1, (count - 1) // 1000 + 2):
+    items = []
+    for scp_id in range((number - 1) * 1000, min(number * 1000, count)):
+      if f'/scp-{scp_id:03d}' in pages:
+        items.append(f'<li><a href="/scp-{scp_id:03d}">SCP-{scp_id:03d}</a> - Object {scp_id}</li>')
+      else:
+        items.append(f'<li><a class="newpage" href="/scp-{scp_id:03d}">SCP-{scp_id:03d}</a> - [ACCESS DENIED]</li>')
+
+    path = '/scp-series' if number == 1 else f'/scp-series-{number}'
+    pages[path] = f'<html><body><div id="side-bar">{boilerplate}</div><div id="page-content"><ul>{"".join(items)}</ul></div></body></html>'.encode('utf-8')
+
+  return pages
+
+class StandInWiki:
+  """
+  Serves a corpus of pages from a local HTTP server in a background thread, standing in for the wiki. Usable as a context manager.
+
+  Parameters:
+    pages: path -> HTML bytes dictionary to serve. Anything else is a 404.
+    latency: Seconds to wait before answering each request. Default: 0
+    error_rate: Fraction of requests (0 to 1) to answer with a 503 instead. Default: 0
+    seed: Seed for picking which requests fail. Default: 0
+  """
+  def __init__(self, pages: dict, latency: float=0, error_rate: float=0, seed: int=0):
+    wiki = self
+    self.pages = pages
+    self.latency = latency
+    self.error_rate = error_rate
+    self.requests = 0
+    self.errors = 0
+    self._rng = random.Random(seed)
+    self._lock = threading.Lock()
+    self._gzipped = {}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      # Send the headers and body in one write without waiting on Nagle's algorithm, or every keep-alive request stalls on a delayed ACK.
+      wbufsize = -1
+      disable_nagle_algorithm = True
+
+      def do_GET(self):
+        with wiki._lock:
+          wiki.requests += 1
+          failed = wiki._rng.random() < wiki.error_rate
+          if failed:
+            wiki.errors += 1
+
+        if wiki.latency:
+          time.sleep(wiki.latency)
+
+        body = wiki.pages.get(self.path)
+        if failed or body is None:
+          self.send_response(503 if failed else 404)
+          self.send_header('Content-Length', '0')
+          self.end_headers()
+          return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+          body = wiki._gzip(self.path, body)
+          self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, *args):
+        pass
+
+    class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+      daemon_threads = True
+
+    self.server = Server(('127.0.0.1', 0), Handler)
+    self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+    self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+  def _gzip(self, path: str, body: bytes) -> bytes:
+    # Compress each page once, so the server's own CPU time doesn't skew the numbers.
+    with self._lock:
+      if path not in self._gzipped:
+        self._gzipped[path] = gzip.compress(body)
+      return self._gzipped[path]
+
+  def __enter__(self):
+    self._thread.start()
+    return self
+
+  def __exit__(self, *args):
+    self.server.shutdown()
+    self.server.server_close()
@@ -0,0 +1,141 @@
+import collections, hashlib, json, os, tempfile, threading, time
+
+class ResponseCache:
+  """
+  An on-disk cache of HTTP responses, keyed by URL. Thread-safe.
+
+  Least recently used responses are thrown out once the cache grows past `max_bytes`, until it's back down to `low_water` of it. The size and use order of every entry are kept in memory (read from the directory once, when the cache is opened), so storing a response never has to list the directory. Stale responses are revalidated with If-None-Match/If-Modified-Since when the server sent an ETag or Last-Modified header, so unchanged pages cost a 304 instead of a full download.
+
+  Parameters:
+    directory: Where to keep cached responses. Created if it doesn't exist. Default: scp-cache
+    max_bytes: Maximum total size of the cached response bodies. Default: 1 GiB
+    max_age: How long (in seconds) a cached response is used without asking the server. Older ones cost a conditional request (a 304 if the page hasn't changed). None always revalidates. Default: 3600
+    low_water: Fraction of `max_bytes` to evict down to once the cache is full, so a full cache doesn't evict on every response it stores. Default: 0.9
+  """
+  def __init__(self, directory: str='scp-cache', max_bytes: int=1 << 30, max_age: float=3600, low_water: float=0.9):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.max_age = max_age
+    self.low_water = low_water
+    self._lock = threading.Lock()
+
+    os.makedirs(directory, exist_ok=True)
+
+    # Entry path -> body size, least recently used first.
+    self._entries = collections.OrderedDict()
+    for body, stat in sorted(((body, os.stat(body)) for body in self._bodies()), key=lambda item: item[1].st_mtime):
+      self._entries[body[:-len('.body')]] = stat.st_size
+    self._size = sum(self._entries.values())
+
+  def _bodies(self) -> list:
+    return [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.body')]
+
+  def _path(self, url: str) -> str:
+    return os.path.join(self.directory, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+  @staticmethod
+  def _write(path: str, data: bytes) -> None:
+    # Write to a temporary file first so readers never see a half-written entry. Each write gets its own temporary file, so writes of the same entry from different threads can't rename each other's.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path), suffix='.tmp')
+    try:
+      with os.fdopen(fd, 'wb') as outfile:
+        outfile.write(data)
+      os.replace(tmp, path)
+
+    # Error handling.
+    except BaseException:
+      try:
+        os.remove(tmp)
+      except OSError:
+        pass
+      raise
+
+  def get(self, url: str) -> tuple:
+    """Returns `(metadata, body)` for a cached URL, or None if it isn't cached."""
+    path = self._path(url)
+    try:
+      with open(f'{path}.meta', 'r') as infile:
+        meta = json.load(infile)
+      with open(f'{path}.body', 'rb') as infile:
+        body = infile.read()
+
+    # Not cached (or evicted by another thread halfway through).
+    except (OSError, ValueError):
+      return
+
+    # Mark the entry as recently used (on disk too, so the order survives a restart).
+    with self._lock:
+      if path in self._entries:
+        self._entries.move_to_end(path)
+    try:
+      os.utime(f'{path}.body')
+    except OSError:
+      pass
+
+    return meta, body
+
+  def is_fresh(self, meta: dict) -> bool:
+    """Checks whether a cached response can be used without revalidating it."""
+    return self.max_age is not None and time.time() - meta['stored'] < self.max_age
+
+  @staticmethod
+  def validators(meta: dict) -> dict:
+    """Returns the conditional request headers for revalidating a cached response."""
+    headers = {}
+    if meta.get('etag'):
+      headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+      headers['If-Modified-Since'] = meta['last_modified']
+    return headers
+
+  def put(self, url: str, final_url: str, headers, body: bytes) -> None:
+    """Stores a response body along with its validators."""
+    path = self._path(url)
+    meta = {
+      'url': final_url,
+      'etag': headers.get('ETag'),
+      'last_modified': headers.get('Last-Modified'),
+      'content_type': headers.get('Content-Type'),
+      'stored': time.time(),
+    }
+
+    with self._lock:
+      self._size -= self._entries.pop(path, 0)
+
+      self._write(f'{path}.body', body)
+      self._write(f'{path}.meta', json.dumps(meta).encode('utf-8'))
+      self._entries[path] = len(body)
+      self._size += len(body)
+
+      if self._size > self.max_bytes:
+        self._evict()
+
+  def refresh(self, url: str, meta: dict) -> None:
+    """Resets the age of a cached response after the server confirmed it's unchanged."""
+    meta = dict(meta, stored=time.time())
+    with self._lock:
+      self._write(f'{self._path(url)}.meta', json.dumps(meta).encode('utf-8'))
+
+  def _evict(self) -> None:
+    # Must be called with the lock held. Least recently used first.
+    while self._entries and self._size > self.max_bytes * self.low_water:
+      path, size = self._entries.popitem(last=False)
+      self._size -= size
+
+      for name in (f'{path}.body', f'{path}.meta'):
+        try:
+          os.remove(name)
+        except OSError:
+          pass
+
+  def clear(self) -> None:
+    """Removes every cached response."""
+    with self._lock:
+      for body in self._bodies():
+        for path in (body, body[:-len('.body')] + '.meta'):
+          try:
+            os.remove(path)
+          except OSError:
+            pass
+      self._entries.clear()
+      self._size = 0
@@ -0,0 +1,57 @@
+import json, os
+
+class Checkpoint:
+  """
+  Records how far a range scrape got, so it can be resumed after a crash.
+
+  A checkpoint stores the scraped range, the next ID to scrape and the position of every output (and of the list of failed SCPs, and how many hashes a DedupSink had seen) at that point. Resuming rewinds the outputs to those positions, dropping anything written after the checkpoint, and carries on from the next ID.
+
+  Parameters:
+    path: JSON file to keep the checkpoint in.
+  """
+  def __init__(self, path: str):
+    self.path = path
+
+  def load(self) -> dict:
+    """Returns the saved checkpoint, or None if there isn't one."""
+    if not os.path.exists(self.path):
+      return
+
+    with open(self.path, 'r') as infile:
+      return json.load(infile)
+
+  def save(self, min_skip: int, max_skip: int, next_id: int, positions: dict, failed: int=None, dedup: dict=None) -> None:
+    """Saves a checkpoint. Everything for IDs before `next_id` must already be stored at `positions` (see OutputSink.positions()), `failed` is the size of the list of failed SCPs (if there is one) and `dedup` is DedupSink.counts() (if there is one) at that point."""
+    data = {
+      'min_skip': min_skip,
+      'max_skip': max_skip,
+      'next_id': next_id,
+      'positions': positions,
+      'failed': failed,
+      'dedup': dedup,
+    }
+
+    # Write to a temporary file first so a crash mid-save leaves the last checkpoint intact.
+    with open(f'{self.path}.tmp', 'w') as outfile:
+      json.dump(data, outfile)
+    os.replace(f'{self.path}.tmp', self.path)
+
+  def restore(self, min_skip: int, max_skip: int) -> tuple:
+    """
+    Returns `(next_id, positions, failed, dedup)` to resume from, or None if there's no checkpoint. Pass the positions to OutputSink.rewind() to drop anything written after the checkpoint, cut the list of failed SCPs back to `failed` and pass `dedup` to DedupSink.load() (either is None if it wasn't saved).
+
+    Raises ValueError if the checkpoint is for a different range.
+    """
+    data = self.load()
+    if data is None:
+      return
+
+    if (data['min_skip'], data['max_skip']) != (min_skip, max_skip):
+      raise ValueError(f"Checkpoint {self.path} is for SCPs {data['min_skip']} to {data['max_skip'] - 1}, not {min_skip} to {max_skip - 1}!")
+
+    return data['next_id'], data['positions'], data.get('failed'), data.get('dedup')
+
+  def remove(self) -> None:
+    """Deletes the checkpoint once the scrape has finished."""
+    if os.path.exists(self.path):
+      os.remove(self.path)
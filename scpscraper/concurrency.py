@@ -0,0 +1,246 @@
+import collections, email.utils, http.client, multiprocessing, random, socket, sys, threading, time, urllib.error, urllib.parse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Tuple
+
+class RateLimiter:
+  """
+  Caps how many requests per second get sent to each host. Thread-safe.
+
+  Parameters:
+    rate: Maximum requests per second per host. None (default) means no cap.
+  """
+  def __init__(self, rate: float=None):
+    self.rate = rate
+    self._next = {}
+    self._lock = threading.Lock()
+
+  def wait(self, url: str) -> None:
+    """Blocks until another request to the host of `url` is allowed."""
+    host = urllib.parse.urlsplit(url).netloc
+    with self._lock:
+      now = time.monotonic()
+      start = max(now, self._next.get(host, now))
+      if self.rate:
+        self._next[host] = start + 1 / self.rate
+
+    if start > now:
+      time.sleep(start - now)
+
+  def pause(self, url: str, seconds: float) -> None:
+    """Holds back every request to the host of `url` for the next `seconds` seconds (ex. when it asks us to slow down)."""
+    host = urllib.parse.urlsplit(url).netloc
+    with self._lock:
+      now = time.monotonic()
+      self._next[host] = max(self._next.get(host, now), now + seconds)
+
+# Shared by every request the scraper sends.
+rate_limiter = RateLimiter()
+
+class RetryPolicy:
+  """
+  Decides whether to retry a failed request and how long to wait first: exponential backoff with full jitter, or however long the server asks for in a Retry-After header.
+
+  Parameters:
+    retries: Maximum number of retries per request. 0 disables retrying. Default: 3
+    backoff: Base delay in seconds. Retry n waits a random time between 0 and backoff * 2**n. Default: 1
+    max_delay: Longest single wait in seconds, Retry-After included. Default: 60
+    statuses: HTTP status codes worth retrying. Default: (429, 500, 502, 503, 504)
+  """
+  def __init__(self, retries: int=3, backoff: float=1, max_delay: float=60, statuses: tuple=(429, 500, 502, 503, 504)):
+    self.retries = retries
+    self.backoff = backoff
+    self.max_delay = max_delay
+    self.statuses = statuses
+
+  def should_retry(self, attempt: int, status: int=None, error: Exception=None) -> bool:
+    """
+    Returns whether a request that already failed `attempt` times (counting from 0) should be tried again, given the status it got or the error it raised.
+
+    Timeouts, dropped connections and other network errors are retried. DNS lookup failures aren't, since waiting rarely fixes them.
+    """
+    if attempt >= self.retries:
+      return False
+    if error is not None:
+      # HTTPErrors are raised for responses we already decided about (ex. too many redirects).
+      if isinstance(error, (socket.gaierror, urllib.error.HTTPError)):
+        return False
+      return isinstance(error, (OSError, http.client.HTTPException))
+    return status in self.statuses
+
+  @staticmethod
+  def parse_retry_after(value: str) -> float:
+    """Returns the number of seconds a Retry-After header asks for (it can be a number of seconds or an HTTP date), or None if it can't be read."""
+    try:
+      return max(0.0, float(value))
+    except (TypeError, ValueError):
+      pass
+
+    try:
+      return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+
+    # Error handling.
+    except (TypeError, ValueError, IndexError):
+      return
+
+  def delay(self, attempt: int, retry_after: str=None) -> float:
+    """Returns how long to wait before retry number `attempt` (counting from 0)."""
+    if retry_after is not None:
+      seconds = self.parse_retry_after(retry_after)
+      if seconds is not None:
+        return min(self.max_delay, seconds)
+
+    return random.uniform(0, min(self.max_delay, self.backoff * 2 ** attempt))
+
+# Shared by every request the scraper sends.
+retry_policy = RetryPolicy()
+
+class AdaptiveLimiter:
+  """
+  Caps how many requests are in flight at once, and moves the cap to the most the server keeps up with (additive increase, multiplicative decrease). The cap halves when the server throttles us or times out, and goes up by one every time a full cap's worth of requests goes through cleanly. Thread-safe.
+
+  Parameters:
+    maximum: Highest the cap can go, usually the number of workers. None (default) turns the limiter off.
+    minimum: Lowest the cap can go. Default: 1
+  """
+  def __init__(self, maximum: int=None, minimum: int=1):
+    self.minimum = minimum
+    self._cond = threading.Condition()
+    self.reset(maximum)
+
+  def reset(self, maximum: int=None) -> None:
+    """Sets a new maximum (None turns the limiter off) and starts the cap back at it."""
+    with self._cond:
+      self.maximum = maximum
+      self.limit = maximum
+      self.in_flight = 0
+      self._successes = 0
+      self._stale = 0
+      self._cond.notify_all()
+
+  def acquire(self) -> None:
+    """Blocks until there's room for another request under the cap."""
+    with self._cond:
+      if self.maximum is None:
+        return
+      while self.in_flight >= int(self.limit):
+        self._cond.wait()
+      self.in_flight += 1
+
+  def release(self, throttled: bool=False) -> None:
+    """Frees up the room a request took, noting whether the server throttled it (or timed out)."""
+    with self._cond:
+      if self.maximum is None:
+        return
+
+      self.in_flight = max(0, self.in_flight - 1)
+
+      # Requests sent before the last back-off were sent at the old cap, so they don't say anything about the new one.
+      stale = self._stale > 0
+      if stale:
+        self._stale -= 1
+
+      if throttled:
+        if not stale:
+          self.limit = max(self.minimum, self.limit / 2)
+          self._stale = self.in_flight
+        self._successes = 0
+
+      else:
+        self._successes += 1
+        if self._successes >= int(self.limit):
+          self.limit = min(self.maximum, int(self.limit) + 1)
+          self._successes = 0
+
+      self._cond.notify_all()
+
+# Shared by every request the scraper sends. Off until a scraper is run with adaptive=True.
+concurrency_limiter = AdaptiveLimiter()
+
+def imap_ordered(func: Callable, items: Iterable, workers: int=1) -> Iterator[Tuple]:
+  """
+  Runs `func` over `items` on a thread pool, yielding `(item, result)` pairs in the same order as `items`.
+
+  At most `workers * 2` calls are in flight at once, so results never pile up in memory faster than they're consumed.
+
+  Parameters:
+    func: The function to call on each item.
+    items: The items to call it on.
+    workers: Number of threads to use. 1 or less (default) runs everything in the calling thread.
+  """
+  if workers <= 1:
+    for item in items:
+      yield item, func(item)
+    return
+
+  pending = collections.deque()
+  with ThreadPoolExecutor(max_workers=workers) as pool:
+    try:
+      for item in items:
+        pending.append((item, pool.submit(func, item)))
+
+        # Hand back the oldest result once the window is full.
+        if len(pending) >= workers * 2:
+          item, future = pending.popleft()
+          yield item, future.result()
+
+      while pending:
+        item, future = pending.popleft()
+        yield item, future.result()
+
+    # Don't start anything else if the consumer stopped early.
+    finally:
+      for item, future in pending:
+        future.cancel()
+
+def _process_pool(workers: int, start_method: str=None) -> ProcessPoolExecutor:
+  """
+  Creates a process pool whose workers don't start as forks of this process. Forking a process that already runs threads (fetch threads, tqdm's monitor, a session's connections) can leave a worker stuck forever on a lock one of those threads held.
+
+  Internal function, shouldn't need to be called by a user.
+  """
+  # Python 3.6 can't pick how the pool starts its workers.
+  if sys.version_info < (3, 7):
+    return ProcessPoolExecutor(max_workers=workers)
+
+  if start_method is None:
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+  return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method))
+
+def imap_pipeline(fetch: Callable, process: Callable, items: Iterable, fetch_workers: int=1, process_workers: int=1, queue_size: int=None, start_method: str=None) -> Iterator[Tuple]:
+  """
+  Runs a two-stage pipeline over `items`, yielding `(item, process(item, fetch(item)))` pairs in the same order as `items`.
+
+  `fetch` runs on a thread pool (for I/O, like downloading pages) and `process` on a process pool (for CPU-bound work, like parsing them), so the work isn't held back by the GIL. Both stages only run a bounded number of items ahead of the consumer, so memory stays flat no matter how many items there are.
+
+  Parameters:
+    fetch: The function to call on each item in a thread.
+    process: The function to call on each item and its fetch() result in another process. Must be picklable, along with its arguments and results.
+    items: The items to run through the pipeline.
+    fetch_workers: Number of threads running fetch(). Default: 1
+    process_workers: Number of processes running process(). Default: 1
+    queue_size: Maximum number of fetched items waiting on or being processed at once. Default: process_workers * 2
+    start_method: How the process pool starts its workers (see multiprocessing.get_context()). They're never forked from this process by default, since fetch() runs on threads. Default: 'forkserver' where available, otherwise 'spawn'
+  """
+  queue_size = queue_size or process_workers * 2
+  fetched = imap_ordered(fetch, items, fetch_workers)
+  pending = collections.deque()
+
+  with _process_pool(process_workers, start_method) as pool:
+    try:
+      for item, data in fetched:
+        pending.append((item, pool.submit(process, item, data)))
+
+        # Hand back the oldest result once the queue is full.
+        if len(pending) >= queue_size:
+          item, future = pending.popleft()
+          yield item, future.result()
+
+      while pending:
+        item, future = pending.popleft()
+        yield item, future.result()
+
+    # Don't start anything else if the consumer stopped early.
+    finally:
+      fetched.close()
+      for item, future in pending:
+        future.cancel()
@@ -1,4 +1,4 @@
-import os, shutil, sys
+import hashlib, json, os, shutil, sys, tempfile
 
 # Check if user is using Google Colaboratory (and if so, we can do fancier things...)
 try:
@@ -6,6 +6,18 @@ try:
 except:
   pass
 
+# Where copy_to_drive() and copy_from_drive() copy to and from. Point this at any other directory (ex. another mounted drive, or a local backup folder) to use that instead.
+drive_root = '/content/drive/My Drive'
+
+# File (kept in the destination) that remembers what was copied, so unchanged files aren't copied again.
+SYNC_MANIFEST = '.scpscraper-sync.json'
+
+# Files are hashed and copied this many bytes at a time.
+CHUNK_SIZE = 16 << 20
+
+# Suffix of the temporary files copies are written to before being renamed into place. Left-over ones (ex. from an interrupted copy) are never deleted as if they were the user's files.
+TMP_SUFFIX = '.scpscraper-tmp'
+
 # Custom error definitions
 class DriveNotMountedError(Exception):
   pass
@@ -29,46 +41,179 @@ def mount():
   else:
     raise NoColaboratoryVMError("You must be in Google Colaboratory to run any Google Drive related functions!")
 
-def _is_mounted():
-  if os.path.isdir('/content/drive'):
+def _is_mounted(root: str=None):
+  root = drive_root if root is None else root
+
+  if os.path.isdir(root):
     return
-  else:
+  elif root.startswith('/content/drive'):
     raise DriveNotMountedError("You must first mount your Google Drive using scpscraper.gdrive.mount()!")
+  else:
+    raise PathNotExistsError(f"Path {root} does not exist!")
 
-def copy_to_drive(path: str):
+def _hash_file(path: str) -> str:
   """
-  Copies a file or directory to your Google Drive.
+  Returns the SHA-256 of a file's contents.
+
+  Internal function, shouldn't need to be called by a user.
   """
-  _is_mounted()
-  
-  if os.path.exists(path):
-    if os.path.isfile(path):
-      shutil.copyfile(path, f"/content/drive/My Drive/{path}")
+  digest = hashlib.sha256()
 
-    elif os.path.isdir(path):
-      shutil.copytree(path, f"/content/drive/My Drive/{path}")
+  with open(path, 'rb') as infile:
+    for chunk in iter(lambda: infile.read(CHUNK_SIZE), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
 
-    else:
-      raise PathNotRecognizedError(f"Path {path} is not a file or a directory!")
-  
-  else:
-    raise PathNotExistsError(f"Path {path} does not exist!")
+def _replace_with(destination: str, write, stat_from: str=None) -> None:
+  """
+  Calls `write(outfile)` on a new temporary file next to the destination (copying `stat_from`'s permissions and times to it, if given), then renames it into place, so the destination is never left half-written. Every call gets its own temporary file, so it can't collide with a real file or another copy.
 
-def copy_from_drive(path: str):
+  Internal function, shouldn't need to be called by a user.
   """
-  Copies a file or directory to your Google Drive.
+  directory = os.path.dirname(destination) or '.'
+  os.makedirs(directory, exist_ok=True)
+
+  fd, tmp = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(destination)}.', suffix=TMP_SUFFIX)
+  try:
+    with os.fdopen(fd, 'wb') as outfile:
+      write(outfile)
+    if stat_from is not None:
+      shutil.copystat(stat_from, tmp)
+    os.replace(tmp, destination)
+
+  # Error handling.
+  except BaseException:
+    try:
+      os.remove(tmp)
+    except OSError:
+      pass
+    raise
+
+def _copy_file(source: str, destination: str) -> None:
+  """
+  Copies a file in large chunks to a temporary file next to the destination, then renames it into place.
+
+  Internal function, shouldn't need to be called by a user.
   """
-  _is_mounted()
-  
-  if os.path.exists(f"/content/drive/My Drive/{path}"):
-    if os.path.isfile(f"/content/drive/My Drive/{path}"):
-      shutil.copyfile(f"/content/drive/My Drive/{path}", path)
+  def write(outfile):
+    with open(source, 'rb') as infile:
+      shutil.copyfileobj(infile, outfile, CHUNK_SIZE)
 
-    elif os.path.isdir(f"/content/drive/My Drive/{path}"):
-      shutil.copytree(f"/content/drive/My Drive/{path}", path)
+  _replace_with(destination, write, source)
+
+def sync(source: str, destination: str, manifest: str=None, force: bool=False, delete: bool=False) -> dict:
+  """
+  Copies a file or directory to `destination`, skipping every file that hasn't changed since it was last copied.
+
+  A file counts as unchanged if its size and modification time match what the manifest recorded when it was last copied, or (if they don't) its SHA-256 does. Files that changed are copied in large chunks and renamed into place. Returns the number of files copied, skipped and deleted, and the bytes copied.
+
+  Parameters:
+    source: File or directory to copy.
+    destination: Where to copy it to. Directories are created as needed.
+    manifest: JSON file to record what was copied in. Default: SYNC_MANIFEST inside `destination` for directories, or next to it for files
+    force: Set to True to copy every file, even unchanged ones. Default: False
+    delete: Set to True to delete files in `destination` (a directory) that aren't in `source`. Default: False
+  """
+  if not os.path.exists(source):
+    raise PathNotExistsError(f"Path {source} does not exist!")
+
+  if os.path.isfile(source):
+    pairs = [(source, destination)]
+    if manifest is None:
+      manifest = os.path.join(os.path.dirname(destination), SYNC_MANIFEST)
+
+  elif os.path.isdir(source):
+    pairs = []
+    for dirpath, dirnames, filenames in os.walk(source):
+      dirnames.sort()
+      for filename in sorted(filenames):
+        # Left-over temporary files from an interrupted copy aren't worth copying.
+        if filename != SYNC_MANIFEST and not filename.endswith(TMP_SUFFIX):
+          path = os.path.join(dirpath, filename)
+          pairs.append((path, os.path.join(destination, os.path.relpath(path, source))))
+    if manifest is None:
+      manifest = os.path.join(destination, SYNC_MANIFEST)
 
-    else:
-      raise PathNotRecognizedError(f"Path /content/drive/My Drive/{path} is not a file or a directory!")
-  
   else:
-    raise PathNotExistsError(f"Path /content/drive/My Drive/{path} does not exist!")
+    raise PathNotRecognizedError(f"Path {source} is not a file or a directory!")
+
+  try:
+    with open(manifest, 'r') as infile:
+      entries = json.load(infile)
+
+  # Error handling.
+  except (OSError, ValueError):
+    entries = {}
+
+  base = os.path.dirname(manifest) or '.'
+  stats = {'copied': 0, 'skipped': 0, 'deleted': 0, 'bytes': 0}
+
+  for path, target in pairs:
+    key = os.path.relpath(target, base)
+    entry = entries.get(key)
+    stat = os.stat(path)
+
+    # A file whose size changed is copied without comparing hashes. One whose size and modification time match the manifest isn't even hashed.
+    target_size = os.path.getsize(target) if os.path.isfile(target) else None
+    if not force and target_size == stat.st_size:
+      if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        stats['skipped'] += 1
+        continue
+
+      digest = _hash_file(path)
+      if digest == (entry['sha256'] if entry is not None else _hash_file(target)):
+        entries[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+        stats['skipped'] += 1
+        continue
+
+    else:
+      digest = _hash_file(path)
+
+    _copy_file(path, target)
+    entries[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+    stats['copied'] += 1
+    stats['bytes'] += stat.st_size
+
+  if delete and os.path.isdir(source):
+    keep = {target for path, target in pairs}
+    for dirpath, dirnames, filenames in os.walk(destination):
+      for filename in filenames:
+        target = os.path.join(dirpath, filename)
+        if filename != SYNC_MANIFEST and not filename.endswith(TMP_SUFFIX) and target not in keep:
+          os.remove(target)
+          entries.pop(os.path.relpath(target, base), None)
+          stats['deleted'] += 1
+
+  _replace_with(manifest, lambda outfile: outfile.write(json.dumps(entries, indent=2, sort_keys=True).encode('utf-8')))
+
+  return stats
+
+def copy_to_drive(path: str, root: str=None, force: bool=False, delete: bool=False) -> dict:
+  """
+  Copies a file or directory to your Google Drive. Files that haven't changed since they were last copied are skipped (see sync()).
+
+  Parameters:
+    path: File or directory to copy. It's copied to the same path under `root`.
+    root: Directory to copy to. Default: scpscraper.gdrive.drive_root (/content/drive/My Drive)
+    force: Set to True to copy every file, even unchanged ones. Default: False
+    delete: Set to True to delete files in the copy of a directory that aren't in the original anymore. Default: False
+  """
+  root = drive_root if root is None else root
+  _is_mounted(root)
+
+  return sync(path, os.path.join(root, path.lstrip('/')), os.path.join(root, SYNC_MANIFEST), force, delete)
+
+def copy_from_drive(path: str, root: str=None, force: bool=False, delete: bool=False) -> dict:
+  """
+  Copies a file or directory from your Google Drive. Files that haven't changed since they were last copied are skipped (see sync()).
+
+  Parameters:
+    path: File or directory under `root` to copy. It's copied to the same path here.
+    root: Directory to copy from. Default: scpscraper.gdrive.drive_root (/content/drive/My Drive)
+    force: Set to True to copy every file, even unchanged ones. Default: False
+    delete: Set to True to delete files in the copy of a directory that aren't in the original anymore. Default: False
+  """
+  root = drive_root if root is None else root
+  _is_mounted(root)
+
+  return sync(os.path.join(root, path.lstrip('/')), path, None, force, delete)
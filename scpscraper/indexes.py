@@ -0,0 +1,292 @@
+import json, os, re, threading, time, urllib.parse
+from bs4 import BeautifulSoup
+
+from scpscraper.sessions import Session, session
+
+class FetchFailedError(Exception):
+  """Raised by SeriesIndex and TagIndex instead of downloading a page again while its last failed download is still remembered. The original error is its `__cause__`."""
+  pass
+
+class _PageIndex:
+  """
+  Download bookkeeping shared by SeriesIndex and TagIndex. Each page is downloaded by one thread at a time without holding the index-wide lock, so lookups of other pages never wait for it, and failed downloads are remembered for `failure_ttl` seconds.
+
+  Internal class, shouldn't need to be used by a user.
+  """
+  def __init__(self, ttl: float=None, path: str=None, session: Session=None, failure_ttl: float=60):
+    self.ttl = ttl
+    self.path = path
+    self.session = session
+    self.failure_ttl = failure_ttl
+    self._failures = {}
+    self._fetching = {}
+    self._lock = threading.Lock()
+
+  def _is_fresh(self, entry: dict) -> bool:
+    return self.ttl is None or time.time() - entry['fetched'] < self.ttl
+
+  def _cached(self, entries: dict, key, usable) -> dict:
+    # Must be called with the lock held.
+    entry = entries.get(key)
+    if entry is not None and usable(entry) and self._is_fresh(entry):
+      return entry
+
+    # Don't download a page that just failed again. A new error is raised each time, since several threads can be raising it at once.
+    failure = self._failures.get(key)
+    if failure is not None and time.time() - failure[0] < self.failure_ttl:
+      raise FetchFailedError(f'Downloading {key!r} failed {time.time() - failure[0]:.0f} seconds ago: {failure[1]}') from failure[1]
+
+  def _get_or_fetch(self, entries: dict, key, usable, fetch) -> dict:
+    with self._lock:
+      entry = self._cached(entries, key, usable)
+      if entry is not None:
+        return entry
+      fetching = self._fetching.setdefault(key, threading.Lock())
+
+    # Only one thread downloads each page, and lookups of other pages don't wait for it.
+    with fetching:
+      with self._lock:
+        entry = self._cached(entries, key, usable)
+        if entry is not None:
+          return entry
+
+      try:
+        entry = {'fetched': time.time(), **fetch(key)}
+
+      # Error handling.
+      except Exception as e:
+        with self._lock:
+          self._failures[key] = (time.time(), e)
+        raise
+
+      with self._lock:
+        entries[key] = entry
+        self._failures.pop(key, None)
+      return entry
+
+class SeriesIndex(_PageIndex):
+  """
+  An ID -> name index built from the SCP Series pages. Also remembers which IDs the series pages list as not written yet.
+
+  Each series page is only downloaded once per run (or once per `ttl` seconds), no matter how many names get looked up from it. Only lookups waiting on the same series page wait for its download, and a series page that couldn't be downloaded isn't tried again for `failure_ttl` seconds.
+
+  Parameters:
+    ttl: How long (in seconds) a downloaded series page stays valid. None (default) keeps it for the lifetime of the index.
+    path: JSON file to load the index from (if it exists) and save it to with save(). Default: None
+    session: Session to download the series pages with. Default: scpscraper.session
+    failure_ttl: How long (in seconds) lookups raise FetchFailedError after a series page couldn't be downloaded, instead of downloading it again. Default: 60
+  """
+  def __init__(self, ttl: float=None, path: str=None, session: Session=None, failure_ttl: float=60):
+    super().__init__(ttl, path, session, failure_ttl)
+    self._series = {}
+
+    if path is not None and os.path.exists(path):
+      self.load(path)
+
+  @staticmethod
+  def series_number(scp_id: int) -> int:
+    """Returns the number of the series an SCP belongs to (SCP-000 to SCP-999 are series 1, and so on)."""
+    return int(scp_id) // 1000 + 1
+
+  @staticmethod
+  def series_url(number: int) -> str:
+    """Returns the URL of a given series page, relative to the session's base URL."""
+    if number == 1:
+      return '/scp-series'
+    return f'/scp-series-{number}'
+
+  @staticmethod
+  def parse_series(soup: BeautifulSoup) -> dict:
+    """Parses a series page into an ID -> name dictionary."""
+    names = {}
+    content = soup.find('div', id='page-content')
+
+    for li in content.find_all('li'):
+      try:
+        numbers = re.findall('[0-9]+', li.find_next('a')['href'])
+
+      # Skip list elements without a usable link.
+      except (TypeError, KeyError):
+        continue
+
+      if numbers:
+        # The first matching list element wins, same as scanning the page top to bottom.
+        names.setdefault(int(numbers[0]), re.split('-', li.get_text())[-1].strip(' '))
+
+    return names
+
+  @staticmethod
+  def parse_missing(soup: BeautifulSoup) -> set:
+    """Parses a series page into the set of IDs it lists as not written yet (the wiki links those to pages that don't exist)."""
+    seen = set()
+    missing = set()
+    content = soup.find('div', id='page-content')
+
+    for li in content.find_all('li'):
+      try:
+        a = li.find_next('a')
+        numbers = re.findall('[0-9]+', a['href'])
+
+      # Skip list elements without a usable link.
+      except (TypeError, KeyError):
+        continue
+
+      # Only the first matching list element counts, same as parse_series().
+      if numbers and int(numbers[0]) not in seen:
+        seen.add(int(numbers[0]))
+        if 'newpage' in a.get('class', []):
+          missing.add(int(numbers[0]))
+
+    return missing
+
+  def _fetch(self, number: int) -> dict:
+    r = (self.session or session).get(self.series_url(number))
+    soup = BeautifulSoup(r.content, 'lxml')
+    return {'names': self.parse_series(soup), 'missing': self.parse_missing(soup)}
+
+  def _get_entry(self, number: int, key: str) -> dict:
+    # Indexes saved by older versions don't have every key.
+    return self._get_or_fetch(self._series, number, lambda entry: key in entry, self._fetch)
+
+  def get_series(self, number: int) -> dict:
+    """Returns the ID -> name dictionary for a series, downloading the series page if it isn't already indexed."""
+    return self._get_entry(number, 'names')['names']
+
+  def get_missing(self, number: int) -> set:
+    """Returns the IDs a series page lists as not written yet, downloading the series page if it isn't already indexed."""
+    return self._get_entry(number, 'missing')['missing']
+
+  def get(self, scp_id: int) -> str:
+    """Returns the name of an SCP as listed on its series page, or None if it isn't listed."""
+    return self.get_series(self.series_number(scp_id)).get(int(scp_id))
+
+  def exists(self, scp_id: int) -> bool:
+    """Returns False if an SCP's series page lists it as not written yet, otherwise True."""
+    return int(scp_id) not in self.get_missing(self.series_number(scp_id))
+
+  def clear(self) -> None:
+    """Forgets every indexed series page, and every one that failed."""
+    with self._lock:
+      self._series.clear()
+      self._failures.clear()
+
+  def load(self, path: str=None) -> None:
+    """Loads a previously saved index from a JSON file."""
+    with open(path or self.path, 'r') as infile:
+      data = json.load(infile)
+
+    with self._lock:
+      for number, entry in data.items():
+        self._series[int(number)] = {
+          'fetched': entry['fetched'],
+          'names': {int(k): v for k, v in entry['names'].items()}
+        }
+        if 'missing' in entry:
+          self._series[int(number)]['missing'] = set(entry['missing'])
+
+  def save(self, path: str=None) -> None:
+    """Saves the index to a JSON file so later runs can skip the series pages entirely."""
+    path = path or self.path
+
+    with self._lock:
+      data = {str(number): dict(entry) for number, entry in self._series.items()}
+
+    for entry in data.values():
+      if 'missing' in entry:
+        entry['missing'] = sorted(entry['missing'])
+
+    # Write to a temporary file first so an interrupted save can't corrupt the index.
+    with open(f'{path}.tmp', 'w') as outfile:
+      json.dump(data, outfile)
+    os.replace(f'{path}.tmp', path)
+
+# Shared index used by get_scp_name(), get_scp() and scrape_scps().
+series_index = SeriesIndex()
+
+class TagIndex(_PageIndex):
+  """
+  A tag -> IDs index built from the wiki's tag listing pages (ex. /system:page-tags/tag/keter), so scrapers can skip SCPs without the right tags before downloading them.
+
+  Each tag page is only downloaded once per run (or once per `ttl` seconds), no matter how many IDs get checked against it. Only lookups waiting on the same tag page wait for its download, and a tag page that couldn't be downloaded isn't tried again for `failure_ttl` seconds.
+
+  Parameters:
+    ttl: How long (in seconds) a downloaded tag page stays valid. None (default) keeps it for the lifetime of the index.
+    path: JSON file to load the index from (if it exists) and save it to with save(). Default: None
+    session: Session to download the tag pages with. Default: scpscraper.session
+    failure_ttl: How long (in seconds) lookups raise FetchFailedError after a tag page couldn't be downloaded, instead of downloading it again. Default: 60
+  """
+  def __init__(self, ttl: float=None, path: str=None, session: Session=None, failure_ttl: float=60):
+    super().__init__(ttl, path, session, failure_ttl)
+    self._tags = {}
+
+    if path is not None and os.path.exists(path):
+      self.load(path)
+
+  @staticmethod
+  def tag_url(tag: str) -> str:
+    """Returns the URL of a tag's listing page, relative to the session's base URL."""
+    return f'/system:page-tags/tag/{urllib.parse.quote(tag)}'
+
+  @staticmethod
+  def parse_tag_page(soup: BeautifulSoup) -> set:
+    """
+    Parses a tag listing page into the set of SCP numbers it lists. Other pages with the tag (tales, joke SCPs, etc.) are left out.
+
+    Raises ValueError if the page has no list of tagged pages.
+    """
+    listing = soup.find('div', id='tagged-pages-list')
+    if listing is None:
+      raise ValueError('Page has no list of tagged pages!')
+
+    ids = set()
+    for a in listing.find_all('a', href=True):
+      match = re.fullmatch('/scp-([0-9]+)', a['href'])
+      if match:
+        ids.add(int(match.group(1)))
+
+    return ids
+
+  def _fetch(self, tag: str) -> set:
+    r = (self.session or session).get(self.tag_url(tag))
+    return self.parse_tag_page(BeautifulSoup(r.content, 'lxml'))
+
+  def get(self, tag: str) -> set:
+    """Returns the SCP numbers listed under a tag, downloading the tag page if it isn't already indexed."""
+    return self._get_or_fetch(self._tags, tag, lambda entry: True, lambda tag: {'ids': self._fetch(tag)})['ids']
+
+  def candidates(self, tags: list) -> set:
+    """Returns the SCP numbers listed under at least one of the given tags."""
+    ids = set()
+    for tag in tags:
+      ids |= self.get(tag)
+    return ids
+
+  def clear(self) -> None:
+    """Forgets every indexed tag page, and every one that failed."""
+    with self._lock:
+      self._tags.clear()
+      self._failures.clear()
+
+  def load(self, path: str=None) -> None:
+    """Loads a previously saved index from a JSON file."""
+    with open(path or self.path, 'r') as infile:
+      data = json.load(infile)
+
+    with self._lock:
+      for tag, entry in data.items():
+        self._tags[tag] = {'fetched': entry['fetched'], 'ids': set(entry['ids'])}
+
+  def save(self, path: str=None) -> None:
+    """Saves the index to a JSON file so later runs can skip the tag pages entirely."""
+    path = path or self.path
+
+    with self._lock:
+      data = {tag: {'fetched': entry['fetched'], 'ids': sorted(entry['ids'])} for tag, entry in self._tags.items()}
+
+    # Write to a temporary file first so an interrupted save can't corrupt the index.
+    with open(f'{path}.tmp', 'w') as outfile:
+      json.dump(data, outfile)
+    os.replace(f'{path}.tmp', path)
+
+# Shared index used by scrape_scps(), scrape_scps_html() and iter_scps() to skip SCPs without the requested tags.
+tag_index = TagIndex()
@@ -0,0 +1,274 @@
+import re
+import lxml.etree, lxml.html
+from bs4.dammit import UnicodeDammit
+from typing import Union
+
+# XPath expressions for everything parse_scp() looks at, compiled once.
+_has_class = 'contains(concat(" ", normalize-space(@class), " "), " {} ")'
+_find_rating = lxml.etree.XPath(f'(//span[{_has_class.format("rate-points")}])[1]')
+_find_content = lxml.etree.XPath('(//div[@id="page-content"])[1]')
+_find_image_block = lxml.etree.XPath(f'(.//div[{_has_class.format("scp-image-block")}])[1]')
+_find_paragraphs = lxml.etree.XPath('.//p')
+_find_page_info = lxml.etree.XPath('(//div[@id="page-info"])[1]')
+_find_span = lxml.etree.XPath('(.//span)[1]')
+_find_tags = lxml.etree.XPath(f'(//div[{_has_class.format("page-tags")}])[1]')
+_find_discuss = lxml.etree.XPath('(//a[@id="discuss-button"])[1]')
+
+class ParseError(ValueError):
+  """Raised by parse_scp() (with either engine) when a page isn't laid out like an SCP page."""
+  pass
+
+def _first(xpath: lxml.etree.XPath, node) -> lxml.html.HtmlElement:
+  found = xpath(node)
+  return found[0] if found else None
+
+def _is_comment(node) -> bool:
+  return isinstance(node, (lxml.etree._Comment, lxml.etree._ProcessingInstruction))
+
+def _contents(node) -> list:
+  """Same as BeautifulSoup's Tag.contents: child elements and the text between them."""
+  contents = [node.text] if node.text else []
+  for child in node:
+    contents.append(child.text or '' if _is_comment(child) else child)
+    if child.tail:
+      contents.append(child.tail)
+  return contents
+
+def _child(node, index: int):
+  """Same as BeautifulSoup's `node.contents[index]`, except that text and missing nodes (which have no contents) give None."""
+  if node is None or isinstance(node, str):
+    return
+  return _contents(node)[index]
+
+def _string(node) -> str:
+  """Same as BeautifulSoup's .string: the only string inside a node, or None."""
+  if isinstance(node, str):
+    return node
+
+  contents = _contents(node)
+  if len(contents) != 1:
+    return
+  return _string(contents[0])
+
+def _strings(node) -> list:
+  """Every string inside an element, in document order, skipping comments."""
+  strings = [node.text] if node.text else []
+  for child in node:
+    if not _is_comment(child):
+      strings.extend(_strings(child))
+    if child.tail:
+      strings.append(child.tail)
+  return strings
+
+def _get_text(node, strip: bool=False) -> str:
+  """Same as BeautifulSoup's get_text()."""
+  if strip:
+    return ''.join(s.strip() for s in _strings(node) if s.strip())
+  return ''.join(_strings(node))
+
+def _attr(node, name: str) -> str:
+  """Same as BeautifulSoup's tag[name]."""
+  # Indexing text with a string raises a TypeError, same as it does for a NavigableString.
+  if isinstance(node, str):
+    return node[name]
+  if name not in node.attrib:
+    raise KeyError(name)
+  return node.attrib[name]
+
+def _first_node(node):
+  """The first child of an element (text or element), or None if it's empty."""
+  if node.text:
+    return node.text
+  if len(node):
+    return node[0]
+
+def document(html: Union[bytes, str]) -> lxml.html.HtmlElement:
+  """Parses a page's HTML into an lxml document."""
+  return lxml.html.document_fromstring(_decode(html))
+
+def _decode(html: Union[bytes, str]) -> str:
+  if isinstance(html, bytes):
+    try:
+      return html.decode('utf-8')
+
+    # Not UTF-8, so let BeautifulSoup's encoding detection figure it out.
+    except UnicodeDecodeError:
+      return UnicodeDammit(html, is_html=True).unicode_markup
+  return html
+
+def _has_class_name(element, name: str) -> bool:
+  return name in (element.get('class') or '').split()
+
+def page_regions(html: Union[bytes, str], chunk_size: int=1 << 14) -> tuple:
+  """
+  Pulls just the `page-content` div and the page's tags out of a page, without building a tree of the whole page. The page is fed to lxml's incremental parser a chunk at a time, everything outside those two regions is thrown away as soon as it's been parsed, and parsing stops as soon as both have been found.
+
+  Returns `(content, tags)`, where `content` is the page-content div's HTML and `tags` is the same list of tags parse_scp() finds. Either is None if the page doesn't have it.
+  """
+  html = _decode(html)
+  parser = lxml.etree.HTMLPullParser(events=('start', 'end'))
+
+  content = tags_block = None
+  keeping = None
+  depth = 0
+
+  for start in range(0, len(html) or 1, chunk_size):
+    parser.feed(html[start:start + chunk_size])
+
+    for event, element in parser.read_events():
+      if event == 'start':
+        # Start keeping the first page-content div and page-tags div we come across.
+        if keeping is None:
+          if content is None and element.tag == 'div' and element.get('id') == 'page-content':
+            keeping = element
+          elif tags_block is None and element.tag == 'div' and _has_class_name(element, 'page-tags'):
+            keeping = element
+        if keeping is not None:
+          depth += 1
+        continue
+
+      if keeping is not None:
+        depth -= 1
+        if depth == 0:
+          if keeping.get('id') == 'page-content' and content is None:
+            content = keeping
+          else:
+            tags_block = keeping
+          keeping = None
+
+      # Anything else can go as soon as it's parsed (the regions themselves are still referenced, so they stay).
+      else:
+        element.clear()
+
+    if content is not None and tags_block is not None:
+      break
+
+  tags = None
+  if tags_block is not None:
+    tags_list = _first(_find_span, tags_block)
+    if tags_list is not None:
+      tags = [_string(tag) for tag in _contents(tags_list) if _string(tag) != '\n']
+
+  if content is not None:
+    content = lxml.html.tostring(content, encoding='unicode', with_tail=False)
+
+  return content, tags
+
+def parse_scp(html: Union[bytes, str], scp_id: Union[str, int], fields: list=None) -> dict:
+  """
+  Same as scpscraper.parse_scp(), but parses the page with lxml and XPath instead of BeautifulSoup. Returns a dictionary of the same shape.
+  """
+  soup = document(html)
+
+  parsed = {'id': scp_id}
+
+  # Get rating.
+  if fields is None or 'rating' in fields:
+    number = _child(_first(_find_rating, soup), 1)
+
+    # Pages without a rating (or with it laid out differently) count as 0.
+    if number is None or isinstance(number, str):
+      rating = 0
+    else:
+      rating = _child(number, 0)
+      if not isinstance(rating, str):
+        raise ParseError(f"SCP-{scp_id}'s rating isn't a number!")
+      rating = rating.replace('+', '')
+
+    parsed['rating'] = int(rating)
+
+  # Get page-content block.
+  content = _first(_find_content, soup)
+  if content is None and (fields is None or 'image' in fields or 'content' in fields):
+    raise ParseError(f'The page for SCP-{scp_id} has no page-content div!')
+
+  # Get main image (if it exists).
+  if fields is None or 'image' in fields:
+    image_block = _first(_find_image_block, content)
+    image = _child(image_block, 0)
+
+    if isinstance(image, str):
+      raise ParseError(f"SCP-{scp_id}'s image block doesn't start with an image!")
+    main_image = image.get('src') if image is not None else None
+
+    # Get image caption
+    image_caption = _child(_child(_child(image_block, 2), 1), 0)
+    if image_caption is not None and not isinstance(image_caption, str):
+      image_caption = lxml.html.tostring(image_caption, encoding='unicode', with_tail=False)
+
+    parsed['image'] = {
+      'src': main_image,
+      'caption': image_caption
+    }
+
+  # Get main content
+  if fields is None or 'content' in fields:
+    # Initial variable definitions.
+    mapping = {}
+    key = None
+
+    # Find all the paragraph elements.
+    for item in _find_paragraphs(content):
+      # Grab the paragraph element's first child.
+      first_child = _first_node(item)
+
+      # Use bold portions as keys/identifiers for their sections.
+      if not isinstance(first_child, str) and first_child is not None and first_child.tag == 'strong':
+        key = _get_text(first_child).rstrip(': ')
+
+        # The section's text has to come right after the bold portion.
+        if first_child.tail:
+          value = first_child.tail.strip(': ')
+        elif first_child.getnext() is not None:
+          raise ParseError(f"SCP-{scp_id}'s {key!r} section doesn't start with text!")
+
+        # A bold portion with nothing after it leaves the page without sections, same as the bs4 engine.
+        else:
+          mapping = None
+          break
+
+      else:
+        # Add subsequent paragraphs to the same section.
+        if key is not None:
+          value = f'{mapping[key]}\n{_get_text(item, strip=True)}'
+
+        # Don't if there's no section to add them to.
+        else:
+          value = None
+
+      # Put that all into the value for the key.
+      mapping[key] = value
+
+    # Remove the sections that didn't have keys.
+    if mapping is not None:
+      mapping.pop(None, None)
+
+    parsed['content'] = mapping
+
+  # Get page info.
+  if fields is None or 'revision' in fields or 'last_edited' in fields:
+    page_info = _first(_find_page_info, soup)
+    revision = re.findall(r'\d+', page_info.text)[0]
+    last_updated = _first(_find_span, page_info).get('class').split()[1].replace('time_', '')
+
+    parsed['revision'] = int(revision)
+    parsed['last_edited'] = int(last_updated)
+
+  # Get tags.
+  if fields is None or 'tags' in fields:
+    tags_list = _first(_find_span, _first(_find_tags, soup))
+    tags = [_string(tag) for tag in _contents(tags_list) if _string(tag) != '\n']
+
+    parsed['tags'] = tags
+
+  # Get link to the discussion page.
+  if fields is None or 'discussion' in fields:
+    discussion_link = 'http://www.scpwiki.com' + _attr(_first(_find_discuss, soup), 'href')
+
+    parsed['discussion'] = discussion_link
+
+  # Only hand back what was asked for.
+  if fields is not None:
+    parsed = {key: value for key, value in parsed.items() if key == 'id' or key in fields}
+
+  return parsed
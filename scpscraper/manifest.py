@@ -0,0 +1,116 @@
+import copy, json, os, threading
+
+class Manifest:
+  """
+  Remembers the revision, last edit time and parsed record of every scraped SCP, so incremental runs only re-parse pages that changed. Thread-safe.
+
+  The manifest is a JSON Lines log with one SCP per line. save() only appends the SCPs updated since the last save, so checkpointing a long run doesn't rewrite every record each time, and close() compacts the log down to one line per SCP.
+
+  Parameters:
+    path: JSON Lines file to load the manifest from (if it exists) and save it to. Manifests saved as a single JSON object by older versions are loaded too.
+  """
+  def __init__(self, path: str):
+    self.path = path
+    self._entries = {}
+    self._pending = set()
+    self._lines = 0
+    self._legacy = False
+    self._lock = threading.Lock()
+    self.reused = 0
+    self.updated = 0
+
+    if os.path.exists(path):
+      self._load(path)
+
+  def _load(self, path: str) -> None:
+    with open(path, 'r') as infile:
+      for line in infile:
+        try:
+          data = json.loads(line)
+          if not isinstance(data, dict):
+            raise TypeError('Manifest lines must be JSON objects!')
+
+          # Older versions saved the whole manifest as one ID -> entry object.
+          if 'id' not in data and 'revision' not in data:
+            entries = {int(k): {'revision': v['revision'], 'last_edited': v['last_edited'], 'record': v['record']} for k, v in data.items()}
+            self._entries.update(entries)
+            self._legacy = True
+            continue
+
+          self._entries[int(data['id'])] = {'revision': data['revision'], 'last_edited': data['last_edited'], 'record': data['record']}
+          self._lines += 1
+
+        # A run that crashed mid-save can leave half a line at the end, and hand-edited lines can be missing keys. Either way, skip the line.
+        except (KeyError, ValueError, TypeError):
+          continue
+
+  def get(self, scp_id: int, revision: int) -> dict:
+    """Returns a copy of the stored record for an SCP if it was stored at the given revision, otherwise None."""
+    with self._lock:
+      entry = self._entries.get(int(scp_id))
+      if entry is None or entry['revision'] != revision:
+        return
+      self.reused += 1
+      return copy.deepcopy(entry['record'])
+
+  def update(self, scp_id: int, record: dict) -> None:
+    """Stores a freshly parsed record."""
+    entry = {
+      'revision': record['revision'],
+      'last_edited': record['last_edited'],
+      'record': copy.deepcopy(record),
+    }
+    with self._lock:
+      self._entries[int(scp_id)] = entry
+      self._pending.add(int(scp_id))
+      self.updated += 1
+
+  def __contains__(self, scp_id: int) -> bool:
+    with self._lock:
+      return int(scp_id) in self._entries
+
+  @staticmethod
+  def _line(scp_id: int, entry: dict) -> str:
+    return json.dumps({'id': scp_id, **entry}) + '\n'
+
+  def save(self, path: str=None) -> None:
+    """Appends the SCPs updated since the last save to the manifest. Saving to a different path writes the whole manifest there instead."""
+    if path is not None and path != self.path:
+      with self._lock:
+        self._write(path)
+      return
+
+    with self._lock:
+      lines = [self._line(k, self._entries[k]) for k in sorted(self._pending)]
+      self._pending.clear()
+
+      # A crash mid-save can leave half a line, so start on a fresh line after one.
+      if lines and os.path.exists(self.path) and os.path.getsize(self.path):
+        with open(self.path, 'rb') as infile:
+          infile.seek(-1, os.SEEK_END)
+          if infile.read(1) != b'\n':
+            lines.insert(0, '\n')
+
+      with open(self.path, 'a') as outfile:
+        outfile.writelines(lines)
+      self._lines += len(lines)
+
+  def _write(self, path: str) -> None:
+    # Write to a temporary file first so an interrupted save can't corrupt the manifest.
+    with open(f'{path}.tmp', 'w') as outfile:
+      outfile.writelines(self._line(k, v) for k, v in sorted(self._entries.items()))
+    os.replace(f'{path}.tmp', path)
+
+  def compact(self) -> None:
+    """Rewrites the manifest with a single line per SCP, dropping the older lines of SCPs updated since."""
+    with self._lock:
+      self._pending.clear()
+      self._write(self.path)
+      self._lines = len(self._entries)
+      self._legacy = False
+
+  def close(self) -> None:
+    """Saves the manifest, compacting it if any SCP has more than one line (or it was saved by an older version)."""
+    self.save()
+    if self._legacy or self._lines > len(self._entries):
+      self.compact()
@@ -0,0 +1,196 @@
+import http.client, json, os, socket, threading, time, urllib.error
+from contextlib import contextmanager
+from typing import Callable, Union
+
+# Upper bounds (in seconds) of the timing histogram buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def error_class(error: BaseException) -> str:
+  """
+  Sorts an exception into a coarse class to count it under: 'http_<status>' (ex. http_429 when throttled), 'timeout', 'connection' for network errors, 'io' for other OS errors (ex. a full disk while writing output), or the exception's type name for anything else (ex. AttributeError for a page that didn't parse).
+  """
+  if isinstance(error, urllib.error.HTTPError):
+    return f'http_{error.code}'
+  if isinstance(error, (socket.timeout, TimeoutError)):
+    return 'timeout'
+  if isinstance(error, (urllib.error.URLError, http.client.HTTPException, ConnectionError, socket.gaierror, socket.herror)):
+    return 'connection'
+  if isinstance(error, OSError):
+    return 'io'
+  return type(error).__name__
+
+class Metrics:
+  """
+  Counts errors by stage and class, times each stage (fetch, parse, name, write) and counts events, all thread-safe. Can be exported as a JSON summary or a Prometheus text file.
+
+  Attributes:
+    prometheus_file: Path to rewrite a Prometheus text file at (ex. for node_exporter's textfile collector) every `prometheus_interval` seconds while there's activity. None (default) doesn't write one.
+    prometheus_interval: Seconds between rewrites of prometheus_file. Default: 15
+  """
+  def __init__(self):
+    self.prometheus_file = None
+    self.prometheus_interval = 15
+    self._hooks = []
+    self._lock = threading.Lock()
+    self.reset()
+
+  def reset(self) -> None:
+    """Forgets everything counted and timed so far."""
+    with self._lock:
+      self.started = time.time()
+      self._counters = {}
+      self._errors = {}
+      self._timings = {}
+      self._last_export = 0
+
+  def add_trace_hook(self, hook: Callable) -> None:
+    """
+    Calls `hook(scp_id, stage, seconds, error)` every time a stage finishes for an SCP. `error` is the error class (see error_class()) or None. Hooks are called from whichever thread or process did the work, so they need to be quick and thread-safe.
+    """
+    self._hooks.append(hook)
+
+  def remove_trace_hook(self, hook: Callable) -> None:
+    """Stops calling a hook added with add_trace_hook()."""
+    self._hooks.remove(hook)
+
+  def increment(self, name: str, value: int=1) -> None:
+    """Adds to an event counter (ex. manifest_reused)."""
+    with self._lock:
+      self._counters[name] = self._counters.get(name, 0) + value
+    self._maybe_export()
+
+  def observe(self, stage: str, seconds: float, scp_id: int=None, error: Union[BaseException, str]=None) -> None:
+    """Records how long a stage took for an SCP and whether it failed."""
+    if isinstance(error, BaseException):
+      error = error_class(error)
+
+    with self._lock:
+      timing = self._timings.setdefault(stage, {'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0})
+      for n, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+          timing['buckets'][n] += 1
+          break
+      timing['count'] += 1
+      timing['sum'] += seconds
+
+      if error is not None:
+        key = (stage, error)
+        self._errors[key] = self._errors.get(key, 0) + 1
+
+    for hook in self._hooks:
+      hook(scp_id, stage, seconds, error)
+    self._maybe_export()
+
+  @contextmanager
+  def timer(self, stage: str, scp_id: int=None):
+    """Context manager that times a stage, counting it as failed (and re-raising) if an exception escapes."""
+    start = time.perf_counter()
+    try:
+      yield
+
+    except Exception as e:
+      self.observe(stage, time.perf_counter() - start, scp_id, e)
+      raise
+
+    self.observe(stage, time.perf_counter() - start, scp_id)
+
+  @staticmethod
+  def _quantile(timing: dict, q: float) -> float:
+    # Upper bound of the bucket the quantile falls in.
+    target = q * timing['count']
+    seen = 0
+    for bound, count in zip(BUCKETS, timing['buckets']):
+      seen += count
+      if seen >= target:
+        return bound
+    return float('inf')
+
+  def summary(self) -> dict:
+    """Returns everything counted and timed so far as a dictionary."""
+    with self._lock:
+      errors = {}
+      for (stage, name), count in sorted(self._errors.items()):
+        errors.setdefault(stage, {})[name] = count
+
+      timings = {}
+      for stage, timing in sorted(self._timings.items()):
+        timings[stage] = {
+          'count': timing['count'],
+          'sum': round(timing['sum'], 6),
+          'mean': round(timing['sum'] / timing['count'], 6) if timing['count'] else None,
+          'p50_le': self._quantile(timing, 0.5),
+          'p99_le': self._quantile(timing, 0.99),
+          'buckets': dict(zip([str(bound) for bound in BUCKETS], timing['buckets'])),
+        }
+
+      return {
+        'seconds': round(time.time() - self.started, 3),
+        'counters': dict(sorted(self._counters.items())),
+        'errors': errors,
+        'timings': timings,
+      }
+
+  def save(self, path: str) -> None:
+    """Saves summary() to a JSON file."""
+    _write_atomic(path, json.dumps(self.summary(), indent=2))
+
+  def prometheus(self) -> str:
+    """Returns everything counted and timed so far in the Prometheus text format."""
+    with self._lock:
+      lines = [
+        '# HELP scpscraper_stage_seconds Time spent in each stage of scraping an SCP.',
+        '# TYPE scpscraper_stage_seconds histogram',
+      ]
+      for stage, timing in sorted(self._timings.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS, timing['buckets']):
+          cumulative += count
+          lines.append(f'scpscraper_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'scpscraper_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {timing["count"]}')
+        lines.append(f'scpscraper_stage_seconds_sum{{stage="{stage}"}} {timing["sum"]}')
+        lines.append(f'scpscraper_stage_seconds_count{{stage="{stage}"}} {timing["count"]}')
+
+      lines += [
+        '# HELP scpscraper_errors_total Failures in each stage, by error class.',
+        '# TYPE scpscraper_errors_total counter',
+      ]
+      for (stage, name), count in sorted(self._errors.items()):
+        lines.append(f'scpscraper_errors_total{{stage="{stage}",class="{name}"}} {count}')
+
+      lines += [
+        '# HELP scpscraper_events_total Events counted while scraping.',
+        '# TYPE scpscraper_events_total counter',
+      ]
+      for name, count in sorted(self._counters.items()):
+        lines.append(f'scpscraper_events_total{{event="{name}"}} {count}')
+
+    return '\n'.join(lines) + '\n'
+
+  def write_prometheus(self, path: str=None) -> None:
+    """Writes prometheus() to a file (prometheus_file by default), replacing it in one go so scrapers never see half a file."""
+    path = path or self.prometheus_file
+    with self._lock:
+      self._last_export = time.time()
+    _write_atomic(path, self.prometheus())
+
+  def _maybe_export(self) -> None:
+    if self.prometheus_file is None:
+      return
+
+    with self._lock:
+      due = time.time() - self._last_export >= self.prometheus_interval
+      if due:
+        self._last_export = time.time()
+
+    if due:
+      _write_atomic(self.prometheus_file, self.prometheus())
+
+def _write_atomic(path: str, text: str) -> None:
+  # Write to a temporary file first so readers never see a partial file.
+  tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+  with open(tmp, 'w') as outfile:
+    outfile.write(text)
+  os.replace(tmp, path)
+
+# Shared metrics every scraper reports to.
+metrics = Metrics()
@@ -0,0 +1,98 @@
+import contextlib, json, sqlite3, time
+
+class WorkQueue:
+  """
+  A queue of SCP ID ranges kept in a SQLite database, so several scrapers (on one machine, or on many sharing a filesystem with working file locks) can split a scrape between them.
+
+  Workers claim one range at a time with a lease. A range whose lease runs out without being finished (ex. its worker crashed) goes back to the queue for someone else to claim.
+
+  Parameters:
+    path: SQLite database file. Created if it doesn't exist.
+    lease: Seconds a claimed range stays reserved for its worker. Default: 600
+  """
+  def __init__(self, path: str, lease: float=600):
+    self.path = path
+    self.lease = lease
+
+    with self._connect() as db:
+      db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+      db.execute('CREATE TABLE IF NOT EXISTS ranges (start INTEGER PRIMARY KEY, stop INTEGER, state TEXT, owner TEXT, lease_until REAL, attempts INTEGER)')
+
+  @contextlib.contextmanager
+  def _connect(self) -> sqlite3.Connection:
+    # A connection used with `with` only commits (or rolls back) at the end, so it has to be closed separately.
+    with contextlib.closing(sqlite3.connect(self.path, timeout=60)) as db:
+      with db:
+        yield db
+
+  def create(self, min_skip: int, max_skip: int, range_size: int=100, tags: list=[]) -> None:
+    """
+    Splits SCPs min_skip to max_skip - 1 into ranges of `range_size` and queues them. Does nothing if the queue was already created with the same settings, so every worker can safely call it.
+
+    Raises ValueError if the queue was created with different settings.
+
+    Parameters:
+      min_skip: The SCP number to start at.
+      max_skip: The SCP number to end at plus one.
+      range_size: Number of SCPs per range. Default: 100
+      tags: The list of tags to grab from, shared by every worker and the merge. An empty list (default) matches all tags.
+    """
+    settings = json.dumps({'min_skip': min_skip, 'max_skip': max_skip, 'range_size': range_size, 'tags': list(tags)})
+
+    with self._connect() as db:
+      db.execute('BEGIN IMMEDIATE')
+      row = db.execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()
+
+      if row is not None:
+        if row[0] != settings:
+          raise ValueError(f'Queue {self.path} was created with different settings ({row[0]})!')
+        return
+
+      db.execute("INSERT INTO meta VALUES ('settings', ?)", (settings,))
+      db.executemany("INSERT INTO ranges VALUES (?, ?, 'pending', NULL, 0, 0)", [(start, min(start + range_size, max_skip)) for start in range(min_skip, max_skip, range_size)])
+
+  @property
+  def settings(self) -> dict:
+    """The settings the queue was created with (see create())."""
+    with self._connect() as db:
+      row = db.execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()
+
+    if row is None:
+      raise ValueError(f'Queue {self.path} has not been created yet!')
+    return json.loads(row[0])
+
+  def claim(self, owner: str) -> tuple:
+    """Claims the next unfinished range that isn't leased to anyone else. Returns `(start, stop)`, or None if there's nothing left to claim."""
+    now = time.time()
+
+    with self._connect() as db:
+      db.execute('BEGIN IMMEDIATE')
+      row = db.execute("SELECT start, stop FROM ranges WHERE state = 'pending' OR (state = 'claimed' AND lease_until < ?) ORDER BY start LIMIT 1", (now,)).fetchone()
+      if row is None:
+        return
+
+      db.execute("UPDATE ranges SET state = 'claimed', owner = ?, lease_until = ?, attempts = attempts + 1 WHERE start = ?", (owner, now + self.lease, row[0]))
+      return row
+
+  def renew(self, start: int, owner: str) -> bool:
+    """Extends the lease on a claimed range. Returns False if the range isn't leased to `owner` anymore."""
+    with self._connect() as db:
+      cursor = db.execute("UPDATE ranges SET lease_until = ? WHERE start = ? AND owner = ? AND state = 'claimed'", (time.time() + self.lease, start, owner))
+      return cursor.rowcount == 1
+
+  def complete(self, start: int, owner: str) -> bool:
+    """Marks a claimed range as finished. Returns False (and changes nothing) if the range was given to someone else in the meantime."""
+    with self._connect() as db:
+      cursor = db.execute("UPDATE ranges SET state = 'done' WHERE start = ? AND owner = ? AND state = 'claimed'", (start, owner))
+      return cursor.rowcount == 1
+
+  def ranges(self) -> list:
+    """Returns every range as a dictionary (start, stop, state, owner, attempts), in ID order."""
+    with self._connect() as db:
+      rows = db.execute('SELECT start, stop, state, owner, attempts FROM ranges ORDER BY start').fetchall()
+    return [dict(zip(('start', 'stop', 'state', 'owner', 'attempts'), row)) for row in rows]
+
+  def done(self) -> bool:
+    """Returns whether every range has been finished."""
+    with self._connect() as db:
+      return db.execute("SELECT COUNT(*) FROM ranges WHERE state != 'done'").fetchone()[0] == 0
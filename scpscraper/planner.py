@@ -0,0 +1,135 @@
+import os
+from typing import Iterable, Iterator
+
+from scpscraper.indexes import series_index, tag_index
+from scpscraper.metrics import metrics
+
+class ScrapePlan:
+  """
+  The IDs a bulk scrape is going to download, after dropping the ones that can be ruled out up front. Iterating over a plan yields its IDs in order.
+
+  Attributes:
+    ids: The IDs to download, in order.
+    skipped_missing: Number of IDs dropped because their series page lists them as not written yet.
+    skipped_tags: Number of IDs dropped because the tag pages don't list them under any of the requested tags.
+    unchecked_missing: Number of IDs kept without checking whether they're written, because their series page couldn't be grabbed.
+    unchecked_tags: Number of IDs kept without checking their tags, because the tag pages couldn't be grabbed.
+    failed_series: Numbers of the series pages that couldn't be grabbed.
+  """
+  def __init__(self, ids: list, skipped_missing: int=0, skipped_tags: int=0, unchecked_missing: int=0, unchecked_tags: int=0, failed_series: list=None):
+    self.ids = ids
+    self.skipped_missing = skipped_missing
+    self.skipped_tags = skipped_tags
+    self.unchecked_missing = unchecked_missing
+    self.unchecked_tags = unchecked_tags
+    self.failed_series = failed_series or []
+
+  @property
+  def skipped(self) -> int:
+    """Total number of downloads the plan saves."""
+    return self.skipped_missing + self.skipped_tags
+
+  def __iter__(self) -> Iterator[int]:
+    return iter(self.ids)
+
+  def __len__(self) -> int:
+    return len(self.ids)
+
+  @property
+  def unchecked(self) -> int:
+    """Number of IDs kept only because the page that could rule them out couldn't be grabbed."""
+    return self.unchecked_missing + self.unchecked_tags
+
+  def __repr__(self) -> str:
+    text = f'ScrapePlan({len(self.ids)} to fetch, {self.skipped_missing} not written yet, {self.skipped_tags} without the tags'
+    if self.unchecked:
+      text += f', {self.unchecked} unchecked'
+    return text + ')'
+
+def _tag_candidates(tags: list, tag_cache: str=None) -> set:
+  """Returns the IDs listed under at least one of the tags, or None if the tag pages couldn't be grabbed. Internal function, shouldn't need to be called by a user."""
+  # Load the tag index from disk, if we have one.
+  if tag_cache is not None and os.path.exists(tag_cache):
+    tag_index.load(tag_cache)
+
+  try:
+    with metrics.timer('plan'):
+      candidates = tag_index.candidates(tags)
+
+  # Error handling.
+  except Exception as e:
+    # print(f'Failed to grab the tag pages! Error: {e}')
+    return
+
+  # Save the tag index for next time.
+  if tag_cache is not None:
+    tag_index.save(tag_cache)
+
+  return candidates
+
+def _missing(number: int) -> set:
+  """Returns the IDs a series page lists as not written yet, or None if it couldn't be grabbed. Internal function, shouldn't need to be called by a user."""
+  try:
+    with metrics.timer('plan'):
+      return series_index.get_missing(number)
+
+  # Error handling.
+  except Exception as e:
+    # print(f'Failed to grab series {number}! Error: {e}')
+    return
+
+def plan_scps(ids: Iterable[int], tags: list=[], tag_cache: str=None, skip_missing: bool=True) -> ScrapePlan:
+  """
+  Works out which SCPs actually need downloading before any of them are, using the series pages and (if tags are given) the wiki's tag pages.
+
+  IDs whose series page lists them as not written yet are dropped, and so are IDs the tag pages don't list under any of the tags. IDs are kept whenever the page that would rule them out can't be grabbed, so nothing that might exist is skipped. The plan counts those IDs as unchecked, and lists the series pages that failed. The scrapers still check every downloaded page for blank pages and tags.
+
+  Parameters:
+    ids: The SCP numbers to plan for (ex. range(0, 6000)).
+    tags: The list of tags to grab from. An empty list (default) matches all tags.
+    tag_cache: Path to a JSON file to keep the tag index in. See scrape_scps(). Default: None
+    skip_missing: Set to False to keep IDs that aren't written yet. Default: True
+  """
+  ids = list(ids)
+  planned = ids
+  skipped_tags = 0
+  skipped_missing = 0
+  unchecked_tags = 0
+  unchecked_missing = 0
+  failed_series = []
+
+  # Drop IDs the tag pages say don't have any of the tags.
+  if tags:
+    candidates = _tag_candidates(tags, tag_cache)
+    if candidates is not None:
+      planned = [i for i in planned if int(i) in candidates]
+      skipped_tags = len(ids) - len(planned)
+    else:
+      unchecked_tags = len(ids)
+
+  # Drop IDs the series pages say aren't written yet.
+  if skip_missing:
+    missing = {}
+    kept = []
+
+    for i in planned:
+      number = series_index.series_number(i)
+      if number not in missing:
+        missing[number] = _missing(number)
+        if missing[number] is None:
+          failed_series.append(number)
+
+      if missing[number] is None:
+        unchecked_missing += 1
+        kept.append(i)
+      elif int(i) not in missing[number]:
+        kept.append(i)
+
+    skipped_missing = len(planned) - len(kept)
+    planned = kept
+
+  metrics.increment('skipped_missing', skipped_missing)
+  metrics.increment('skipped_tags', skipped_tags)
+  metrics.increment('unchecked_missing', unchecked_missing)
+  metrics.increment('unchecked_tags', unchecked_tags)
+  return ScrapePlan(planned, skipped_missing, skipped_tags, unchecked_missing, unchecked_tags, failed_series)
@@ -0,0 +1,194 @@
+import array, sys, threading
+
+# Every discussion link starts with this, so it's only stored once.
+DISCUSSION_PREFIX = 'http://www.scpwiki.com'
+
+class TagTable:
+  """
+  Gives every tag a small number, so records can store their tags as numbers while every tag's string is only kept in memory once. Thread-safe.
+  """
+  def __init__(self):
+    self.tags = []
+    self._ids = {}
+    self._lock = threading.Lock()
+
+  def id(self, tag: str) -> int:
+    """Returns a tag's number, adding it to the table if it's new."""
+    try:
+      return self._ids[tag]
+
+    except KeyError:
+      with self._lock:
+        if tag not in self._ids:
+          self._ids[tag] = len(self.tags)
+          self.tags.append(sys.intern(str(tag)))
+        return self._ids[tag]
+
+  def ids(self, tags: list) -> array.array:
+    """Returns the numbers of a list of tags."""
+    return array.array('I', [self.id(tag) for tag in tags])
+
+  def names(self, ids: array.array) -> list:
+    """Returns the tags for a list of numbers."""
+    return [self.tags[i] for i in ids]
+
+  def __len__(self) -> int:
+    return len(self.tags)
+
+# Shared tag table every CompactSCP uses by default.
+tag_table = TagTable()
+
+class CompactSCP:
+  """
+  A memory-saving stand-in for the dictionaries parse_scp() and get_scp() return, for keeping a large part of the wiki in memory at once.
+
+  Tags are stored as numbers in a shared TagTable, section names are interned, and all section text is kept in one UTF-8 buffer that's only decoded when a section is read. Reading a record like a dictionary (ex. `scp['tags']`) or calling to_dict() gives back exactly what the original dictionary held.
+
+  Records refer to their TagTable, so they can only be compared and converted back with the same table.
+
+  Attributes:
+    id: The SCP's number.
+    rating: The page's rating.
+    revision: The page's revision number.
+    last_edited: When the page was last edited, as a Unix timestamp.
+    name: The SCP's name, or None if the record didn't have one.
+    image_src: Link to the main image, or None.
+    image_caption: The main image's caption, or None.
+  """
+  __slots__ = ('id', 'rating', 'revision', 'last_edited', 'name', 'image_src', 'image_caption', 'tag_table', '_tags', '_keys', '_text', '_ends', '_discussion', '_extra', '_missing')
+
+  # Keys of the original dictionary, in their original order.
+  _FIELDS = ('id', 'rating', 'image', 'content', 'revision', 'last_edited', 'tags', 'discussion')
+
+  @classmethod
+  def from_dict(cls, record: dict, tag_table: TagTable=tag_table) -> 'CompactSCP':
+    """
+    Packs a parse_scp()/get_scp() dictionary into a CompactSCP.
+
+    Parameters:
+      record: The dictionary to pack.
+      tag_table: TagTable to number the tags in. Default: scpscraper.tag_table
+    """
+    self = cls.__new__(cls)
+    self.tag_table = tag_table
+
+    self.id = record.get('id')
+    self.rating = record.get('rating')
+    self.revision = record.get('revision')
+    self.last_edited = record.get('last_edited')
+    self.name = record.get('name')
+
+    image = record.get('image') or {}
+    self.image_src = image.get('src')
+    self.image_caption = image.get('caption')
+
+    tags = record.get('tags')
+    self._tags = self.tag_table.ids(tags) if tags is not None else None
+
+    # Pack every section's text into one buffer, remembering where each one ends.
+    content = record.get('content')
+    if content is None:
+      self._keys = self._text = self._ends = None
+
+    else:
+      self._keys = tuple(sys.intern(key) for key in content)
+      encoded = [value.encode('utf-8') for value in content.values()]
+      self._text = b''.join(encoded)
+      self._ends = array.array('I')
+      end = 0
+      for value in encoded:
+        end += len(value)
+        self._ends.append(end)
+
+    discussion = record.get('discussion')
+    self._discussion = discussion[len(DISCUSSION_PREFIX):] if discussion is not None and discussion.startswith(DISCUSSION_PREFIX) else discussion
+
+    # Keep anything else the dictionary held as-is.
+    self._extra = {key: value for key, value in record.items() if key not in cls._FIELDS and key != 'name'} or None
+
+    # Remember which keys a partial record (ex. from iter_scps(fields=...)) didn't have.
+    self._missing = tuple(key for key in cls._FIELDS if key not in record) or None
+    return self
+
+  @property
+  def tags(self) -> list:
+    """The page's tags. Each tag's string is shared between every record."""
+    return self.tag_table.names(self._tags) if self._tags is not None else None
+
+  @property
+  def discussion(self) -> str:
+    """Link to the page's discussion page."""
+    if self._discussion is None or self._discussion.startswith('http'):
+      return self._discussion
+    return DISCUSSION_PREFIX + self._discussion
+
+  def section(self, key: str) -> str:
+    """Returns the text of one section, decoding only that section. Raises KeyError if there isn't one."""
+    if self._keys is None or key not in self._keys:
+      raise KeyError(key)
+
+    n = self._keys.index(key)
+
+    start = self._ends[n - 1] if n else 0
+    return self._text[start:self._ends[n]].decode('utf-8')
+
+  @property
+  def content(self) -> dict:
+    """The page's sections, as a section name -> text dictionary (decoded on every access)."""
+    if self._keys is None:
+      return None
+
+    # Byte offsets are character offsets too if the text is all ASCII, so it can be decoded in one go.
+    text = self._text.decode('utf-8')
+    ascii = len(text) == len(self._text)
+
+    content = {}
+    start = 0
+    for key, end in zip(self._keys, self._ends):
+      content[key] = text[start:end] if ascii else self._text[start:end].decode('utf-8')
+      start = end
+    return content
+
+  def to_dict(self) -> dict:
+    """Returns the record as the dictionary it was made from."""
+    record = {
+      'id': self.id,
+      'rating': self.rating,
+      'image': {
+        'src': self.image_src,
+        'caption': self.image_caption
+      },
+      'content': self.content,
+      'revision': self.revision,
+      'last_edited': self.last_edited,
+      'tags': self.tags,
+      'discussion': self.discussion
+    }
+
+    if self.name is not None:
+      record['name'] = self.name
+    if self._extra is not None:
+      record.update(self._extra)
+    if self._missing is not None:
+      for key in self._missing:
+        del record[key]
+    return record
+
+  def __getitem__(self, key: str):
+    if key in (self._missing or ()):
+      raise KeyError(key)
+    if key == 'image':
+      return {'src': self.image_src, 'caption': self.image_caption}
+    if key in self._FIELDS or (key == 'name' and self.name is not None):
+      return getattr(self, key)
+    if self._extra is not None and key in self._extra:
+      return self._extra[key]
+    raise KeyError(key)
+
+  def __eq__(self, other) -> bool:
+    if isinstance(other, CompactSCP):
+      other = other.to_dict()
+    return self.to_dict() == other
+
+  def __repr__(self) -> str:
+    return f'CompactSCP(id={self.id!r}, name={self.name!r}, {len(self._keys or ())} sections, {len(self._text or b"")} bytes of text)'
@@ -1,204 +1,298 @@
-import os, shutil, sys, re, urllib.request, pytest
-from math import ceil
+import copy, functools, hashlib, json, os, random, shutil, socket, sys, re, threading, time, urllib.request, pytest
 from bs4 import BeautifulSoup
-from typing import Union
+from typing import Iterable, Iterator, Union
 from tqdm import tqdm
 
-from scpscraper import gdrive
+from scpscraper import gdrive, lxml_backend
+from scpscraper.lxml_backend import ParseError
+from scpscraper.cache import ResponseCache
+from scpscraper.checkpoint import Checkpoint
+from scpscraper.concurrency import AdaptiveLimiter, RateLimiter, RetryPolicy, concurrency_limiter, imap_ordered, imap_pipeline, rate_limiter, retry_policy
+from scpscraper.indexes import FetchFailedError, SeriesIndex, TagIndex, series_index, tag_index
+from scpscraper.manifest import Manifest
+from scpscraper.metrics import Metrics, error_class, metrics
+from scpscraper.partition import WorkQueue
+from scpscraper.planner import ScrapePlan, plan_scps
+from scpscraper.records import CompactSCP, TagTable, tag_table
+from scpscraper.search import SearchIndex
+from scpscraper.sessions import Response, Session, session
+from scpscraper.shards import HTMLReader, JSONLReader, ShardReader, ShardWriter
+from scpscraper.sinks import DedupSink, OutputSink, TextFileSink
 
-def get_single_scp(scp_id: str) -> BeautifulSoup:
-  """Returns HTML code for the `page-content` div of a given SCP."""
+def _get_page_html(scp_id: str) -> bytes:
+  """Returns the raw HTML of a given SCP's page, or None if it couldn't be downloaded. Internal function, shouldn't need to be called by a user."""
   try:
     # Grab the HTML code.
-    r = urllib.request.urlopen(url=f'http://scp-wiki.wikidot.com/scp-{scp_id}')
-    
-    # Return the organized content for parsing.
-    return BeautifulSoup(r, 'lxml')
+    with metrics.timer('fetch', scp_id):
+      return session.get(f'/scp-{scp_id}').content
   
   # Error handling.
   except Exception as e:
 #     print(f'\nWARNING: Failed to access SCP Wiki page for SCP-{scp_id}. Error: {e}', file=sys.stderr)
     return
 
+def get_single_scp(scp_id: str) -> BeautifulSoup:
+  """Returns HTML code for the `page-content` div of a given SCP."""
+  html = _get_page_html(scp_id)
+  if html is None:
+    return
+
+  # Return the organized content for parsing.
+  with metrics.timer('parse', scp_id):
+    return BeautifulSoup(html, 'lxml')
+
+def _read_revision(html: bytes) -> int:
+  """Reads the revision number out of a page's `page-info` div without parsing the whole page. Internal function, shouldn't need to be called by a user."""
+  match = re.search(rb'id="page-info"[^>]*>[^<0-9]*([0-9]+)', html)
+  if match is not None:
+    return int(match.group(1))
+
 def _get_scp_name(scp_id: int) -> str:
-  """Gets the name of an SCP from the SCP Series pages. Internal function, shouldn't need to be called by a user."""
+  """Gets the name of an SCP from the SCP Series title index. Internal function, shouldn't need to be called by a user."""
   try:
-    # Determine which series the SCP is in.
-    if scp_id < 1000:
-      url = 'http://scp-wiki.wikidot.com/scp-series'
-    elif scp_id % 1000 == 0:
-      url = f'http://scp-wiki.wikidot.com/scp-series-{int(scp_id/1000+1)}'
-    else:
-      url = f'http://scp-wiki.wikidot.com/scp-series-{ceil(scp_id/1000, 0)}'
+    with metrics.timer('name', scp_id):
+      return series_index.get(scp_id)
 
-    # Grab the HTML and parse as needed.
-    r = urllib.request.urlopen(url=url)
-    try:
-      soup = BeautifulSoup(r, 'lxml')
-      content = soup.find('div', id='page-content')
-      list_elements = content.find_all('li')
-
-      for li in list_elements:
-        if re.findall('[0-9]+', li.find_next('a')['href']):
-          if int(re.findall('[0-9]+', li.find_next('a')['href'])[0]) == scp_id:
-            scp_name = re.split('-', li.get_text())[-1]
-            return scp_name.strip(' ')
-    
-    # Handle 404 errors.
-    except urllib.error.HTTPError as e:
-      if e.code == 404:
-#         print(f'\nWARNING: Unavailable SCP Series for SCP-{scp_id}!', file=sys.stderr)
-        return
+  # Handle 404 errors.
+  except urllib.error.HTTPError as e:
+    if e.code == 404:
+#       print(f'\nWARNING: Unavailable SCP Series for SCP-{scp_id}!', file=sys.stderr)
+      return
 
     # Handle other HTTP errors.
-      else:
-#         print(f'\nWARNING: Failed to access SCP Series page for SCP-{scp_id}. HTTP Status Code {e.code}. {e.read()}', file=sys.stderr)
-        return 
-  
+    else:
+#       print(f'\nWARNING: Failed to access SCP Series page for SCP-{scp_id}. HTTP Status Code {e.code}. {e.read()}', file=sys.stderr)
+      return
+
   # Even more error handling.
   except Exception as e:
 #     print(f'\nWARNING: Failed to access SCP Series page for SCP-{scp_id}. Request Error: {e}', file=sys.stderr)
     return
 
-def parse_scp(soup: BeautifulSoup, scp_id: Union[str, int]) -> dict:
-  """Parses the HTML content of a page on the SCP wiki. Internal function, shouldn't need to be called by a user."""
+# Parsing engines parse_scp() can use for raw HTML.
+PARSER_ENGINES = ('lxml', 'bs4')
+DEFAULT_ENGINE = 'bs4'
+
+def parse_scp(soup: Union[BeautifulSoup, bytes, str], scp_id: Union[str, int], engine: str=None, fields: list=None) -> dict:
+  """
+  Parses the HTML content of a page on the SCP wiki. Internal function, shouldn't need to be called by a user.
+
+  Parameters:
+    soup: The page, either as a BeautifulSoup object or as raw HTML.
+    scp_id: ID of the SCP on the page.
+    engine: How to parse raw HTML. 'lxml' uses lxml and XPath directly (falling back to BeautifulSoup if that fails), 'bs4' builds a BeautifulSoup tree. Both return the same dictionary. Ignored for BeautifulSoup objects. Default: DEFAULT_ENGINE ('bs4')
+    fields: Keys of the dictionary to extract (ex. ['content', 'tags']). Everything else is skipped, so it isn't checked for errors either. 'id' is always included. None (default) extracts everything.
+
+  Raises ParseError (a ValueError) if the page isn't laid out like an SCP page, ex. it has no page-content div.
+  """
   # Just to get this out of the way...
   if soup is None:
     return None
 
+  # Raw HTML gets parsed by whichever engine was asked for.
+  if not isinstance(soup, BeautifulSoup):
+    engine = engine or DEFAULT_ENGINE
+    if engine not in PARSER_ENGINES:
+      raise ValueError(f'Unknown parser engine {engine!r}! Must be one of {PARSER_ENGINES}.')
+
+    if engine == 'lxml':
+      try:
+        return lxml_backend.parse_scp(soup, scp_id, fields)
+
+      # Fall back to BeautifulSoup if lxml couldn't make sense of the page.
+      except Exception as e:
+        # print(f'lxml failed to parse SCP-{scp_id}, falling back to BeautifulSoup. Error: {e}')
+        pass
+
+    soup = BeautifulSoup(soup, 'lxml')
+
+  parsed = {'id': scp_id}
+
   # Get rating.
-  try:
-    rating = soup.find('span', {'class': 'rate-points'}).contents[1].contents[0].replace('+', '')
+  if fields is None or 'rating' in fields:
+    try:
+      rating = soup.find('span', {'class': 'rate-points'}).contents[1].contents[0].replace('+', '')
   
-  # Error handling.
-  except AttributeError:
-    # print(f'No rating found for SCP-{scp_id}!')
-    rating = 0
+    # Error handling.
+    except AttributeError:
+      # print(f'No rating found for SCP-{scp_id}!')
+      rating = 0
+
+    parsed['rating'] = int(rating)
 
   # Get page-content block.
   content = soup.find('div', id='page-content')
   # print(content)
+  if content is None and (fields is None or 'image' in fields or 'content' in fields):
+    raise ParseError(f'The page for SCP-{scp_id} has no page-content div!')
 
   # Get main image (if it exists).
-  try:
-    main_image = content.find('div', {'class': 'scp-image-block'}).contents[0]['src']
+  if fields is None or 'image' in fields:
+    try:
+      main_image = content.find('div', {'class': 'scp-image-block'}).contents[0]['src']
   
-  # Error handling.
-  except AttributeError:
-    # print(f'No main_image found for SCP-{scp_id}!')
-    main_image = None
+    # Error handling.
+    except AttributeError:
+      # print(f'No main_image found for SCP-{scp_id}!')
+      main_image = None
   
-  # More error handling.
-  except KeyError:
-    # print(f'No main_image found for SCP-{scp_id}')
-    main_image = None
+    # More error handling.
+    except KeyError:
+      # print(f'No main_image found for SCP-{scp_id}')
+      main_image = None
 
-  # Get image caption
-  try:
-    image_caption = content.find('div', {'class': 'scp-image-block'}).contents[2].contents[1].contents[0]
+    # Get image caption
+    try:
+      image_caption = content.find('div', {'class': 'scp-image-block'}).contents[2].contents[1].contents[0]
+
+      # Keep formatted captions as HTML rather than as a BeautifulSoup object.
+      if not isinstance(image_caption, str):
+        image_caption = str(image_caption)
   
-  # Error handling.
-  except AttributeError:
-    # print(f'No image_caption found for SCP-{scp_id}!')
-    image_caption = None
+    # Error handling.
+    except AttributeError:
+      # print(f'No image_caption found for SCP-{scp_id}!')
+      image_caption = None
   
-  # Even more error handling.
-  except KeyError:
-    # print(f'No image_caption found for SCP-{scp_id}')
-    image_caption = None
+    # Even more error handling.
+    except KeyError:
+      # print(f'No image_caption found for SCP-{scp_id}')
+      image_caption = None
+
+    parsed['image'] = {
+      'src': main_image,
+      'caption': image_caption
+    }
 
   # Get main content
-  try:
-    # Initial variable definitions.
-    mapping = {}
-    key = None
-    # print(content.find_all('p'))
-
-    # Find all the paragraph elements.
-    for item in content.find_all('p'):
-      # Grab the paragraph element's first child.
-      first_child = item.next
+  if fields is None or 'content' in fields:
+    try:
+      # Initial variable definitions.
+      mapping = {}
+      key = None
+      # print(content.find_all('p'))
+
+      # Find all the paragraph elements.
+      for item in content.find_all('p'):
+        # Grab the paragraph element's first child.
+        first_child = item.next
       
-      # Use bold portions as keys/identifiers for their sections.
-      if first_child.name == 'strong':
-        key = first_child.text.rstrip(': ')
-        value = first_child.next_sibling.strip(': ')
+        # Use bold portions as keys/identifiers for their sections.
+        if first_child.name == 'strong':
+          key = first_child.text.rstrip(': ')
+
+          # The section's text has to come right after the bold portion.
+          if first_child.next_sibling is not None and not isinstance(first_child.next_sibling, str):
+            raise ParseError(f"SCP-{scp_id}'s {key!r} section doesn't start with text!")
+          value = first_child.next_sibling.strip(': ')
       
-      else:
-        # Add subsequent paragraphs to the same section.
-        if key is not None:
-          value = f'{mapping[key]}\n{item.get_text(strip=True)}'
-        
-        # Don't if there's no section to add them to.
         else:
-          value = None
+          # Add subsequent paragraphs to the same section.
+          if key is not None:
+            value = f'{mapping[key]}\n{item.get_text(strip=True)}'
+        
+          # Don't if there's no section to add them to.
+          else:
+            value = None
       
-      # Put that all into the value for the key.
-      mapping[key] = value
+        # Put that all into the value for the key.
+        mapping[key] = value
     
-    # Remove the sections that didn't have keys.
-    try:
-      mapping.pop(None)
+      # Remove the sections that didn't have keys.
+      try:
+        mapping.pop(None)
     
-    # Error handling.
-    except:
-      pass
+      # Error handling.
+      except:
+        pass
   
-  # Error handling.
-  except AttributeError as e:
-    # print(f'Can\'t parse content of SCP-{scp_id}! Error: {e}')
-    mapping = None
+    # Error handling.
+    except AttributeError as e:
+      # print(f'Can\'t parse content of SCP-{scp_id}! Error: {e}')
+      mapping = None
+
+    parsed['content'] = mapping
 
   # Get page info.
-  page_info = soup.find('div', id='page-info')
-  revision = re.findall('\d+', page_info.next)[0]
-  last_updated = page_info.find('span')['class'][1].replace('time_', '')
+  if fields is None or 'revision' in fields or 'last_edited' in fields:
+    page_info = soup.find('div', id='page-info')
+    revision = re.findall(r'\d+', page_info.next)[0]
+    last_updated = page_info.find('span')['class'][1].replace('time_', '')
+
+    parsed['revision'] = int(revision)
+    parsed['last_edited'] = int(last_updated)
 
   # Get tags.
-  tags_list = soup.find('div', {'class': 'page-tags'}).find('span')
-  tags = [tag.string for tag in tags_list if tag.string != '\n']
+  if fields is None or 'tags' in fields:
+    tags_list = soup.find('div', {'class': 'page-tags'}).find('span')
+    tags = [tag.string for tag in tags_list if tag.string != '\n']
+
+    parsed['tags'] = tags
 
   # Get link to the discussion page.
-  discussion_link = 'http://www.scpwiki.com' + soup.find('a', id='discuss-button')['href']
+  if fields is None or 'discussion' in fields:
+    discussion_link = 'http://www.scpwiki.com' + soup.find('a', id='discuss-button')['href']
 
-  return {
-    'id': scp_id,
-    'rating': int(rating),
-    'image': {
-      'src': main_image,
-      'caption': image_caption
-    },
-    'content': mapping,
-    'revision': int(revision),
-    'last_edited': int(last_updated),
-    'tags': tags,
-    'discussion': discussion_link
-  }
+    parsed['discussion'] = discussion_link
 
-def get_scp(scp_id: Union[str, int]) -> dict:
+  # Only hand back what was asked for.
+  if fields is not None:
+    parsed = {key: value for key, value in parsed.items() if key == 'id' or key in fields}
+
+  return parsed
+
+def get_scp(scp_id: Union[str, int], engine: str=None, fields: list=None) -> dict:
   """
   Returns a dictionary with as much content as possible regarding the SCP ID.
 
   Parameters:
     scp_id: ID of the SCP to grab info for. Should be either a string with leading zeroes (ex. 002) or an integer (ex. 2).
+    engine: Parsing engine to use, 'lxml' or 'bs4'. See parse_scp(). Default: DEFAULT_ENGINE ('bs4')
+    fields: Keys of the dictionary to grab (ex. ['name'] or ['content', 'tags']). Only the work those keys need is done: ['name'] only reads the series page and never downloads the SCP's page, and leaving 'name' out skips the series page. 'id' is always included. None (default) grabs everything.
   """
 
   # Make the formatting nice for get_single_scp
-  if int(scp_id) < 10:
-    scp_id = f'00{scp_id}'
-  
-  elif int(scp_id) < 100:
-    scp_id = f'0{scp_id}'
+  scp_id = _format_id(scp_id)
+
+  # Names come from the series pages, so there's no need to download the SCP's page for them alone.
+  if _names_only(fields):
+    parsed_content = {'id': int(scp_id)}
+    if 'name' in fields:
+      parsed_content = _add_name(parsed_content, int(scp_id))
+      if 'name' not in parsed_content:
+        raise ValueError(f"Couldn't find the name of SCP-{scp_id}!")
+    return parsed_content
   
   # Get stuff we need from the page's HTML
-  site_content = get_single_scp(str(scp_id))
-  parsed_content = parse_scp(site_content, int(scp_id))
+  site_content = _get_page_html(scp_id)
+  if site_content is None:
+    raise ValueError(f"Couldn't download the page for SCP-{scp_id}!")
+
+  with metrics.timer('parse', scp_id):
+    parsed_content = parse_scp(site_content, int(scp_id), engine, fields)
+
+  # Skip the series page if the name wasn't asked for.
+  if fields is not None and 'name' not in fields:
+    return parsed_content
+
+  return _add_name(parsed_content, int(scp_id))
+
+def _names_only(fields: list=None) -> bool:
+  """Checks whether only an SCP's name (or nothing but its ID) was asked for, so its page doesn't need downloading. Internal function, shouldn't need to be called by a user."""
+  return fields is not None and not set(fields) - {'id', 'name'}
 
+def _select_fields(record: dict, fields: list=None) -> dict:
+  """Keeps only the keys of a record that were asked for, plus its ID. Internal function, shouldn't need to be called by a user."""
+  if fields is None or record is None:
+    return record
+  return {key: value for key, value in record.items() if key == 'id' or key in fields}
+
+def _add_name(parsed_content: dict, scp_id: int) -> dict:
+  """Adds an SCP's name to its parsed content. Internal function, shouldn't need to be called by a user."""
   # Get SCP's name and add it to parsed_content.
-  if get_scp_name(int(scp_id)) is not None:
-    if '[ACCESS DENIED]' not in get_scp_name(int(scp_id)):
-      scp_name = get_scp_name(int(scp_id))
-      parsed_content['name'] = scp_name
+  scp_name = get_scp_name(scp_id)
+  if scp_name is not None:
+    parsed_content['name'] = scp_name
   
   # Don't add the name if there was an error preventing get_scp_name from grabbing it.
   else:
@@ -206,6 +300,39 @@ def get_scp(scp_id: Union[str, int]) -> dict:
   
   return parsed_content
 
+def _get_scp_incremental(scp_id: int, manifest: Manifest, engine: str=None, fields: list=None) -> dict:
+  """Same as get_scp(), but reuses the record stored in the manifest if the page's revision hasn't changed. Returns None instead of raising. Internal function, shouldn't need to be called by a user."""
+  # The manifest doesn't help with names.
+  if _names_only(fields):
+    return _get_scp_or_none(scp_id, engine, fields)
+
+  try:
+    html = _get_page_html(_format_id(scp_id))
+    if html is None:
+      return
+
+    # Only parse the page if it changed since the last run.
+    revision = _read_revision(html)
+    parsed_content = manifest.get(scp_id, revision) if revision is not None else None
+    if parsed_content is None:
+      with metrics.timer('parse', scp_id):
+        parsed_content = parse_scp(html, int(scp_id), engine)
+      manifest.update(scp_id, parsed_content)
+    else:
+      metrics.increment('manifest_reused')
+
+    # The manifest keeps whole records, so only trim them down afterwards.
+    parsed_content = _select_fields(parsed_content, fields)
+    if fields is not None and 'name' not in fields:
+      return parsed_content
+
+    return _add_name(parsed_content, int(scp_id))
+
+  # Error handling.
+  except Exception as e:
+    # print(f'Failed to grab the info for {scp_id}! Error: {e}')
+    return
+
 def get_scp_name(id: int) -> str:
   """
   Scrapes an SCP's name. Ignores uncreated SCPs. Returns the SCP's name as a string.
@@ -214,17 +341,356 @@ def get_scp_name(id: int) -> str:
     id: The SCP you want to retrieve's object ID.
   """
   try:
-    # Redundant, but I can sleep easier since it has that extra layer of fallback.
-    if _get_scp_name(id) is not None:
-      if "[ACCESS DENIED]" not in _get_scp_name(id):
-        return _get_scp_name(id)
+    # Names come from the series title index, so this never downloads a series page more than once.
+    scp_name = _get_scp_name(id)
+    if scp_name is not None:
+      if "[ACCESS DENIED]" not in scp_name:
+        return scp_name
   
   # Error handling
   except KeyError as e:
 #     print(f"\nWARNING: Failed to scrape SCP-{id}! Error: {e}", file=sys.stderr)
     pass
 
-def scrape_scps(min_skip: int=0, max_skip: int=6000, tags: list=[], ai_dataset: bool=False, copy_to_drive: bool=False) -> None:
+def _format_id(scp_id: Union[str, int]) -> str:
+  """Pads an SCP ID with leading zeroes (ex. 2 -> 002). Internal function, shouldn't need to be called by a user."""
+  return f'{int(scp_id):03d}'
+
+def _matches_tags(page_tags: list, tags: list) -> bool:
+  """Checks whether a page has at least one of the given tags. An empty list matches all tags. Internal function, shouldn't need to be called by a user."""
+  if tags:
+    for tag in tags:
+      if tag in page_tags:
+        return True
+    return False
+
+  return True
+
+def _get_scp_or_none(scp_id: int, engine: str=None, fields: list=None) -> dict:
+  """Same as get_scp(), but returns None instead of raising. Internal function, shouldn't need to be called by a user."""
+  try:
+    # Leave fields out unless they're used, so wrappers of the older get_scp() keep working.
+    return get_scp(scp_id, engine) if fields is None else get_scp(scp_id, engine, fields)
+
+  # Error handling.
+  except Exception as e:
+    # print(f'Failed to grab the info for {scp_id}! Error: {e}')
+    return
+
+def _get_page_by_number(scp_id: int) -> tuple:
+  """Downloads an SCP's page and pulls out what scrape_scps_html() needs. Returns `(raw HTML, page-content div, tags)`, or None if the page couldn't be downloaded. Internal function, shouldn't need to be called by a user."""
+  j = _format_id(scp_id)
+  html = _get_page_html(j)
+  if html is None:
+    return
+
+  with metrics.timer('parse', j):
+    return (html,) + _page_regions(html)
+
+def _page_regions(html: bytes) -> tuple:
+  """
+  Returns a page's `page-content` div (as BeautifulSoup) and tags. Only the div goes through BeautifulSoup, the rest of the page is skimmed by lxml_backend.page_regions(). Internal function, shouldn't need to be called by a user.
+  """
+  content, page_tags = lxml_backend.page_regions(html)
+
+  # Parse the whole page like we used to if either is missing, so errors stay the same.
+  if content is None or page_tags is None:
+    soup = BeautifulSoup(html, 'lxml')
+    tags_list = soup.find('div', {'class': 'page-tags'}).find('span')
+    return soup.find('div', id='page-content'), [tag.string for tag in tags_list if tag.string != '\n']
+
+  return BeautifulSoup(content, 'lxml').find('div', id='page-content'), page_tags
+
+def _open_failed(failed_file: str=None, append: bool=False, position: int=None):
+  """Opens the file SCPs that couldn't be grabbed are listed in, line-buffered so a crash doesn't lose any. When appending, the file is first cut back to `position` (ex. a checkpoint's) if given, so SCPs listed after it aren't listed twice. Returns None if there isn't one. Internal function, shouldn't need to be called by a user."""
+  if failed_file is not None:
+    failed = open(failed_file, 'a' if append else 'w', buffering=1)
+    if append and position is not None:
+      failed.truncate(position)
+      failed.seek(0, os.SEEK_END)
+    return failed
+
+def _failed_position(failed) -> int:
+  """Returns how much of the list of failed SCPs has been written, for checkpointing, or None if there isn't one. Internal function, shouldn't need to be called by a user."""
+  if failed is not None:
+    failed.flush()
+    return os.fstat(failed.fileno()).st_size
+
+def _export_metrics(metrics_file: str=None) -> None:
+  """Saves a JSON summary of the metrics (if asked to) and rewrites the Prometheus text file (if there is one) at the end of a run. Internal function, shouldn't need to be called by a user."""
+  if metrics_file is not None:
+    metrics.save(metrics_file)
+  if metrics.prometheus_file is not None:
+    metrics.write_prometheus()
+
+# Output files of scrape_scps(), in the order they're written.
+SCRAPE_SCPS_FILES = [
+                     'scp-descrips.txt',
+                     'scp-conprocs.txt',
+                     'scp-titles.txt',
+                     'scp-addenda.txt',
+]
+
+def _format_scp(mylist: dict, j: str, tags: list, ai_dataset: bool) -> dict:
+  """Formats the sections of a parsed SCP for the scrape_scps() output files. Returns a filename -> text dictionary. Internal function, shouldn't need to be called by a user."""
+  sections = {name: [] for name in SCRAPE_SCPS_FILES}
+
+  # Get the list of keys in the dictionary (so we can search through it later).
+  if _matches_tags(mylist.get("tags"), tags):
+    # Records grabbed without their content (ex. titles only) have no sections to write.
+    keyslist = mylist["content"].keys() if "content" in mylist else ()
+
+    try:
+      # Append current SCP's description to the description file.
+      out = sections['scp-descrips.txt']
+      try:
+        # Add <|endoftext|> token if it's a dataset for training AI.
+        if ai_dataset:
+          out.append('Description: {}\n<|endoftext|>'.format(mylist["content"]["Description"].replace(j, 'XXXX')))
+        else:
+          out.append(f'Description: {mylist["content"]["Description"]}\n')
+
+        out.append('\n')
+
+      # Error handling.
+      except Exception as e:
+        # print(f'Failed to grab the description of SCP-{j}! Please grab it yourself! Error: {e}')
+        pass
+
+      # Append current SCP's conprocs to the conproc file.
+      out = sections['scp-conprocs.txt']
+      try:
+        for k in keyslist:
+          # Search keys for "Containment", output to conproc file if it matches.
+          if "containment" in k.lower():
+            if ai_dataset:
+              out.append('Special Containment Procedures: {}\n<|endoftext|>\n'.format(mylist["content"][k].replace(j, 'XXXX')))
+            else:
+              out.append(f'Special Containment Procedures: {mylist["content"][k]}\n')
+
+            # Add <|endoftext|> token if it's a dataset for training AI.
+
+
+            out.append('\n')
+
+      # Error handling.
+      except:
+        # print(f'Failed to grab the conprocs of SCP-{j}! It is probably not an article with a standard format! Please grab them yourself!')
+        pass
+
+      try:
+        # Append current SCP's title to the title file (if we can grab it).
+        out = sections['scp-titles.txt']
+        # Even more redundancy. I know. This is getting ridiculous.
+        if mylist["name"] is not None:
+          if "[ACCESS DENIED]" not in mylist["name"]:
+            if ai_dataset:
+              out.append(f'SCP-XXXX: {mylist["name"]}\n')
+            else:
+              out.append(f'SCP-{j}: {mylist["name"]}\n')
+
+          # Handle nonexistent SCPs.
+          else:
+            # print(f'SCP-{j} doesn\'t exist yet!')
+            pass
+
+        else:
+          # print(f'SCP-{j} doesn\'t exist yet!')
+          pass
+
+      # Error handling.
+      except Exception as e:
+        # raise e
+        # print(f'Failed to grab the title of SCP-{j}! Please grab it yourself! Error: {e}')
+        pass
+
+      # Find and append addenda (if they exist) to the addenda file.
+      out = sections['scp-addenda.txt']
+      try:
+        # Define list or dictionary depending on whether or not we need the keys.
+        if ai_dataset:
+          addendalist = []
+        else:
+          addendalist = {}
+
+        for k in keyslist:
+          # Search keys for "Addendum", add to addendalist if it matches.
+          if "addendum" in k.lower():
+            if ai_dataset:
+              addendalist.append(mylist["content"][k])
+
+            # Do the same thing for non-dataset, also adding the keys.
+            else:
+              addendalist.update({k: mylist["content"][k]})
+
+        # Write addenda to addenda file.
+        if ai_dataset:
+          for k in addendalist:
+            buffer = k.strip(': ')
+            out.append('Addendum XXXX-XX: {}\n<|endoftext|>\n\n'.format(buffer.replace(j, 'XXXX')))
+
+        # Do the same for non-dataset.
+        else:
+          for k in addendalist.keys():
+            buffer = f'{k}: {addendalist[k]}'
+            out.append(f'{buffer}\n\n')
+
+      # Error handling.
+      except Exception as e:
+        # print(f'Failed to grab the addenda of SCP-{j}! Please grab them yourself (if they exist)! Error: {e}')
+        pass
+
+    # More error handling.
+    except Exception as e:
+      # print(f'Failed to write the info for SCP-{j}! Error: {e}')
+      pass
+
+  return {name: ''.join(text) for name, text in sections.items()}
+
+def _fetch_page(scp_id: int, manifest: Manifest=None, fields: list=None) -> tuple:
+  """
+  Fetch stage of the iter_scps() pipeline. Downloads an SCP's page and looks up its name. Internal function, shouldn't need to be called by a user.
+
+  Returns `(html, record, name)`, where `record` is the manifest's record if the page hasn't changed since it was stored (`html` is None then), or None if the page couldn't be downloaded. Only what `fields` needs is grabbed (see get_scp()).
+  """
+  try:
+    # Names come from the series pages, so there's no need to download the SCP's page for them alone.
+    if _names_only(fields):
+      name = get_scp_name(scp_id) if 'name' in fields else None
+      if 'name' in fields and name is None:
+        return
+      return None, {'id': scp_id}, name
+
+    html = _get_page_html(_format_id(scp_id))
+    if html is None:
+      return
+
+    # Skip parsing pages that haven't changed, if we're scraping incrementally.
+    record = None
+    if manifest is not None:
+      revision = _read_revision(html)
+      if revision is not None:
+        record = manifest.get(scp_id, revision)
+        if record is not None:
+          metrics.increment('manifest_reused')
+
+    name = get_scp_name(scp_id) if fields is None or 'name' in fields else None
+    return (html if record is None else None), record, name
+
+  # Error handling.
+  except Exception as e:
+    # print(f'Failed to grab the info for {scp_id}! Error: {e}')
+    return
+
+def _parse_page(scp_id: int, fetched: tuple, engine: str=None, keep_parsed: bool=False, fields: list=None) -> tuple:
+  """
+  Parse stage of the iter_scps() pipeline. Runs in a worker process. Internal function, shouldn't need to be called by a user.
+
+  Returns `(parsed, record, seconds, error)`, where `parsed` is the freshly parsed record without its name if `keep_parsed` is set (None otherwise, or if it came from the manifest), and `record` is None if anything failed. `seconds` is how long parsing took (None if the page wasn't parsed) and `error` is the class of the error parsing ran into, if any, for the main process to add to its metrics.
+  """
+  # Nothing to parse if the page couldn't be downloaded.
+  if fetched is None:
+    return None, None, None, None
+
+  start = time.perf_counter()
+  try:
+    html, record, name = fetched
+
+    parsed = None
+    seconds = None
+    if record is None:
+      # Whole records are kept for the manifest.
+      record = parse_scp(html, scp_id, engine, None if keep_parsed else fields)
+      seconds = time.perf_counter() - start
+      if keep_parsed:
+        parsed = copy.deepcopy(record)
+
+    record = _select_fields(record, fields)
+    if name is not None:
+      record['name'] = name
+
+    return parsed, record, seconds, None
+
+  # Error handling.
+  except Exception as e:
+    # print(f'Failed to parse the info for {scp_id}! Error: {e}')
+    return None, None, time.perf_counter() - start, error_class(e)
+
+def _iter_scps(ids: Iterable[int], workers: int=1, parse_workers: int=0, queue_size: int=None, engine: str=None, manifest: Manifest=None, fields: list=None) -> Iterator[tuple]:
+  """Yields `(id, record)` for every ID in order, where `record` is None if the SCP couldn't be grabbed. Internal function, shouldn't need to be called by a user."""
+  # Parse pages on a process pool, if asked to. Otherwise the fetching threads parse them too.
+  if parse_workers:
+    fetch = functools.partial(_fetch_page, manifest=manifest, fields=fields)
+    process = functools.partial(_parse_page, engine=engine, keep_parsed=manifest is not None, fields=fields)
+
+    results = imap_pipeline(fetch, process, ids, workers, parse_workers, queue_size)
+    for scp_id, (parsed, record, seconds, error) in results:
+      # Parsing happened in another process, so its metrics are recorded here.
+      if seconds is not None:
+        metrics.observe('parse', seconds, _format_id(scp_id), error)
+
+      # Remember freshly parsed pages for the next incremental run.
+      if parsed is not None:
+        manifest.update(scp_id, parsed)
+      metrics.increment('scps_grabbed' if record is not None else 'scps_failed')
+      yield scp_id, record
+
+  else:
+    if manifest is not None:
+      get = functools.partial(_get_scp_incremental, manifest=manifest, engine=engine, fields=fields)
+    else:
+      get = functools.partial(_get_scp_or_none, engine=engine, fields=fields)
+
+    for scp_id, record in imap_ordered(get, ids, workers):
+      metrics.increment('scps_grabbed' if record is not None else 'scps_failed')
+      yield scp_id, record
+
+def _needed_fields(fields: list=None, tags: list=[]) -> list:
+  """Returns the fields to grab to give back `fields`, adding the ones filtering by tags needs. Internal function, shouldn't need to be called by a user."""
+  if fields is None:
+    return
+  return list(fields) + ['tags'] if tags else list(fields)
+
+def iter_scps(ids: Union[int, Iterable[int]], tags: list=[], fields: list=None, workers: int=1, parse_workers: int=0, engine: str=None, manifest: Union[str, Manifest]=None, tag_cache: str=None, compact: bool=False) -> Iterator[dict]:
+  """
+  Yields a get_scp() dictionary for each SCP as soon as it's grabbed, in ID order. Only a handful of SCPs are held in memory at once, however many IDs there are. SCPs that couldn't be grabbed are skipped.
+
+  Parameters:
+    ids: The SCP numbers to grab (ex. range(0, 6000)), or a single SCP number.
+    tags: The list of tags to grab from. Will ignore SCPs without these tags. Only SCPs listed on the wiki's tag pages for these tags are downloaded. An empty list (default) matches all tags.
+    fields: Keys of the dictionaries to grab (ex. ['name', 'tags']). Only the work those keys need is done (see get_scp()). 'id' is always kept. None (default) grabs everything.
+    workers: Number of pages to fetch at once. Default: 1
+    parse_workers: Number of processes to parse pages on. 0 (default) parses pages in the fetching threads instead.
+    engine: Parsing engine to use, 'lxml' or 'bs4'. See parse_scp(). Default: DEFAULT_ENGINE ('bs4')
+    manifest: Manifest (or path to one) to reuse records of unchanged pages from. See scrape_scps(). A path is saved to once iteration finishes. Default: None
+    tag_cache: Path to a JSON file to keep the tag index in. See scrape_scps(). Default: None
+    compact: Set to True to yield CompactSCP records instead of dictionaries, which take a lot less memory when many of them are kept around. Default: False
+  """
+  if isinstance(ids, int):
+    ids = [ids]
+
+  # Don't bother downloading SCPs the tag pages say don't have the tags.
+  if tags:
+    ids = plan_scps(ids, tags, tag_cache, skip_missing=False)
+
+  # Keep track of the manifest ourselves if we were only given a path.
+  own_manifest = isinstance(manifest, str)
+  if own_manifest:
+    manifest = Manifest(manifest)
+
+  for scp_id, record in _iter_scps(ids, workers, parse_workers, engine=engine, manifest=manifest, fields=_needed_fields(fields, tags)):
+    # Skip SCPs that couldn't be grabbed or don't match the tags.
+    if record is None or not _matches_tags(record.get('tags'), tags):
+      continue
+
+    record = _select_fields(record, fields)
+
+    yield CompactSCP.from_dict(record) if compact else record
+
+  if own_manifest:
+    manifest.close()
+
+def scrape_scps(min_skip: int=0, max_skip: int=6000, tags: list=[], ai_dataset: bool=False, copy_to_drive: bool=False, *, series_cache: str=None, workers: int=1, rate_limit: float=None, manifest: str=None, resume: bool=False, checkpoint_every: int=100, sink: OutputSink=None, dedup: str='line', engine: str=None, parse_workers: int=0, queue_size: int=None, tag_cache: str=None, skip_missing: bool=True, metrics_file: str=None, adaptive: bool=False, failed_file: str=None, output_dir: str=None, fields: list=None) -> ScrapePlan:
   """
   Scrapes as much info on all SCPs from min_skip to max_skip - 1 as possible. Writes this info to different files based on its section.
 
@@ -234,259 +700,629 @@ def scrape_scps(min_skip: int=0, max_skip: int=6000, tags: list=[], ai_dataset:
   Parameters:
     min_skip: The SCP number to start at. Default: 0
     max_skip: The SCP number to end at plus one. Default: 6000
-    tags: The list of tags to grab from. Will ignore SCPs without these tags. An empty list (default) matches all tags.
+    tags: The list of tags to grab from. Will ignore SCPs without these tags. Only SCPs listed on the wiki's tag pages for these tags are downloaded. An empty list (default) matches all tags.
     ai_dataset: Set to True if data is later going to be used to train an AI. Adds "<|endoftext|>" tokens where necessary to divide the dataset for training. Default: False
     copy_to_drive: Set to True to copy the output files to your Google Drive when done creating them. Requires having your Google Drive mounted (preferably with scpscraper.gdrive.mount()). Default: False
+
+  Keyword-only parameters (the other bulk scrapers share most of these, and point back here for the details):
+    series_cache: Path to a JSON file to keep the series title index in. Loaded before scraping (if it exists) and saved afterwards, so repeated runs skip the series pages entirely. Default: None
+    workers: Number of pages to fetch at once. Output is still written in ID order, so it's identical to a run with one worker. Default: 1
+    rate_limit: Maximum requests per second sent to the wiki, shared between all workers. Sets scpscraper.rate_limiter's cap for the rest of the session. None (default) leaves the current cap alone.
+    manifest: Path to a JSON Lines manifest of each SCP's revision, last edit time and parsed record. New records are appended to it at every checkpoint, and it's compacted when the scrape finishes. Turns on incremental mode: pages whose revision hasn't changed since the last run reuse their stored record instead of being parsed again. Default: None
+    resume: Set to True to continue from scp-checkpoint.json instead of starting over. The output files are kept, minus anything written after the checkpoint. Starts over if there is no checkpoint. Default: False
+    checkpoint_every: Number of SCPs between checkpoints. 0 or None disables checkpointing. Default: 100
+    sink: OutputSink to send the output to instead of the output files. Writes are addressed by output file name. copy_to_drive only applies to the output files. Default: None
+    dedup: How to remove duplicates while writing. 'line' drops lines already written to the same file, 'record' drops sections already written to the same file, and None keeps everything. Only small hashes are kept in memory either way. Default: 'line'
+    engine: Parsing engine to use, 'lxml' or 'bs4'. See parse_scp(). Default: DEFAULT_ENGINE ('bs4')
+    parse_workers: Number of processes to parse pages on. Pages are then downloaded by `workers` threads, parsed on the process pool, and formatted and written in ID order by the main process. 0 (default) parses pages in the downloading threads instead.
+    queue_size: Maximum number of downloaded pages waiting to be parsed when parse_workers is set. Default: parse_workers * 2
+    tag_cache: Path to a JSON file to keep the tag index in. Loaded before scraping (if it exists) and saved afterwards, so repeated runs with the same tags skip the tag pages entirely. Default: None
+    skip_missing: Set to False to download SCPs even if their series page lists them as not written yet. Default: True
+    metrics_file: Path to save a JSON summary of scpscraper.metrics (errors by stage and class, and how long each stage took) to when done. The Prometheus text file is rewritten then too, if scpscraper.metrics.prometheus_file is set. Default: None
+    adaptive: Set to True to let the number of requests in flight follow what the wiki keeps up with, between 1 and `workers`. Backs off when the wiki throttles us or times out, and ramps back up while it doesn't. Sets scpscraper.concurrency_limiter for the rest of the session. Default: False
+    failed_file: Path to list the SCPs that still couldn't be grabbed after retrying in, one number per line, so they can be retried later (ex. with iter_scps()). Default: None
+    output_dir: Directory to write the output files and checkpoint to, created if it doesn't exist, so several scrapes can run side by side. None (default) uses the current directory.
+    fields: Keys of get_scp() to grab, skipping the work for everything else (see get_scp()). ['name'] only fills scp-titles.txt and never downloads an SCP's page (unless tags are given), and ['content'] fills the other files without reading the series pages. None (default) grabs everything.
+
+  Returns the ScrapePlan that was followed, which says how many downloads were skipped (see plan_scps()).
   """
-  # Create/clear the files we need for scraping.
-  filelist = []
-  filelist.append(open('scp-descrips.txt', 'w'))
-  filelist.append(open('scp-conprocs.txt', 'w'))
-  filelist.append(open('scp-titles.txt', 'w'))
-  filelist.append(open('scp-addenda.txt', 'w'))
-  for i in range(len(filelist)):
-    filelist[i].close()
-
-  # print('Grabbing and writing skip info...\n', flush=True)
-
-  # Initiate loop, create progress bar.
-  for i in tqdm(range(min_skip, max_skip), "Fetching skips", total=max_skip, ncols=150, initial=min_skip, unit="skip", file=sys.stdout, bar_format='{desc}... {percentage:3.2f}% |{bar}|  [{remaining} remaining, {rate_fmt}]', smoothing=0.01875):
-    # Nice number formatting.
-    if i < 10:
-      j = f'00{i}'
-    elif i < 100:
-      j = f'0{i}'
-    else:
-      j = i
-    
-    try:
-      # Get all the things for the SCP.
-      mylist = get_scp(i)
-      
-      # Tag match checking code
-      match = False
-      
-      if tags:
-        for tag in tags:
-          if tag in mylist["tags"]:
-            match = True
-            break
-      
-      else:
-        match = True
-      
-      # Get the list of keys in the dictionary (so we can search through it later).
-      if match:
-        keyslist = mylist["content"].keys()
+  # Cap the request rate, if asked to.
+  if rate_limit is not None:
+    rate_limiter.rate = rate_limit
 
-        # Put stuff in a better format for the AI, if we're making a dataset for one
-        if ai_dataset:
-          for k in keyslist:
-            mylist["content"][k] = mylist["content"][k].replace(j, 'XXXX')
-
-        try:
-          # Append current SCP's description to the description file.
-          with open('scp-descrips.txt', 'a') as out:
-            try:
-              # Add <|endoftext|> token if it's a dataset for training AI.
-              if ai_dataset:
-                out.write('Description: {}\n<|endoftext|>'.format(mylist["content"]["Description"].replace(j, 'XXXX')))
-              else:
-                out.write(f'Description: {mylist["content"]["Description"]}\n')
+  # Let the number of requests in flight follow what the wiki keeps up with, if asked to.
+  if adaptive:
+    concurrency_limiter.reset(workers)
 
-              out.write('\n')
+  # Reuse unchanged records from the last run, if we're scraping incrementally.
+  if manifest is not None:
+    manifest = Manifest(manifest)
 
-            # Error handling.
-            except Exception as e:
-              # print(f'Failed to grab the description of SCP-{j}! Please grab it yourself! Error: {e}')
-              pass
+  # Load the series title index from disk, if we have one.
+  if series_cache is not None and os.path.exists(series_cache):
+    series_index.load(series_cache)
 
-          # Append current SCP's conprocs to the conproc file.
-          with open('scp-conprocs.txt', 'a') as out:
-            try:
-              for k in keyslist:
-                # Search keys for "Containment", output to conproc file if it matches.
-                if "containment" in k.lower():
-                  if ai_dataset:
-                    out.write('Special Containment Procedures: {}\n<|endoftext|>\n'.format(mylist["content"][k].replace(j, 'XXXX')))
-                  else:
-                    out.write(f'Special Containment Procedures: {mylist["content"][k]}\n')
+  # Pick up where the last run left off, if asked to.
+  checkpoint = Checkpoint(os.path.join(output_dir or '', 'scp-checkpoint.json'))
+  restored = checkpoint.restore(min_skip, max_skip) if resume else None
+  start = restored[0] if restored is not None else min_skip
 
-                  # Add <|endoftext|> token if it's a dataset for training AI.
+  # Create/clear the files we need for scraping (or keep them, if we're resuming).
+  filelist_names = SCRAPE_SCPS_FILES
+  own_sink = sink is None
+  if own_sink:
+    sink = TextFileSink(filelist_names, append=restored is not None, directory=output_dir)
 
+  # Remove duplicates as we go.
+  if dedup is not None:
+    sink = DedupSink(sink, dedup)
 
-                  out.write('\n')
+  failed = _open_failed(failed_file, append=restored is not None, position=restored[2] if restored is not None else None)
 
-            # Error handling.
-            except:
-              # print(f'Failed to grab the conprocs of SCP-{j}! It is probably not an article with a standard format! Please grab them yourself!')
-              pass
+  with sink:
+    if restored is not None:
+      sink.rewind(restored[1])
+      if dedup is not None and os.path.exists(f'{checkpoint.path}.dedup'):
+        sink.load(f'{checkpoint.path}.dedup', restored[3])
 
-          try:
-            # Append current SCP's title to the title file (if we can grab it).
-            with open('scp-titles.txt', 'a') as out:
-              # Even more redundancy. I know. This is getting ridiculous.
-              if mylist["name"] is not None:
-                if "[ACCESS DENIED]" not in mylist["name"]:
-                  if ai_dataset:
-                    out.write(f'SCP-XXXX: {mylist["name"]}\n')
-                  else:
-                    out.write(f'SCP-{j}: {mylist["name"]}\n')
-
-                # Handle nonexistent SCPs.
-                else:
-                  # print(f'SCP-{j} doesn\'t exist yet!')
-                  pass
+    # print('Grabbing and writing skip info...\n', flush=True)
 
-              else:
-                # print(f'SCP-{j} doesn\'t exist yet!')
-                pass
+    # Don't bother downloading SCPs that aren't written yet or don't have the tags.
+    plan = plan_scps(range(start, max_skip), tags, tag_cache, skip_missing)
 
-          # Error handling.
-          except Exception as e:
-            # raise e
-            # print(f'Failed to grab the title of SCP-{j}! Please grab it yourself! Error: {e}')
-            pass
+    # Initiate loop, create progress bar.
+    results = _iter_scps(plan, workers, parse_workers, queue_size, engine, manifest, _needed_fields(fields, tags))
+    for n, (i, mylist) in enumerate(tqdm(results, "Fetching skips", total=start + len(plan), ncols=150, initial=start, unit="skip", file=sys.stdout, bar_format='{desc}... {percentage:3.2f}% |{bar}|  [{remaining} remaining, {rate_fmt}]', smoothing=0.01875), 1):
+      try:
+        # Write everything we got for the SCP (if we got it at all).
+        if mylist is not None:
+          with metrics.timer('write', _format_id(i)):
+            for name, text in _format_scp(mylist, _format_id(i), tags, ai_dataset).items():
+              if text:
+                sink.write(name, text)
 
-          # Find and append addenda (if they exist) to the addenda file.
-          with open('scp-addenda.txt', 'a') as out:
-            try:
-              # Define list or dictionary depending on whether or not we need the keys.
-              if ai_dataset:
-                addendalist = []
-              else:
-                addendalist = {}
+      # Wow, just look at all that error handling!
+      except Exception as e:
+        # print(f'Failed to grab the info for {i}! Error: {e}')
+        pass
+      # print(mylist)
 
-              for k in keyslist:
-                # Search keys for "Addendum", add to addendalist if it matches.
-                if "addendum" in k.lower():
-                  if ai_dataset:
-                    addendalist.append(mylist["content"][k])
+      # Note down SCPs we couldn't grab, so they can be retried later.
+      if mylist is None and failed is not None:
+        failed.write(f'{i}\n')
 
-                  # Do the same thing for non-dataset, also adding the keys.
-                  else:
-                    addendalist.update({k: mylist["content"][k]})
+      # Save our progress every so often.
+      if checkpoint_every and n % checkpoint_every == 0:
+        if series_cache is not None:
+          series_index.save(series_cache)
+        if manifest is not None:
+          manifest.save()
+        # The hashes are saved first, and the checkpoint says how many of them to keep, so a crash in between can't leave hashes of rewound output behind.
+        if dedup is not None:
+          sink.save(f'{checkpoint.path}.dedup')
+        checkpoint.save(min_skip, max_skip, i + 1, sink.positions(), _failed_position(failed), sink.counts() if dedup is not None else None)
 
-              # Write addenda to addenda file.
-              if ai_dataset:
-                for k in addendalist:
-                  buffer = k.strip(': ')
-                  out.write('Addendum XXXX-XX: {}\n<|endoftext|>\n\n'.format(buffer.replace(j, 'XXXX')))
+  if failed is not None:
+    failed.close()
 
-              # Do the same for non-dataset.
-              else:
-                for k in addendalist.keys():
-                  buffer = f'{k}: {addendalist[k]}'
-                  out.write(f'{buffer}\n\n')
-
-            # Error handling.
-            except Exception as e:
-              # print(f'Failed to grab the addenda of SCP-{j}! Please grab them yourself (if they exist)! Error: {e}')
-              pass
-
-        # More error handling.
-        except Exception as e:
-          # print(f'Failed to write the info for SCP-{j}! Error: {e}')
-          pass
+  # Everything's written, so there's nothing left to resume.
+  checkpoint.remove()
+  if os.path.exists(f'{checkpoint.path}.dedup'):
+    os.remove(f'{checkpoint.path}.dedup')
 
-    # Wow, just look at all that error handling!
-    except Exception as e:
-      # print(f'Failed to grab the info for {i}! Error: {e}')
-      pass
-    # print(mylist)
-
-  filelist_names = [
-                    'scp-descrips.txt',
-                    'scp-conprocs.txt',
-                    'scp-titles.txt',
-                    'scp-addenda.txt',
-  ]
-  for skip_file in filelist_names:
-    # Variable definitions.
-    lines_seen = set()
-    outfile = open(f'{skip_file}.tmp', "w")
-
-    # Remove duplicate lines.
-    for line in open(skip_file, 'r'):
-      if line not in lines_seen:
-        outfile.write(line)
-        lines_seen.add(line)
-    
-    # Close original outfile connection.
-    outfile.flush()
-    outfile.close()
-
-    # Write changes to original file and delete temporary file.
-    with open(f'{skip_file}.tmp', "r") as infile:
-      with open(skip_file, 'w') as outfile:
-        outfile.write(infile.read())
-    os.remove(f'{skip_file}.tmp')
-    if copy_to_drive:
-      gdrive.copy_to_drive(skip_file)
+  # Copying only applies to our own files.
+  if copy_to_drive and own_sink:
+    for skip_file in filelist_names:
+      gdrive.copy_to_drive(os.path.join(output_dir or '', skip_file))
+
+  # Save the series title index and manifest for next time.
+  if series_cache is not None:
+    series_index.save(series_cache)
+  if manifest is not None:
+    manifest.close()
   # print("Done!")
 
-def scrape_scps_html(min_skip: int=0, max_skip: int=6000, tags: list=[], ai_dataset: bool=False, copy_to_drive: bool=False) -> None:
+  _export_metrics(metrics_file)
+  return plan
+
+def scrape_scps_html(min_skip: int=0, max_skip: int=6000, tags: list=[], ai_dataset: bool=False, copy_to_drive: bool=False, *, workers: int=1, rate_limit: float=None, resume: bool=False, checkpoint_every: int=100, sink: OutputSink=None, tag_cache: str=None, skip_missing: bool=True, metrics_file: str=None, adaptive: bool=False, failed_file: str=None, output_dir: str=None, archive: str=None, shard_size: int=64 << 20) -> ScrapePlan:
   """
   Scrapes the html code of SCPs min_skip to max_skip - 1.
   
   Output files:
     scp-html.txt.
+    pages-00000.html.gz, pages-00001.html.gz, ... and pages.index.json (in archive, if given): Every page written to scp-html.txt, whole and compressed on its own, with an index of where each one is.
 
   Parameters:
     min_skip: The SCP number to start at. Default: 0
     max_skip: The SCP number to end at plus one. Default: 6000
-    tags: The list of tags to grab from. Will ignore SCPs without these tags. An empty list (default) matches all tags.
+    tags: The list of tags to grab from. Will ignore SCPs without these tags. Only SCPs listed on the wiki's tag pages for these tags are downloaded. An empty list (default) matches all tags.
     ai_dataset: Set to True if data is later going to be used to train an AI. Adds "<|endoftext|>" tokens where necessary to divide the dataset for training. Default: False
     copy_to_drive: Set to True to copy the output files to your Google Drive when done creating them. Requires having your Google Drive mounted (preferably with scpscraper.gdrive.mount()). Default: False
+
+  Keyword-only parameters (workers, rate_limit, checkpoint_every, tag_cache, skip_missing, metrics_file, adaptive, failed_file and output_dir work the same as in scrape_scps()):
+    resume: Set to True to continue from scp-html-checkpoint.json instead of starting over. See scrape_scps(). Default: False
+    sink: OutputSink to send the output to instead of scp-html.txt. Writes are addressed as scp-html.txt. Default: None
+    archive: Directory to also keep the full HTML of every page written to scp-html.txt in. Read pages back with scpscraper.HTMLReader(archive).get(scp_id), or re-run extraction on them with parse_archive(), without downloading anything. Default: None
+    shard_size: Compressed size, in bytes, after which a new archive shard is started. Default: 64 MiB
+
+  Returns the ScrapePlan that was followed, which says how many downloads were skipped (see plan_scps()).
   """
-  # Create/reset text file
-  with open('scp_html.txt', "w"):
-    pass
+  # Cap the request rate, if asked to.
+  if rate_limit is not None:
+    rate_limiter.rate = rate_limit
+
+  # Let the number of requests in flight follow what the wiki keeps up with, if asked to.
+  if adaptive:
+    concurrency_limiter.reset(workers)
+
+  # Pick up where the last run left off, if asked to.
+  checkpoint = Checkpoint(os.path.join(output_dir or '', 'scp-html-checkpoint.json'))
+  restored = checkpoint.restore(min_skip, max_skip) if resume else None
+  start = restored[0] if restored is not None else min_skip
+
+  # Create/reset text file (or keep it, if we're resuming).
+  own_sink = sink is None
+  if own_sink:
+    sink = TextFileSink(['scp-html.txt'], append=restored is not None, directory=output_dir)
+
+  failed = _open_failed(failed_file, append=restored is not None, position=restored[2] if restored is not None else None)
+
+  # Keep the full pages too, if asked to.
+  writer = ShardWriter(archive, prefix='pages', suffix='.html.gz', max_shard_bytes=shard_size, append=restored is not None) if archive is not None else None
   
   # Define blank page contents.
   blank_page = '<div style="text-align: center;">\n<h1 id="toc0"><span>This page doesn\'t exist yet!</span></h1>\n</div>\n<hr>\n<div style="background-color: #600; border: solid 1px #600; border-radius: 20px; color: #fff; width: 450px; margin: 0 auto; font-size: 150%; text-align: center; box-shadow: 0 2px 6px rgba(0,0,0,.5), inset 0 1px rgba(255,255,255,.5), inset 0 10px rgba(255,204,204,.5), inset 0 10px 20px rgba(255,204,204,.3), inset 0 -15px 30px rgba(48,0,0,.5); line-height: 100%; padding: 0 10px;">\n<p><strong>Did you get feedback first?</strong></p>\n</div>\n<div style="background-color: #fff0f0; border: solid 1px #600; border-radius: 20px; color: #300; width: 450px; margin: 20px auto 0; text-align: center; box-shadow: 0 2px 6px rgba(0,0,0,.5); padding: 0 10px;">'
   
-  for i in tqdm(range(min_skip, max_skip), "Fetching skips", total=max_skip, ncols=150, initial=min_skip, unit="skip", file=sys.stdout, bar_format='{desc}... {percentage:3.2f}% |{bar}|  [{remaining} remaining, {rate_fmt}]', smoothing=0.01875):
-    with open('scp-html.txt', "a") as out:
-      if i < 10:
-        j = f'00{i}'
-      elif i < 100:
-        j = f'0{i}'
-      else:
-        j = i
-      
-      soup = get_single_scp(j)
-      
-      if soup is not None:
-        # Get page tags
-        tags_list = soup.find('div', {'class': 'page-tags'}).find('span')
-        page_tags = [tag.string for tag in tags_list if tag.string != '\n']
+  with sink:
+    if restored is not None:
+      sink.rewind(restored[1])
 
-        # Tag match checking code
-        match = False
+    # Don't bother downloading SCPs that aren't written yet or don't have the tags.
+    plan = plan_scps(range(start, max_skip), tags, tag_cache, skip_missing)
 
-        if tags != []:
-          for tag in tags:
-            if tag in page_tags:
-              match = True
-              break
-        
-        else:
-          match = True
-        
-        if match:
-          content = soup.find('div', id='page-content')
+    results = imap_ordered(_get_page_by_number, plan, workers)
+    for n, (i, page) in enumerate(tqdm(results, "Fetching skips", total=start + len(plan), ncols=150, initial=start, unit="skip", file=sys.stdout, bar_format='{desc}... {percentage:3.2f}% |{bar}|  [{remaining} remaining, {rate_fmt}]', smoothing=0.01875), 1):
+      j = _format_id(i)
+      metrics.increment('scps_grabbed' if page is not None else 'scps_failed')
 
+      # Note down SCPs we couldn't grab, so they can be retried later.
+      if page is None and failed is not None:
+        failed.write(f'{i}\n')
+      
+      if page is not None:
+        # Only the page-content div and the page tags get parsed.
+        html, content, page_tags = page
+
+        # Tag match checking code
+        if _matches_tags(page_tags, tags):
           if blank_page not in content:
-            if ai_dataset:
-              out.write('{}\n\n<|endoftext|>\n\n\n'.format(str(content).replace(j, 'XXXX')))
+            with metrics.timer('write', j):
+              if ai_dataset:
+                sink.write('scp-html.txt', '{}\n\n<|endoftext|>\n\n\n'.format(str(content).replace(j, 'XXXX')))
 
-            else:
-              out.write(f'{content}\n\n')
+              else:
+                sink.write('scp-html.txt', f'{content}\n\n')
+
+              if writer is not None:
+                writer.add(i, html)
 
           else:
             # print(f'\nThe page for SCP-{j} is blank!', file=sys.stderr)
-            pass
+            metrics.increment('blank_pages')
+
+      # Save our progress every so often.
+      if checkpoint_every and n % checkpoint_every == 0:
+        if writer is not None:
+          writer.write_index()
+        checkpoint.save(min_skip, max_skip, i + 1, sink.positions(), _failed_position(failed))
+
+  if writer is not None:
+    writer.close()
+
+  if failed is not None:
+    failed.close()
+
+  # Everything's written, so there's nothing left to resume.
+  checkpoint.remove()
   
+  if copy_to_drive and own_sink:
+    gdrive.copy_to_drive(os.path.join(output_dir or '', 'scp-html.txt'))
+  if copy_to_drive and archive is not None:
+    gdrive.copy_to_drive(archive)
+
+  _export_metrics(metrics_file)
+  return plan
+
+def parse_archive(archive: str, ids: Iterable[int]=None, engine: str=None, names: bool=False, compact: bool=False) -> Iterator[dict]:
+  """
+  Re-runs extraction on pages kept by scrape_scps_html(archive=...), without downloading them again (ex. after the parser changed). Yields one parse_scp() dictionary per SCP, in ID order. Pages that fail to parse are skipped.
+
+  Parameters:
+    archive: Directory the pages were archived in.
+    ids: The SCP numbers to parse. SCPs that aren't in the archive are skipped. None (default) parses every archived page.
+    engine: Parsing engine to use, 'lxml' or 'bs4'. See parse_scp(). Default: DEFAULT_ENGINE ('bs4')
+    names: Set to True to add each SCP's name like get_scp() does. Names come from scpscraper.series_index, which downloads the series pages it doesn't have yet. Default: False
+    compact: Set to True to yield CompactSCP records instead of dictionaries. See iter_scps(). Default: False
+  """
+  with HTMLReader(archive) as reader:
+    ids = reader.keys() if ids is None else [int(i) for i in ids if i in reader]
+
+    for i in ids:
+      try:
+        with metrics.timer('parse', _format_id(i)):
+          parsed_content = parse_scp(reader.get(i), i, engine)
+
+      # Error handling.
+      except Exception as e:
+        # print(f'Failed to parse the archived page for {i}! Error: {e}')
+        continue
+
+      if names:
+        parsed_content = _add_name(parsed_content, i)
+
+      yield CompactSCP.from_dict(parsed_content) if compact else parsed_content
+
+def scrape_scps_jsonl(min_skip: int=0, max_skip: int=6000, tags: list=[], output_dir: str='scp-jsonl', *, shard_size: int=64 << 20, copy_to_drive: bool=False, series_cache: str=None, workers: int=1, rate_limit: float=None, manifest: str=None, engine: str=None, parse_workers: int=0, queue_size: int=None, tag_cache: str=None, skip_missing: bool=True, metrics_file: str=None, adaptive: bool=False, failed_file: str=None, fields: list=None) -> ScrapePlan:
+  """
+  Scrapes the full get_scp() dictionary of all SCPs from min_skip to max_skip - 1, keeping the rating, tags, revision, image and sections that scrape_scps() flattens away.
+
+  Output files (in output_dir):
+    scps-00000.jsonl.gz, scps-00001.jsonl.gz, ... gzipped JSON Lines shards with one SCP per line, in ID order.
+    scps.index.json: Where each SCP is in the shards. Read single SCPs back with scpscraper.JSONLReader(output_dir).get(scp_id) without decompressing anything else.
+
+  Parameters:
+    min_skip: The SCP number to start at. Default: 0
+    max_skip: The SCP number to end at plus one. Default: 6000
+    tags: The list of tags to grab from. Will ignore SCPs without these tags. Only SCPs listed on the wiki's tag pages for these tags are downloaded. An empty list (default) matches all tags.
+    output_dir: Directory to write the shards and index to. Default: scp-jsonl
+
+  Keyword-only parameters (series_cache, workers, rate_limit, manifest, engine, parse_workers, queue_size, tag_cache, skip_missing, metrics_file, adaptive and failed_file work the same as in scrape_scps()):
+    shard_size: Compressed size, in bytes, after which a new shard is started. Default: 64 MiB
+    copy_to_drive: Set to True to copy output_dir to your Google Drive when done creating it. See scrape_scps(). Default: False
+    fields: Keys of get_scp() to keep, skipping the work for everything else (see get_scp()). None (default) keeps everything.
+
+  Returns the ScrapePlan that was followed, which says how many downloads were skipped (see plan_scps()).
+  """
+  # Cap the request rate, if asked to.
+  if rate_limit is not None:
+    rate_limiter.rate = rate_limit
+
+  # Let the number of requests in flight follow what the wiki keeps up with, if asked to.
+  if adaptive:
+    concurrency_limiter.reset(workers)
+
+  # Reuse unchanged records from the last run, if we're scraping incrementally.
+  if manifest is not None:
+    manifest = Manifest(manifest)
+
+  # Load the series title index from disk, if we have one.
+  if series_cache is not None and os.path.exists(series_cache):
+    series_index.load(series_cache)
+
+  # Don't bother downloading SCPs that aren't written yet or don't have the tags.
+  plan = plan_scps(range(min_skip, max_skip), tags, tag_cache, skip_missing)
+
+  failed = _open_failed(failed_file)
+
+  with ShardWriter(output_dir, max_shard_bytes=shard_size) as writer:
+    results = _iter_scps(plan, workers, parse_workers, queue_size, engine, manifest, _needed_fields(fields, tags))
+    for i, record in tqdm(results, "Fetching skips", total=min_skip + len(plan), ncols=150, initial=min_skip, unit="skip", file=sys.stdout, bar_format='{desc}... {percentage:3.2f}% |{bar}|  [{remaining} remaining, {rate_fmt}]', smoothing=0.01875):
+      # Note down SCPs we couldn't grab, so they can be retried later.
+      if record is None and failed is not None:
+        failed.write(f'{i}\n')
+
+      # Skip SCPs that couldn't be grabbed or don't match the tags.
+      if record is None or not _matches_tags(record.get('tags'), tags):
+        continue
+
+      record = _select_fields(record, fields)
+      with metrics.timer('write', _format_id(i)):
+        writer.add(i, (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+
+  if failed is not None:
+    failed.close()
+
   if copy_to_drive:
-    gdrive.copy_to_drive('scp-html.txt')
+    gdrive.copy_to_drive(output_dir)
+
+  # Save the series title index and manifest for next time.
+  if series_cache is not None:
+    series_index.save(series_cache)
+  if manifest is not None:
+    manifest.close()
+
+  _export_metrics(metrics_file)
+  return plan
+
+def _shard_dir(shards_dir: str, start: int, stop: int, owner: str) -> str:
+  """Returns the directory a worker writes a range to. Internal function, shouldn't need to be called by a user."""
+  return os.path.join(shards_dir, f'{start:05d}-{stop:05d}.{owner}')
+
+def _keep_lease(queue: WorkQueue, start: int, owner: str, done: threading.Event) -> None:
+  """Renews a worker's lease on a range until `done` is set. Internal function, shouldn't need to be called by a user."""
+  while not done.wait(queue.lease / 3):
+    if not queue.renew(start, owner):
+      return
+
+def scrape_scps_worker(queue: str, min_skip: int=0, max_skip: int=6000, tags: list=[], *, range_size: int=100, shards_dir: str='scp-shards', owner: str=None, lease: float=600, series_cache: str=None, workers: int=1, rate_limit: float=None, engine: str=None, parse_workers: int=0, queue_size: int=None, tag_cache: str=None, skip_missing: bool=True, metrics_file: str=None, adaptive: bool=False) -> int:
+  """
+  Helps scrape SCPs min_skip to max_skip - 1 along with any number of other workers, on this machine or others. Run it once per worker (with the same queue and settings), then merge everything with merge_scps() once they're all done.
+
+  Workers claim ranges of `range_size` SCPs from a shared WorkQueue and scrape each one with scrape_scps_jsonl() into its own directory, so workers never write to the same files. A range whose worker dies is handed to another worker once its lease runs out.
+
+  Output files (in shards_dir):
+    <start>-<stop>.<owner>/: scrape_scps_jsonl()'s output for each range, plus failed.txt listing the SCPs that couldn't be grabbed.
+
+  Parameters:
+    queue: Path to the SQLite work queue, on a filesystem every worker can reach (and lock). Created by the first worker to get there.
+    min_skip: The SCP number to start at. Default: 0
+    max_skip: The SCP number to end at plus one. Default: 6000
+    tags: The list of tags to grab from. Will ignore SCPs without these tags. An empty list (default) matches all tags.
+
+  Keyword-only parameters (series_cache, workers, engine, parse_workers, queue_size, tag_cache, skip_missing and adaptive work the same as in scrape_scps()):
+    range_size: Number of SCPs per claimed range. Default: 100
+    shards_dir: Directory to write each range's output under, shared by every worker. Default: scp-shards
+    owner: Name this worker claims ranges under. Must be unique between workers. Default: <hostname>-<process ID>
+    lease: Seconds a claimed range stays reserved without being renewed. Leases are renewed while the range is being scraped. Default: 600
+    rate_limit: Maximum requests per second this worker sends to the wiki. See scrape_scps(). Default: None
+    metrics_file: Path to save a JSON summary of scpscraper.metrics to after each range. See scrape_scps(). Default: None
+
+  Returns the number of ranges this worker finished.
+  """
+  owner = owner or f'{socket.gethostname()}-{os.getpid()}'
+  queue = WorkQueue(queue, lease)
+  queue.create(min_skip, max_skip, range_size, tags)
+  finished = 0
+
+  while True:
+    claimed = queue.claim(owner)
+    if claimed is None:
+      break
+
+    start, stop = claimed
+    output_dir = _shard_dir(shards_dir, start, stop, owner)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Keep the range ours for as long as it takes to scrape.
+    done = threading.Event()
+    renewer = threading.Thread(target=_keep_lease, args=(queue, start, owner, done), daemon=True)
+    renewer.start()
+
+    try:
+      scrape_scps_jsonl(start, stop, tags, output_dir, copy_to_drive=False, series_cache=series_cache, workers=workers, rate_limit=rate_limit, engine=engine, parse_workers=parse_workers, queue_size=queue_size, tag_cache=tag_cache, skip_missing=skip_missing, metrics_file=metrics_file, adaptive=adaptive, failed_file=os.path.join(output_dir, 'failed.txt'))
+
+    finally:
+      done.set()
+      renewer.join()
+
+    # Someone else took over the range if our lease ran out, so their output is the one that counts.
+    if queue.complete(start, owner):
+      finished += 1
+
+  return finished
+
+def merge_scps(queue: str, shards_dir: str='scp-shards', ai_dataset: bool=False, copy_to_drive: bool=False, sink: OutputSink=None, dedup: str='line', output_dir: str=None, failed_file: str=None) -> None:
+  """
+  Merges what scrape_scps_worker() scraped into the same output files a single scrape_scps() run over the whole range would have written, byte for byte.
+
+  Each range is read back from the directory of the worker that finished it, in ID order, and formatted and deduplicated exactly like scrape_scps() does. Output of workers whose lease was taken over is ignored.
+
+  Raises ValueError if any range hasn't been finished yet.
+
+  Output files:
+    scp-descrips.txt, scp-conprocs.txt, scp-titles.txt, and scp-addenda.txt.
+
+  Parameters:
+    queue: Path to the SQLite work queue the workers used.
+    shards_dir: Directory the workers wrote their ranges under. Default: scp-shards
+    ai_dataset: Set to True if data is later going to be used to train an AI. See scrape_scps(). Default: False
+    copy_to_drive: Set to True to copy the output files to your Google Drive when done creating them. See scrape_scps(). Default: False
+    sink: OutputSink to send the output to instead of the output files. See scrape_scps(). Default: None
+    dedup: How to remove duplicates while writing. See scrape_scps(). Default: 'line'
+    output_dir: Directory to write the output files to. See scrape_scps(). Default: None
+    failed_file: Path to list the SCPs the workers couldn't grab in, one number per line. Default: None
+  """
+  queue = WorkQueue(queue)
+  tags = queue.settings['tags']
+  ranges = queue.ranges()
+
+  unfinished = [r for r in ranges if r['state'] != 'done']
+  if unfinished:
+    raise ValueError(f'{len(unfinished)} of the {len(ranges)} ranges in {queue.path} are not finished yet (first: SCPs {unfinished[0]["start"]} to {unfinished[0]["stop"] - 1})!')
+
+  filelist_names = SCRAPE_SCPS_FILES
+  own_sink = sink is None
+  if own_sink:
+    sink = TextFileSink(filelist_names, directory=output_dir)
+
+  # Remove duplicates across every range, just like a single run would.
+  if dedup is not None:
+    sink = DedupSink(sink, dedup)
+
+  failed = _open_failed(failed_file)
+
+  with sink:
+    for r in ranges:
+      range_dir = _shard_dir(shards_dir, r['start'], r['stop'], r['owner'])
+
+      with JSONLReader(range_dir) as reader:
+        for i, mylist in reader:
+          try:
+            for name, text in _format_scp(mylist, _format_id(i), tags, ai_dataset).items():
+              if text:
+                sink.write(name, text)
+
+          # Error handling.
+          except Exception as e:
+            # print(f'Failed to merge the info for {i}! Error: {e}')
+            pass
+
+      # Pass on the SCPs this range couldn't grab.
+      if failed is not None and os.path.exists(os.path.join(range_dir, 'failed.txt')):
+        with open(os.path.join(range_dir, 'failed.txt'), 'r') as infile:
+          failed.write(infile.read())
+
+  if failed is not None:
+    failed.close()
+
+  # Copying only applies to our own files.
+  if copy_to_drive and own_sink:
+    for skip_file in filelist_names:
+      gdrive.copy_to_drive(os.path.join(output_dir or '', skip_file))
+
+def _document_text(record: dict, redact: bool=True) -> str:
+  """Turns a parsed SCP into one training document: its title and every section. Redacts the SCP's number in a single pass over the finished document if asked to. Internal function, shouldn't need to be called by a user."""
+  j = _format_id(record['id'])
+  parts = []
+
+  name = record.get('name')
+  if name is not None and '[ACCESS DENIED]' not in name:
+    parts.append(f'SCP-{j}: {name}')
+
+  for key, value in (record.get('content') or {}).items():
+    parts.append(f'{key}: {value}')
+
+  text = '\n\n'.join(parts)
+  return text.replace(j, 'XXXX') if redact else text
+
+def _build_document(scp_id: int, data: bytes, kind: str='jsonl', tags: list=[], redact: bool=True, engine: str=None) -> tuple:
+  """
+  Document stage of build_dataset(). Runs in a worker process. Internal function, shouldn't need to be called by a user.
+
+  Returns `(text, digest, tags)`, where `digest` is an 8-byte hash of the text for deduplication, or None if the SCP doesn't have the tags, has nothing to write or couldn't be parsed.
+  """
+  try:
+    record = json.loads(data) if kind == 'jsonl' else parse_scp(data, scp_id, engine)
+    if not _matches_tags(record['tags'], tags):
+      return
+
+    text = _document_text(record, redact)
+    if not text:
+      return
+
+    return text, hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), record['tags']
+
+  # Error handling.
+  except Exception as e:
+    # print(f'Failed to build the document for {scp_id}! Error: {e}')
+    return
+
+def _shuffled(items: Iterable, buffer_size: int, seed: int) -> Iterator:
+  """Shuffles items through a buffer of `buffer_size`, so only that many are held at once. Internal function, shouldn't need to be called by a user."""
+  rng = random.Random(seed)
+  buffer = []
+
+  for item in items:
+    buffer.append(item)
+
+    # Hand back a random item once the buffer is full.
+    if len(buffer) >= buffer_size:
+      n = rng.randrange(len(buffer))
+      buffer[n], buffer[-1] = buffer[-1], buffer[n]
+      yield buffer.pop()
+
+  rng.shuffle(buffer)
+  yield from buffer
+
+def build_dataset(source: str, output_dir: str='scp-dataset', tags: list=[], redact: bool=True, shard_size: int=64 << 20, processes: int=0, queue_size: int=None, shuffle_buffer: int=0, seed: int=0, engine: str=None) -> dict:
+  """
+  Builds a dataset for training an AI from scraped SCPs, without downloading anything. Each SCP becomes one document with its title and every section, with its number redacted (ex. SCP-173 -> SCP-XXXX). Documents that are exact duplicates of an earlier one are dropped.
+
+  Output files (in output_dir):
+    dataset-00000.jsonl.gz, dataset-00001.jsonl.gz, ... gzipped JSON Lines shards with one `{"id": ..., "tags": [...], "text": ...}` document per line, ready for a trainer to stream.
+    dataset.index.json: Where each SCP's document is in the shards. See ShardReader.
+    dataset.stats.json: Number of documents, characters and (UTF-8) bytes of text in each shard and overall, plus how many SCPs were dropped.
+
+  Parameters:
+    source: Directory written by scrape_scps_jsonl() (or scrape_scps_worker()), or the archive of scrape_scps_html(archive=...). Pages in an archive are parsed first, and have no titles.
+    output_dir: Directory to write the shards, index and statistics to. Default: scp-dataset
+    tags: The list of tags to include. An empty list (default) matches all tags.
+    redact: Set to False to keep SCP numbers in the documents. Default: True
+    shard_size: Compressed size, in bytes, after which a new shard is started. Default: 64 MiB
+    processes: Number of processes to build documents on. 0 (default) builds them in this process.
+    queue_size: Maximum number of SCPs waiting on or being built at once when processes is set. Default: processes * 2
+    shuffle_buffer: Shuffle documents through a buffer holding this many of them, instead of writing them in ID order. 0 (default) doesn't shuffle.
+    seed: Seed for shuffling, so a build can be repeated exactly. Default: 0
+    engine: Parsing engine to use for archived pages, 'lxml' or 'bs4'. See parse_scp(). Default: DEFAULT_ENGINE ('bs4')
+
+  Returns the statistics saved to dataset.stats.json.
+  """
+  # Work out what we're building from.
+  if os.path.exists(os.path.join(source, 'scps.index.json')):
+    kind, reader = 'jsonl', ShardReader(source)
+  elif os.path.exists(os.path.join(source, 'pages.index.json')):
+    kind, reader = 'html', HTMLReader(source)
+  else:
+    raise ValueError(f"{source} isn't the output of scrape_scps_jsonl() or an archive from scrape_scps_html()!")
+
+  build = functools.partial(_build_document, kind=kind, tags=list(tags), redact=redact, engine=engine)
+
+  with reader:
+    # Build documents on a process pool, if asked to, reading them from the shards in a thread meanwhile.
+    if processes:
+      results = imap_pipeline(reader.get, build, reader.keys(), 1, processes, queue_size)
+    else:
+      results = ((i, build(i, reader.get(i))) for i in reader.keys())
+
+    stats = {'documents': 0, 'characters': 0, 'bytes': 0, 'duplicates': 0, 'skipped': 0, 'shards': []}
+    seen = set()
+
+    def unique():
+      for i, document in results:
+        if document is None:
+          stats['skipped'] += 1
+          continue
+
+        text, digest, page_tags = document
+        if digest in seen:
+          stats['duplicates'] += 1
+          continue
+
+        seen.add(digest)
+        yield i, text, page_tags
+
+    documents = unique()
+    if shuffle_buffer:
+      documents = _shuffled(documents, shuffle_buffer, seed)
+
+    with ShardWriter(output_dir, prefix='dataset', max_shard_bytes=shard_size) as writer:
+      for i, text, page_tags in tqdm(documents, "Building documents", ncols=150, unit="doc", file=sys.stdout):
+        writer.add(i, (json.dumps({'id': i, 'tags': page_tags, 'text': text}, ensure_ascii=False) + '\n').encode('utf-8'))
+
+        # Keep count of what went into each shard.
+        if len(stats['shards']) < len(writer.shards):
+          stats['shards'].append({'name': writer.shards[-1], 'documents': 0, 'characters': 0, 'bytes': 0})
+        for counts in (stats, stats['shards'][-1]):
+          counts['documents'] += 1
+          counts['characters'] += len(text)
+          counts['bytes'] += len(text.encode('utf-8'))
+
+  with open(os.path.join(output_dir, 'dataset.stats.json.tmp'), 'w') as outfile:
+    json.dump(stats, outfile, indent=2)
+  os.replace(os.path.join(output_dir, 'dataset.stats.json.tmp'), os.path.join(output_dir, 'dataset.stats.json'))
+
+  return stats
+
+def build_index(source: str, path: str='scp-index.db', engine: str=None) -> dict:
+  """
+  Loads scraped SCPs into a SearchIndex, without downloading anything. Running it again after a new scrape only re-indexes SCPs whose revision changed.
+
+  Parameters:
+    source: Directory written by scrape_scps_jsonl() (or scrape_scps_worker()), or the archive of scrape_scps_html(archive=...). Pages in an archive are parsed first, and have no titles.
+    path: SQLite database file to keep the index in. Default: scp-index.db
+    engine: Parsing engine to use for archived pages, 'lxml' or 'bs4'. See parse_scp(). Default: DEFAULT_ENGINE ('bs4')
+
+  Returns how many SCPs were added, updated and unchanged. Query the index with scpscraper.SearchIndex(path).
+  """
+  # Work out what we're indexing.
+  if os.path.exists(os.path.join(source, 'scps.index.json')):
+    with JSONLReader(source) as reader, SearchIndex(path) as index:
+      return index.update(record for i, record in tqdm(reader, "Indexing SCPs", total=len(reader), ncols=150, unit="SCP", file=sys.stdout))
+
+  elif os.path.exists(os.path.join(source, 'pages.index.json')):
+    with SearchIndex(path) as index:
+      return index.update(tqdm(parse_archive(source, engine=engine), "Indexing SCPs", ncols=150, unit="SCP", file=sys.stdout))
+
+  else:
+    raise ValueError(f"{source} isn't the output of scrape_scps_jsonl() or an archive from scrape_scps_html()!")
@@ -0,0 +1,182 @@
+import json, sqlite3
+from typing import Iterable
+
+from scpscraper.records import CompactSCP
+
+class SearchIndex:
+  """
+  A local SQLite database of scraped SCPs for answering questions like "which Keter SCPs mention cold in their containment procedures" without re-reading the output files. Needs SQLite with FTS5, which Python's sqlite3 has on most platforms.
+
+  Every section is full-text indexed, and tags, ratings and revisions have tables of their own, so queries only read the SCPs they return. Records are only re-indexed when their revision changes.
+
+  Parameters:
+    path: SQLite database file. Created if it doesn't exist.
+  """
+  def __init__(self, path: str):
+    self.path = path
+    self._db = sqlite3.connect(path)
+
+    with self._db as db:
+      db.execute('CREATE TABLE IF NOT EXISTS scps (id INTEGER PRIMARY KEY, name TEXT, record TEXT)')
+      db.execute('CREATE TABLE IF NOT EXISTS ratings (scp_id INTEGER PRIMARY KEY, rating INTEGER)')
+      db.execute('CREATE INDEX IF NOT EXISTS ratings_rating ON ratings (rating)')
+      db.execute('CREATE TABLE IF NOT EXISTS revisions (scp_id INTEGER PRIMARY KEY, revision INTEGER, last_edited INTEGER)')
+      db.execute('CREATE TABLE IF NOT EXISTS tags (id INTEGER PRIMARY KEY, name TEXT UNIQUE)')
+      db.execute('CREATE TABLE IF NOT EXISTS scp_tags (tag_id INTEGER, scp_id INTEGER, PRIMARY KEY (tag_id, scp_id))')
+      db.execute('CREATE INDEX IF NOT EXISTS scp_tags_scp ON scp_tags (scp_id)')
+      db.execute('CREATE TABLE IF NOT EXISTS sections (id INTEGER PRIMARY KEY, scp_id INTEGER, key TEXT, text TEXT)')
+      db.execute('CREATE INDEX IF NOT EXISTS sections_scp ON sections (scp_id)')
+
+      # Full-text index over the sections table, kept up to date by triggers.
+      db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS sections_fts USING fts5(key, text, content='sections', content_rowid='id')")
+      db.execute('CREATE TRIGGER IF NOT EXISTS sections_insert AFTER INSERT ON sections BEGIN INSERT INTO sections_fts (rowid, key, text) VALUES (new.id, new.key, new.text); END')
+      db.execute("CREATE TRIGGER IF NOT EXISTS sections_delete AFTER DELETE ON sections BEGIN INSERT INTO sections_fts (sections_fts, rowid, key, text) VALUES ('delete', old.id, old.key, old.text); END")
+
+  def revision(self, scp_id: int) -> int:
+    """Returns the revision an SCP was indexed at, or None if it isn't indexed (or was indexed without one)."""
+    row = self._db.execute('SELECT revision FROM revisions WHERE scp_id = ?', (scp_id,)).fetchone()
+    return row[0] if row is not None else None
+
+  def _remove(self, scp_id: int) -> None:
+    for table in ('sections', 'scp_tags', 'revisions', 'ratings'):
+      self._db.execute(f'DELETE FROM {table} WHERE scp_id = ?', (scp_id,))
+    self._db.execute('DELETE FROM scps WHERE id = ?', (scp_id,))
+
+  def _add(self, record: dict) -> str:
+    if isinstance(record, CompactSCP):
+      record = record.to_dict()
+
+    scp_id = int(record['id'])
+    row = self._db.execute('SELECT revision FROM revisions WHERE scp_id = ?', (scp_id,)).fetchone()
+
+    # Records without a revision can't be told apart, so they're always re-indexed.
+    if row is not None and row[0] is not None and row[0] == record.get('revision'):
+      return 'unchanged'
+
+    exists = row is not None or self._db.execute('SELECT 1 FROM scps WHERE id = ?', (scp_id,)).fetchone() is not None
+    self._remove(scp_id)
+
+    self._db.execute('INSERT INTO scps VALUES (?, ?, ?)', (scp_id, record.get('name'), json.dumps(record, ensure_ascii=False)))
+    self._db.execute('INSERT INTO revisions VALUES (?, ?, ?)', (scp_id, record.get('revision'), record.get('last_edited')))
+    if record.get('rating') is not None:
+      self._db.execute('INSERT INTO ratings VALUES (?, ?)', (scp_id, record['rating']))
+
+    for tag in set(record.get('tags') or ()):
+      self._db.execute('INSERT OR IGNORE INTO tags (name) VALUES (?)', (tag,))
+      self._db.execute('INSERT INTO scp_tags SELECT id, ? FROM tags WHERE name = ?', (scp_id, tag))
+
+    self._db.executemany('INSERT INTO sections (scp_id, key, text) VALUES (?, ?, ?)', [(scp_id, key, text) for key, text in (record.get('content') or {}).items() if text is not None])
+    return 'updated' if exists else 'added'
+
+  def add(self, record: dict) -> bool:
+    """
+    Indexes one get_scp()/parse_scp() dictionary (or CompactSCP), replacing the SCP's old record. Returns False (and changes nothing) if the SCP is already indexed at the same revision.
+
+    Parameters:
+      record: The record to index.
+    """
+    with self._db:
+      return self._add(record) != 'unchanged'
+
+  def update(self, records: Iterable[dict]) -> dict:
+    """
+    Indexes many records in one transaction, skipping the ones already indexed at the same revision. Returns how many were added, updated and unchanged.
+
+    Parameters:
+      records: The records to index (ex. iter_scps(), or a JSONLReader's records).
+    """
+    counts = {'added': 0, 'updated': 0, 'unchanged': 0}
+
+    with self._db:
+      for record in records:
+        counts[self._add(record)] += 1
+    return counts
+
+  def remove(self, scp_id: int) -> None:
+    """Removes an SCP from the index."""
+    with self._db:
+      self._remove(scp_id)
+
+  def get(self, scp_id: int) -> dict:
+    """Returns the record indexed for an SCP. Raises KeyError if there isn't one."""
+    row = self._db.execute('SELECT record FROM scps WHERE id = ?', (scp_id,)).fetchone()
+    if row is None:
+      raise KeyError(scp_id)
+    return json.loads(row[0])
+
+  def _query(self, column: str, text: str, tags: list, section: str, min_rating: int, max_rating: int, limit: int) -> sqlite3.Cursor:
+    conditions, values = [], []
+
+    if text is not None:
+      if section is not None:
+        conditions.append('id IN (SELECT sections.scp_id FROM sections_fts JOIN sections ON sections.id = sections_fts.rowid WHERE sections_fts.text MATCH ? AND sections.key = ?)')
+        values += [text, section]
+      else:
+        conditions.append('id IN (SELECT sections.scp_id FROM sections_fts JOIN sections ON sections.id = sections_fts.rowid WHERE sections_fts.text MATCH ?)')
+        values.append(text)
+
+    if tags:
+      conditions.append(f"id IN (SELECT scp_tags.scp_id FROM tags JOIN scp_tags ON scp_tags.tag_id = tags.id WHERE tags.name IN ({', '.join('?' * len(tags))}))")
+      values += list(tags)
+
+    if min_rating is not None:
+      conditions.append('id IN (SELECT scp_id FROM ratings WHERE rating >= ?)')
+      values.append(min_rating)
+
+    if max_rating is not None:
+      conditions.append('id IN (SELECT scp_id FROM ratings WHERE rating <= ?)')
+      values.append(max_rating)
+
+    query = f'SELECT {column} FROM scps'
+    if conditions:
+      query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY id'
+    if limit is not None:
+      query += ' LIMIT ?'
+      values.append(limit)
+
+    return self._db.execute(query, values)
+
+  def ids(self, text: str=None, tags: list=[], section: str=None, min_rating: int=None, max_rating: int=None, limit: int=None) -> list:
+    """
+    Returns the numbers of the SCPs matching a query, in ID order. Every filter given has to match.
+
+    Parameters:
+      text: Full-text query over the sections, in SQLite's FTS5 syntax (ex. 'cold', 'cold AND "airtight container"' or 'contain*'). None (default) matches every SCP.
+      tags: Only match SCPs with at least one of these tags. An empty list (default) matches all tags.
+      section: Only look for `text` in sections with this name (ex. 'Special Containment Procedures'). None (default) looks in every section.
+      min_rating: Only match SCPs rated at least this much. Default: None
+      max_rating: Only match SCPs rated at most this much. Default: None
+      limit: Return at most this many SCPs. None (default) returns all of them.
+    """
+    return [row[0] for row in self._query('id', text, tags, section, min_rating, max_rating, limit)]
+
+  def search(self, text: str=None, tags: list=[], section: str=None, min_rating: int=None, max_rating: int=None, limit: int=None, compact: bool=False) -> list:
+    """
+    Returns the records of the SCPs matching a query, in ID order. Takes the same filters as ids().
+
+    Parameters:
+      compact: Set to True to return CompactSCP records instead of dictionaries. Default: False
+    """
+    records = [json.loads(row[0]) for row in self._query('record', text, tags, section, min_rating, max_rating, limit)]
+    return [CompactSCP.from_dict(record) for record in records] if compact else records
+
+  def tags(self) -> dict:
+    """Returns how many indexed SCPs have each tag."""
+    return dict(self._db.execute('SELECT tags.name, COUNT(*) FROM tags JOIN scp_tags ON scp_tags.tag_id = tags.id GROUP BY tags.name ORDER BY tags.name'))
+
+  def __contains__(self, scp_id: int) -> bool:
+    return self._db.execute('SELECT 1 FROM scps WHERE id = ?', (scp_id,)).fetchone() is not None
+
+  def __len__(self) -> int:
+    return self._db.execute('SELECT COUNT(*) FROM scps').fetchone()[0]
+
+  def close(self) -> None:
+    """Closes the database."""
+    self._db.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
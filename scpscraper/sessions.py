@@ -0,0 +1,247 @@
+import gzip, http.client, io, socket, ssl, threading, time, urllib.error, urllib.parse, zlib
+
+from scpscraper.cache import ResponseCache
+from scpscraper.concurrency import AdaptiveLimiter, RateLimiter, RetryPolicy, concurrency_limiter, rate_limiter, retry_policy
+from scpscraper.metrics import metrics
+
+class Response:
+  """
+  A fully-read HTTP response.
+
+  Attributes:
+    url: The URL the response came from (after following redirects).
+    status: The HTTP status code.
+    reason: The HTTP reason phrase.
+    headers: The response headers.
+    content: The (already decompressed) response body.
+  """
+  def __init__(self, url: str, status: int, reason: str, headers: http.client.HTTPMessage, content: bytes):
+    self.url = url
+    self.status = status
+    self.reason = reason
+    self.headers = headers
+    self.content = content
+
+  @property
+  def text(self) -> str:
+    """The response body decoded as UTF-8."""
+    return self.content.decode('utf-8', errors='replace')
+
+class Session:
+  """
+  Sends every request through a pool of keep-alive connections, so TCP/TLS setup is reused across requests. Thread-safe.
+
+  Parameters:
+    base_url: Where relative URLs are resolved against. Point this at a mirror or a local server to scrape that instead. Default: http://scp-wiki.wikidot.com
+    timeout: Socket timeout in seconds. Default: 30
+    pool_size: Maximum number of idle connections kept open per host. Default: 16
+    limiter: RateLimiter every request waits on. Default: scpscraper.rate_limiter
+    headers: Extra headers sent with every request. Default: None
+    cache: ResponseCache to serve and revalidate responses from. None (default) disables caching.
+    retry: RetryPolicy deciding which failed requests are retried and how long to wait first. A 429 or 503 holds back every request to that host, not just the one that got it. Default: scpscraper.retry_policy
+    concurrency: AdaptiveLimiter capping how many requests are in flight at once. Default: scpscraper.concurrency_limiter
+  """
+  max_redirects = 5
+
+  def __init__(self, base_url: str='http://scp-wiki.wikidot.com', timeout: float=30, pool_size: int=16, limiter: RateLimiter=rate_limiter, headers: dict=None, cache: ResponseCache=None, retry: RetryPolicy=retry_policy, concurrency: AdaptiveLimiter=concurrency_limiter):
+    self.base_url = base_url
+    self.timeout = timeout
+    self.pool_size = pool_size
+    self.limiter = limiter
+    self.cache = cache
+    self.retry = retry
+    self.concurrency = concurrency
+    self.headers = {
+      'User-Agent': 'scpscraper (+https://github.com/JaonHax/scp-scraper)',
+      'Accept-Encoding': 'gzip, deflate',
+      'Connection': 'keep-alive',
+    }
+    self.headers.update(headers or {})
+    self._pool = {}
+    self._lock = threading.Lock()
+
+  def url(self, path: str) -> str:
+    """Resolves a path (ex. /scp-002) against the base URL. Absolute URLs are returned unchanged."""
+    return urllib.parse.urljoin(self.base_url.rstrip('/') + '/', path)
+
+  def _connect(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+    if scheme == 'https':
+      return http.client.HTTPSConnection(netloc, timeout=self.timeout, context=ssl.create_default_context())
+    return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+  def _acquire(self, scheme: str, netloc: str):
+    with self._lock:
+      idle = self._pool.get((scheme, netloc))
+      if idle:
+        return idle.pop(), True
+    return self._connect(scheme, netloc), False
+
+  def _release(self, scheme: str, netloc: str, conn: http.client.HTTPConnection) -> None:
+    with self._lock:
+      idle = self._pool.setdefault((scheme, netloc), [])
+      if len(idle) < self.pool_size:
+        idle.append(conn)
+        return
+    conn.close()
+
+  @staticmethod
+  def _decode(headers: http.client.HTTPMessage, body: bytes) -> bytes:
+    encoding = (headers.get('Content-Encoding') or '').strip().lower()
+    if encoding == 'gzip':
+      return gzip.decompress(body)
+    if encoding == 'deflate':
+      try:
+        return zlib.decompress(body)
+
+      # Some servers send raw deflate data without the zlib header.
+      except zlib.error:
+        return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+  def _send(self, url: str, headers: dict) -> Response:
+    parts = urllib.parse.urlsplit(url)
+    target = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+    while True:
+      conn, reused = self._acquire(parts.scheme, parts.netloc)
+      try:
+        conn.request('GET', target, headers=headers)
+        r = conn.getresponse()
+        body = r.read()
+
+      # A pooled connection may have been closed by the server while it sat idle, so retry those once on a fresh one.
+      except (http.client.HTTPException, ConnectionError):
+        conn.close()
+        if reused:
+          continue
+        raise
+
+      except Exception:
+        conn.close()
+        raise
+
+      if r.will_close:
+        conn.close()
+      else:
+        self._release(parts.scheme, parts.netloc, conn)
+
+      return Response(url, r.status, r.reason, r.headers, self._decode(r.headers, body))
+
+  def request(self, path: str, headers: dict=None) -> Response:
+    """
+    Sends a GET request and returns the Response, whatever its status code. Follows redirects.
+
+    If the session has a cache, fresh cached responses are returned without touching the network, and stale ones are revalidated.
+
+    Parameters:
+      path: Path (relative to base_url) or absolute URL to request.
+      headers: Extra headers for this request only. Default: None
+    """
+    url = self.url(path)
+    all_headers = dict(self.headers)
+    all_headers.update(headers or {})
+
+    if self.cache is None:
+      return self._fetch(url, all_headers)
+
+    cached = self.cache.get(url)
+    if cached is not None:
+      meta, body = cached
+      if self.cache.is_fresh(meta):
+        return self._cached_response(meta, body)
+      all_headers.update(self.cache.validators(meta))
+
+    response = self._fetch(url, all_headers)
+
+    # The server says our copy is still good.
+    if response.status == 304 and cached is not None:
+      self.cache.refresh(url, meta)
+      return self._cached_response(meta, body)
+
+    if response.status == 200:
+      self.cache.put(url, response.url, response.headers, response.content)
+
+    return response
+
+  @staticmethod
+  def _cached_response(meta: dict, body: bytes) -> Response:
+    headers = http.client.HTTPMessage()
+    if meta.get('content_type'):
+      headers['Content-Type'] = meta['content_type']
+    return Response(meta['url'], 200, 'OK', headers, body)
+
+  def _fetch(self, url: str, headers: dict) -> Response:
+    attempt = 0
+
+    while True:
+      try:
+        response = self._follow(url, headers)
+
+      # Network errors (timeouts, dropped connections, etc.)
+      except Exception as e:
+        if not self.retry.should_retry(attempt, error=e):
+          raise
+        time.sleep(self.retry.delay(attempt))
+
+      else:
+        if not self.retry.should_retry(attempt, status=response.status):
+          return response
+
+        delay = self.retry.delay(attempt, response.headers.get('Retry-After'))
+        # The server wants us to slow down, so hold back every request to it, not just this one.
+        if response.status in (429, 503):
+          self.limiter.pause(url, delay)
+        else:
+          time.sleep(delay)
+
+      metrics.increment('retries')
+      attempt += 1
+
+  def _follow(self, url: str, headers: dict) -> Response:
+    for _ in range(self.max_redirects + 1):
+      self.limiter.wait(url)
+
+      throttled = False
+      self.concurrency.acquire()
+      try:
+        response = self._send(url, headers)
+        throttled = response.status in (429, 503)
+
+      # Timeouts mean the server is struggling too.
+      except (socket.timeout, TimeoutError):
+        throttled = True
+        raise
+
+      finally:
+        self.concurrency.release(throttled)
+
+      if response.status in (301, 302, 303, 307, 308) and response.headers.get('Location'):
+        url = urllib.parse.urljoin(url, response.headers['Location'])
+        continue
+
+      return response
+
+    raise urllib.error.HTTPError(url, response.status, 'Too many redirects', response.headers, io.BytesIO(response.content))
+
+  def get(self, path: str, headers: dict=None) -> Response:
+    """
+    Same as request(), but raises urllib.error.HTTPError for 4xx and 5xx responses.
+    """
+    response = self.request(path, headers)
+
+    if response.status >= 400:
+      raise urllib.error.HTTPError(response.url, response.status, response.reason, response.headers, io.BytesIO(response.content))
+
+    return response
+
+  def close(self) -> None:
+    """Closes every pooled connection."""
+    with self._lock:
+      pool, self._pool = self._pool, {}
+
+    for idle in pool.values():
+      for conn in idle:
+        conn.close()
+
+# Every page the scraper downloads goes through this session.
+session = Session()
@@ -0,0 +1,174 @@
+import gzip, io, json, mmap, os, re
+from typing import Iterator
+
+def _compress(data: bytes, compresslevel: int) -> bytes:
+  # A fixed mtime keeps the output the same from run to run.
+  buffer = io.BytesIO()
+  with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=compresslevel, mtime=0) as f:
+    f.write(data)
+  return buffer.getvalue()
+
+class ShardWriter:
+  """
+  Writes records to size-capped shard files, compressing each one on its own, along with an index of where every record starts.
+
+  Each record is a separate gzip member, so a shard as a whole is still an ordinary .gz file (ex. `zcat scps-00000.jsonl.gz` works), but any one record can be read back with a single seek without decompressing the rest.
+
+  Parameters:
+    directory: Where to write the shards and index. Created if it doesn't exist.
+    prefix: Name shared by the shards and the index (ex. scps -> scps-00000.jsonl.gz, scps.index.json). Default: scps
+    suffix: File extension of the shards. Default: .jsonl.gz
+    max_shard_bytes: Start a new shard once the current one reaches this size. Default: 64 MiB
+    compresslevel: gzip compression level, 1 to 9. Default: 6
+    append: Set to True to keep the shards and index already in the directory and add to them, starting a new shard. Otherwise they're deleted, so a smaller run doesn't leave stale shards from an earlier one behind. Default: False
+  """
+  def __init__(self, directory: str, prefix: str='scps', suffix: str='.jsonl.gz', max_shard_bytes: int=64 << 20, compresslevel: int=6, append: bool=False):
+    self.directory = directory
+    self.prefix = prefix
+    self.suffix = suffix
+    self.max_shard_bytes = max_shard_bytes
+    self.compresslevel = compresslevel
+    self.shards = []
+    self.index = {}
+    self._file = None
+
+    os.makedirs(directory, exist_ok=True)
+
+    # Pick up the existing shards, if we're adding to them.
+    path = os.path.join(directory, f'{prefix}.index.json')
+    if append and os.path.exists(path):
+      with open(path, 'r') as infile:
+        data = json.load(infile)
+      self.shards = data['shards']
+      self.index = {int(key): tuple(location) for key, location in data['records'].items()}
+
+    # Otherwise start from nothing, index included, so an interrupted run can't point at shards from an earlier one.
+    elif not append:
+      shard = re.compile(f'{re.escape(prefix)}-[0-9]{{5,}}{re.escape(suffix)}')
+      for name in os.listdir(directory):
+        if shard.fullmatch(name) or name == f'{prefix}.index.json':
+          os.remove(os.path.join(directory, name))
+
+  def _next_shard(self) -> None:
+    if self._file is not None:
+      self._file.close()
+
+    name = f'{self.prefix}-{len(self.shards):05d}{self.suffix}'
+    self.shards.append(name)
+    self._file = open(os.path.join(self.directory, name), 'wb')
+
+  def add(self, key: int, data: bytes) -> None:
+    """Compresses and appends a record. Adding the same key twice keeps the later record."""
+    if self._file is None or self._file.tell() >= self.max_shard_bytes:
+      self._next_shard()
+
+    frame = _compress(data, self.compresslevel)
+    self.index[int(key)] = (len(self.shards) - 1, self._file.tell(), len(frame))
+    self._file.write(frame)
+
+  def write_index(self) -> None:
+    """Writes the index file, making sure every record it points to is on disk. Called automatically by close()."""
+    if self._file is not None:
+      self._file.flush()
+
+    data = {
+      'shards': self.shards,
+      'records': {str(key): list(location) for key, location in sorted(self.index.items())},
+    }
+
+    path = os.path.join(self.directory, f'{self.prefix}.index.json')
+    with open(f'{path}.tmp', 'w') as outfile:
+      json.dump(data, outfile)
+    os.replace(f'{path}.tmp', path)
+
+  def close(self) -> None:
+    """Finishes the last shard and writes the index."""
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+    self.write_index()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+class ShardReader:
+  """
+  Reads records back from a ShardWriter's output. Shards are memory-mapped, so reading a record only touches its own bytes.
+
+  Parameters:
+    directory: Where the shards and index are.
+    prefix: Name shared by the shards and the index. Default: scps
+  """
+  def __init__(self, directory: str, prefix: str='scps'):
+    self.directory = directory
+
+    with open(os.path.join(directory, f'{prefix}.index.json'), 'r') as infile:
+      data = json.load(infile)
+
+    self.shards = data['shards']
+    self.index = {int(key): tuple(location) for key, location in data['records'].items()}
+    self._maps = {}
+
+  def _map(self, shard: int) -> mmap.mmap:
+    if shard not in self._maps:
+      with open(os.path.join(self.directory, self.shards[shard]), 'rb') as f:
+        self._maps[shard] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return self._maps[shard]
+
+  def get(self, key: int) -> bytes:
+    """Returns the decompressed record for a key. Raises KeyError if there isn't one."""
+    shard, offset, length = self.index[int(key)]
+    return gzip.decompress(self._map(shard)[offset:offset + length])
+
+  def keys(self) -> list:
+    """Returns every key, in ascending order."""
+    return sorted(self.index)
+
+  def __contains__(self, key: int) -> bool:
+    return int(key) in self.index
+
+  def __len__(self) -> int:
+    return len(self.index)
+
+  def __iter__(self) -> Iterator[tuple]:
+    """Yields `(key, record)` pairs in ascending key order."""
+    for key in self.keys():
+      yield key, self.get(key)
+
+  def close(self) -> None:
+    """Unmaps the shards."""
+    for m in self._maps.values():
+      m.close()
+    self._maps.clear()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+class JSONLReader(ShardReader):
+  """
+  Reads SCP records back from scrape_scps_jsonl()'s output.
+
+  Parameters:
+    directory: Where the shards and index are.
+    prefix: Name shared by the shards and the index. Default: scps
+  """
+  def get(self, key: int) -> dict:
+    """Returns the record for an SCP number. Raises KeyError if there isn't one."""
+    return json.loads(super().get(key))
+
+class HTMLReader(ShardReader):
+  """
+  Reads pages back from scrape_scps_html()'s archive, as the raw HTML that was downloaded.
+
+  Parameters:
+    directory: Where the shards and index are.
+    prefix: Name shared by the shards and the index. Default: pages
+  """
+  def __init__(self, directory: str, prefix: str='pages'):
+    super().__init__(directory, prefix)
@@ -0,0 +1,171 @@
+import array, hashlib, json, os
+
+class OutputSink:
+  """
+  Base class for where the bulk scrapers send their output. Usable as a context manager.
+
+  Output is addressed by name (ex. scp-descrips.txt), so a sink can write it to files, a database or anywhere else.
+  """
+  def write(self, name: str, text: str) -> None:
+    """Writes `text` to the output called `name`."""
+    raise NotImplementedError
+
+  def flush(self) -> None:
+    """Makes sure everything written so far has actually been stored."""
+    pass
+
+  def close(self) -> None:
+    """Flushes and releases whatever the sink holds open."""
+    self.flush()
+
+  def positions(self) -> dict:
+    """Returns a name -> position mapping to checkpoint, or an empty dictionary if the sink can't be resumed."""
+    return {}
+
+  def rewind(self, positions: dict) -> None:
+    """Drops everything written after the given positions (as returned by positions())."""
+    pass
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+class TextFileSink(OutputSink):
+  """
+  Writes each output to the text file of the same name, keeping every file open with a large write buffer.
+
+  Parameters:
+    filenames: The files to write to.
+    append: Set to True to add to the files instead of clearing them. Default: False
+    buffer_size: Write buffer size per file, in bytes. Default: 1 MiB
+    directory: Directory to keep the files in, created if it doesn't exist. Outputs are still addressed by file name alone. None (default) uses the current directory.
+  """
+  def __init__(self, filenames: list, append: bool=False, buffer_size: int=1 << 20, directory: str=None):
+    self.filenames = list(filenames)
+    self.directory = directory
+
+    if directory is not None:
+      os.makedirs(directory, exist_ok=True)
+
+    self._files = {name: open(os.path.join(directory or '', name), 'a' if append else 'w', buffering=buffer_size) for name in self.filenames}
+
+  def write(self, name: str, text: str) -> None:
+    self._files[name].write(text)
+
+  def flush(self) -> None:
+    for f in self._files.values():
+      f.flush()
+
+  def close(self) -> None:
+    for f in self._files.values():
+      f.close()
+
+  def positions(self) -> dict:
+    self.flush()
+    return {name: os.fstat(f.fileno()).st_size for name, f in self._files.items()}
+
+  def rewind(self, positions: dict) -> None:
+    self.flush()
+    for name, size in positions.items():
+      self._files[name].truncate(size)
+      self._files[name].seek(0, os.SEEK_END)
+
+class DedupSink(OutputSink):
+  """
+  Wraps another sink and drops duplicate output as it's written, remembering only an 8-byte hash of everything it has seen. Hashes are kept in the order they were seen too, so a resumed run can forget the ones seen after its checkpoint (see counts()).
+
+  Parameters:
+    sink: The sink to pass unique output on to.
+    mode: 'line' drops lines already written to the same output. 'record' drops whole writes (one SCP's section) already written to the same output. Default: line
+  """
+  def __init__(self, sink: OutputSink, mode: str='line'):
+    if mode not in ('line', 'record'):
+      raise ValueError(f"Unknown dedup mode {mode!r}! Must be 'line' or 'record'.")
+
+    self.sink = sink
+    self.mode = mode
+    self._seen = {}
+    self._order = {}
+    self._pending = {}
+
+  @staticmethod
+  def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+  def _unique(self, name: str, pieces: list) -> str:
+    seen = self._seen.setdefault(name, set())
+    order = self._order.setdefault(name, array.array('Q'))
+    unique = []
+
+    for piece in pieces:
+      digest = self._digest(piece)
+      if digest not in seen:
+        seen.add(digest)
+        order.append(digest)
+        unique.append(piece)
+
+    return ''.join(unique)
+
+  def write(self, name: str, text: str) -> None:
+    if self.mode == 'record':
+      text = self._unique(name, [text])
+
+    else:
+      # Lines can be split across writes, so hold on to the unfinished one.
+      lines = (self._pending.pop(name, '') + text).split('\n')
+      if lines[-1]:
+        self._pending[name] = lines[-1]
+      text = self._unique(name, [line + '\n' for line in lines[:-1]])
+
+    if text:
+      self.sink.write(name, text)
+
+  def flush(self) -> None:
+    self.sink.flush()
+
+  def close(self) -> None:
+    # The last line of an output doesn't need a newline to count.
+    for name in list(self._pending):
+      text = self._unique(name, [self._pending.pop(name)])
+      if text:
+        self.sink.write(name, text)
+
+    self.sink.close()
+
+  def positions(self) -> dict:
+    return self.sink.positions()
+
+  def rewind(self, positions: dict) -> None:
+    self._pending.clear()
+    self.sink.rewind(positions)
+
+  def counts(self) -> dict:
+    """Returns how many hashes have been seen for each output, to save with a checkpoint and pass to load() when resuming from it."""
+    return {name: len(order) for name, order in self._order.items()}
+
+  def save(self, path: str) -> None:
+    """Saves the hashes seen so far (in the order they were seen), so a resumed run keeps dropping the same duplicates."""
+    data = {name: order.tobytes().hex() for name, order in self._order.items()}
+
+    with open(f'{path}.tmp', 'w') as outfile:
+      json.dump({'mode': self.mode, 'seen': data}, outfile)
+    os.replace(f'{path}.tmp', path)
+
+  def load(self, path: str, counts: dict=None) -> None:
+    """
+    Loads hashes saved with save().
+
+    Parameters:
+      counts: counts() as of the checkpoint being resumed from. Hashes seen after it are forgotten, since the output they were written to has been rewound, even if they were saved before a crash stopped the checkpoint itself from being saved. None (default) loads every hash.
+    """
+    with open(path, 'r') as infile:
+      data = json.load(infile)
+
+    for name, digests in data['seen'].items():
+      order = array.array('Q', bytes.fromhex(digests))
+      if counts is not None:
+        del order[counts.get(name, 0):]
+      self._order[name] = order
+      self._seen[name] = set(order)
@@ -1,4 +1,35 @@
-import pytest, scpscraper
+import email.utils, gzip, importlib, json, socket, socketserver, sqlite3, sys, threading, time, urllib.error, pytest, scpscraper
+
+# The package re-binds `scpscraper.scpscraper` to itself, so grab the core module directly.
+core = importlib.import_module('scpscraper.scpscraper')
+
+# These talk to the real wiki. Every other test has to stay on this machine.
+_ONLINE_TESTS = {'test_get_name', 'test_scrape_scps', 'test_scps_html'}
+_LOCAL_HOSTS = {None, '', 'localhost', '127.0.0.1', '::1', b'localhost', b'127.0.0.1', b'::1'}
+_lookups = []
+_offline = threading.Event()
+
+def _audit(event, args):
+  # Scrapers swallow errors from worker threads, so lookups are noted down as well as refused.
+  if event == 'socket.getaddrinfo' and _offline.is_set() and args[0] not in _LOCAL_HOSTS:
+    _lookups.append(args[0])
+    raise OSError(f'Offline tests must not look up {args[0]!r}!')
+
+sys.addaudithook(_audit)
+
+@pytest.fixture(autouse=True)
+def offline(request):
+  if request.node.name in _ONLINE_TESTS:
+    yield
+    return
+
+  _lookups.clear()
+  _offline.set()
+  try:
+    yield
+  finally:
+    _offline.clear()
+  assert not _lookups, f'{request.node.name} looked up {sorted(set(map(str, _lookups)))} instead of staying offline!'
 
 def test_get_name():
   name_list = [None, 'classification [Blocked]', 'The "Living" Room', 'Biological Motherboard', 'The 12 Rusty Keys and the Door', 'Skeleton Key', 'Fountain of Youth', 'Abdominal Planet', 'Zombie Plague', 'Red Ice', 'Collars of Control', 'Sentient Civil War Memorial Statue', 'A Bad Composition', 'Blue Lady Cigarettes', 'The Concrete Man', 'Pipe Nightmare', 'Organism', 'Shadow Person', 'Super Ball', 'The Monster Pot', 'Unseen Mold', 'Skin Wyrm', 'The Morgue', 'Black Shuck', 'Game Show of Death', 'Worn Wardrobe', 'Afterschool Retention', 'The Vermin God', 'Knowledge', 'Daughter of Shadows', 'The Homunculus', 'What is Love?', "Brothers' Bride", 'The Missing Number', 'Obsidian Ritual Knife', 'Possessive Mask', 'The Reincarnation Pilgrimage of the Yazidi (Kiras Guhorîn)', 'Dwarf Star', 'The Everything Tree', 'Proboscis Engineers', "Evolution's Child", 'Broadcasting Patient', 'A Formerly Winged Horse', 'The Beatle', 'Fission Cannon', 'Atmospheric Converter', '"Predatory" Holly Bush', 'Microbial Mutagen', 'The Cursed SCP Number', 'Plague Doctor', 'To The Cleverest', 'Japanese Obstetrical Model', 'Traveling Train', 'Young Girl', 'Water Nymph', '[unknown]', 'A Beautiful Person', 'The Daily Grind', 'Heart of Darkness', 'Radioactive Mineral', 'Infernal Occult Skeleton', 'Auditory Mind Control', '"Quantum" Computer', '"The World\'s Best TothBrush"', 'Flawed von Neumann Structure', 'Destroyed Organic Catalyst', "Eric's Toy", "The Artist's Pen", 'The Wire Figure', 'Second Chance', 'Iron Wings', 'Degenerative Metamorphic Entity', 'The Foot of the Bed', '"Cain"', 'Quantum Woodlouse', 'Corrosive Snail', '"Able"', 'Rot Skull', 'Guilt', 'Old AI', 'Dark Form', 'Spontaneous Combustion Virus', '"Fernand" the Cannibal', 'An Abandoned Row Home', 'Static Tower', "drawn ''Cassy''", 'The Office of Dr. [REDACTED]', 'The Stairwell', 'The Lizard King', 'Tophet', "Apocorubik's Cube", 'Nostalgia', '"The Best of The 5th Dimension"', 'Red Sea Object', 'Miniature Event Horizon', 'Gun', 'The "Shy Guy"', 'Old Fairgrounds', 'Surgeon Crabs', 'The Portrait']
@@ -24,3 +55,844 @@ def test_scps_html():
   
   with open('scp-html.txt', 'r') as in_text:
     assert in_text.read() != '', f'scrape_scps() is not working properly! scp-html is empty!'
+
+def test_series_index(tmp_path):
+  html = '<html><body><div id="page-content"><ul><li><a href="/scp-002">SCP-002</a> - The "Living" Room</li><li><a href="/scp-003">SCP-003</a> - Biological Motherboard</li><li><a class="newpage" href="/scp-999">SCP-999</a> - [ACCESS DENIED]</li></ul></div></body></html>'
+  names = scpscraper.SeriesIndex.parse_series(scpscraper.BeautifulSoup(html, 'lxml'))
+  assert names == {2: 'The "Living" Room', 3: 'Biological Motherboard', 999: '[ACCESS DENIED]'}, 'SeriesIndex.parse_series() is not working properly!'
+  assert scpscraper.SeriesIndex.parse_missing(scpscraper.BeautifulSoup(html, 'lxml')) == {999}, 'SeriesIndex.parse_missing() is not working properly!'
+
+  # A saved index should be reusable without touching the series pages again.
+  index = scpscraper.SeriesIndex()
+  index._series[1] = {'fetched': 0, 'names': names}
+  index.save(str(tmp_path / 'series.json'))
+
+  loaded = scpscraper.SeriesIndex(path=str(tmp_path / 'series.json'))
+  loaded._fetch = None
+  assert loaded.get(3) == 'Biological Motherboard', 'SeriesIndex is not loading saved indexes properly!'
+
+  # A slow series page doesn't hold up lookups in series that are already indexed.
+  started, release = threading.Event(), threading.Event()
+  def slow_fetch(number):
+    started.set()
+    release.wait(5)
+    return {'names': {}, 'missing': set()}
+
+  loaded._fetch = slow_fetch
+  slow = threading.Thread(target=loaded.get, args=(1500,))
+  slow.start()
+  started.wait(5)
+  assert loaded.get(3) == 'Biological Motherboard' and slow.is_alive(), 'SeriesIndex is holding up lookups while downloading a series page!'
+  release.set()
+  slow.join()
+
+  # A series page that failed isn't downloaded again straight away.
+  calls = []
+  def failing_fetch(number):
+    calls.append(number)
+    raise OSError('series page unavailable')
+
+  loaded._fetch = failing_fetch
+  with pytest.raises(OSError):
+    loaded.get(2500)
+  for _ in range(2):
+    with pytest.raises(scpscraper.FetchFailedError) as error:
+      loaded.get(2500)
+    assert isinstance(error.value.__cause__, OSError), 'SeriesIndex is not chaining remembered failures to the original error!'
+  assert calls == [3], 'SeriesIndex is downloading a failed series page again for every lookup!'
+
+  # Tag pages get the same treatment.
+  tags = scpscraper.TagIndex()
+  tags._tags['safe'] = {'fetched': time.time(), 'ids': {1, 3}}
+  started.clear()
+  release.clear()
+  tags._fetch = lambda tag: slow_fetch(tag) and set()
+  slow = threading.Thread(target=tags.get, args=('keter',))
+  slow.start()
+  started.wait(5)
+  assert tags.get('safe') == {1, 3} and slow.is_alive(), 'TagIndex is holding up lookups while downloading a tag page!'
+  release.set()
+  slow.join()
+
+  calls.clear()
+  tags._fetch = failing_fetch
+  with pytest.raises(OSError):
+    tags.get('euclid')
+  with pytest.raises(scpscraper.FetchFailedError):
+    tags.get('euclid')
+  assert calls == ['euclid'], 'TagIndex is downloading a failed tag page again for every lookup!'
+
+def _fake_tags(scp_id):
+  return ['safe'] if scp_id % 2 else ['keter']
+
+def _fake_tag_page(tag):
+  return {i for i in range(100) if tag in _fake_tags(i)}
+
+def _fake_series(number):
+  # Every fake SCP is written, so planning doesn't drop any.
+  return {'names': {i: f'Fake Object {i}' for i in range(100)}, 'missing': set()}
+
+def _fake_scp(scp_id, engine=None):
+  return {
+    'id': scp_id,
+    'name': f'Fake Object {scp_id}',
+    'content': {
+      'Item #': f'SCP-{scp_id:03d}',
+      'Special Containment Procedures': f'Keep SCP-{scp_id:03d} in a box.',
+      'Description': f'SCP-{scp_id:03d} is object number {scp_id}.',
+      'Addendum 1': 'Nothing to report.',
+    },
+    'tags': _fake_tags(scp_id),
+  }
+
+def test_scrape_scps_workers(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  monkeypatch.setattr(core, 'get_scp', _fake_scp)
+  monkeypatch.setattr(scpscraper.series_index, '_fetch', _fake_series)
+  scpscraper.series_index.clear()
+  filelist = ['scp-descrips.txt', 'scp-conprocs.txt', 'scp-titles.txt', 'scp-addenda.txt']
+
+  outputs = []
+  for workers in (1, 4):
+    scpscraper.scrape_scps(0, 40, workers=workers)
+    outputs.append([open(f).read() for f in filelist])
+
+  assert outputs[0][0] != '', 'scrape_scps() is not working properly! scp-descrips.txt is empty!'
+  assert outputs[0] == outputs[1], 'scrape_scps() output depends on the number of workers!'
+  scpscraper.series_index.clear()
+
+def _wiki_page(path, revision=1):
+  """Returns a page laid out like the SCP wiki's, for /scp-NNN, /scp-series and /system:page-tags/tag/TAG paths."""
+  if path.startswith('/scp-series'):
+    # The last few slots aren't written yet.
+    items = ''.join(f'<li><a href="/scp-{i:03d}">SCP-{i:03d}</a> - Fake Object {i}</li>' for i in range(95))
+    items += ''.join(f'<li><a class="newpage" href="/scp-{i:03d}">SCP-{i:03d}</a> - [ACCESS DENIED]</li>' for i in range(95, 100))
+    return f'<html><body><div id="page-content"><ul>{items}</ul></div></body></html>'
+
+  if path.startswith('/system:page-tags/tag/'):
+    items = ''.join(f'<div class="pages-list-item"><div class="title"><a href="/scp-{i:03d}">SCP-{i:03d}</a></div></div>' for i in range(100) if path.endswith(_fake_tags(i)[0]) or path.endswith('/scp'))
+    return f'<html><body><div id="page-content"><div id="tagged-pages-list">{items}<div class="pages-list-item"><div class="title"><a href="/scp-002-j">SCP-002-J</a></div></div></div></div></body></html>'
+
+  scp_id = path.rsplit('-', 1)[-1]
+  return f'''<html><head><title>SCP-{scp_id}</title></head><body>
+<div id="side-bar"><ul><li><a href="/scp-series">Series I</a></li></ul></div>
+<div id="main-content">
+<div class="page-rate-widget-box"><span class="rate-points">rating:&nbsp;<span class="number prw54353">+{int(scp_id) * 3}</span></span></div>
+<div id="page-content">
+<div class="scp-image-block block-right" style="width:300px;"><img src="http://scp-wiki.wdfiles.com/local--files/scp-{scp_id}/image.jpg" style="width:300px;" alt="image.jpg" class="image" />
+<div class="scp-image-caption" style="width:300px;">
+<p>SCP-{scp_id} in containment.</p>
+</div>
+</div>
+<p><strong>Item #:</strong> SCP-{scp_id}</p>
+<p><strong>Object Class:</strong> {'Safe' if int(scp_id) % 2 else 'Keter'}</p>
+<p><strong>Special Containment Procedures:</strong> SCP-{scp_id} is to be kept in a <em>locked</em> box.</p>
+<p>Personnel are not to open the box containing SCP-{scp_id}.</p>
+<p><strong>Description:</strong> SCP-{scp_id} is a box. Revision {revision}.</p>
+<p>It is <a href="/scp-173">not</a> SCP-173.</p>
+<p><strong>Addendum {scp_id}-1:</strong> Nothing happened.</p>
+</div>
+<div class="page-tags"><span><a href="/system:page-tags/tag/{'safe' if int(scp_id) % 2 else 'keter'}">{'safe' if int(scp_id) % 2 else 'keter'}</a><a href="/system:page-tags/tag/scp">scp</a></span></div>
+<div id="page-info">page revision: {revision}, last edited: <span class="odate time_{1600000000 + revision} format_%25e%20%25b%20%25Y%2C%20%25H%3A%25M%7Cagohover">17 Sep 2020</span></div>
+<div id="page-options-bottom"><a id="discuss-button" href="/forum/t-{scp_id}/scp-{scp_id}">Discuss</a></div>
+</div></body></html>'''
+
+class _LocalWiki:
+  """Serves generated pages from a local HTTP server, with gzip and ETag support. `page(path)` returns a page's HTML, or a status code to fail with."""
+  def __init__(self, page=_wiki_page):
+    import http.server
+
+    wiki = self
+    self.page = page
+    self.connections = set()
+    self.requests = []
+    self.not_modified = 0
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def do_GET(self):
+        wiki.connections.add(self.client_address)
+        wiki.requests.append(self.path)
+        etag = f'"{self.path}"'
+
+        if self.headers.get('If-None-Match') == etag:
+          wiki.not_modified += 1
+          self.send_response(304)
+          self.send_header('Content-Length', '0')
+          self.end_headers()
+          return
+
+        page = wiki.page(self.path)
+
+        # Pages can be given as a bare status code to answer with instead.
+        if isinstance(page, int):
+          self.send_response(page)
+          self.send_header('Content-Length', '0')
+          self.end_headers()
+          return
+
+        body = gzip.compress(page.encode())
+        self.send_response(200)
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, *args):
+        pass
+
+    class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+      daemon_threads = True
+
+    self.server = Server(('127.0.0.1', 0), Handler)
+    self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+  def __enter__(self):
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    return self
+
+  def __exit__(self, *args):
+    scpscraper.session.close()
+    self.server.shutdown()
+    self.server.server_close()
+
+def test_session(monkeypatch):
+  with _LocalWiki() as wiki:
+    monkeypatch.setattr(scpscraper.session, 'base_url', wiki.url)
+    for scp_id in ('002', '003', '004'):
+      soup = scpscraper.get_single_scp(scp_id)
+      assert f'SCP-{scp_id} is a box.' in soup.find('div', id='page-content').text, 'get_single_scp() is not using the session properly!'
+
+    assert len(wiki.connections) == 1, 'Session is not reusing its connections!'
+
+def test_response_cache(tmp_path, monkeypatch):
+  with _LocalWiki() as wiki:
+    monkeypatch.setattr(scpscraper.session, 'base_url', wiki.url)
+    monkeypatch.setattr(scpscraper.session, 'cache', scpscraper.ResponseCache(str(tmp_path / 'cache'), max_bytes=int(4.5 * len(_wiki_page('/scp-002'))), max_age=None))
+
+    first = scpscraper.session.get('/scp-002').content
+    second = scpscraper.session.get('/scp-002').content
+    assert first == second and wiki.not_modified == 1, 'ResponseCache is not revalidating properly!'
+
+    # Fresh entries shouldn't touch the network at all.
+    scpscraper.session.cache.max_age = 60
+    scpscraper.session.get('/scp-002')
+    assert len(wiki.requests) == 2, 'ResponseCache is not serving fresh responses from disk!'
+
+    # Filling the cache past max_bytes should evict the least recently used page.
+    for scp_id in ('003', '004', '005', '006'):
+      scpscraper.session.get(f'/scp-{scp_id}')
+    assert scpscraper.session.cache.get(scpscraper.session.url('/scp-002')) is None, 'ResponseCache is not evicting old responses!'
+    assert scpscraper.session.cache._size <= scpscraper.session.cache.max_bytes * scpscraper.session.cache.low_water, 'ResponseCache is not evicting down to its low-water mark!'
+
+    # Reopening the cache picks up the same entries, least recently used first.
+    reopened = scpscraper.ResponseCache(str(tmp_path / 'cache'))
+    assert reopened._size == scpscraper.session.cache._size and list(reopened._entries) == list(scpscraper.session.cache._entries), 'ResponseCache is not reloading its entries properly!'
+
+    # Revalidating the same page from many threads at once shouldn't trip over the other threads' writes.
+    cache = scpscraper.session.cache
+    url = scpscraper.session.url('/scp-006')
+    meta, body = cache.get(url)
+    errors = []
+    def revalidate():
+      try:
+        for _ in range(50):
+          cache.refresh(url, meta)
+          cache.put(url, meta['url'], {}, body)
+      except Exception as e:
+        errors.append(e)
+
+    threads = [threading.Thread(target=revalidate) for _ in range(8)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    assert not errors and cache.get(url) is not None, 'ResponseCache is not safe to revalidate from several threads!'
+    assert not list((tmp_path / 'cache').glob('*.tmp')), 'ResponseCache is leaving temporary files behind!'
+
+def test_scrape_scps_manifest(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  filelist = ['scp-descrips.txt', 'scp-conprocs.txt', 'scp-titles.txt', 'scp-addenda.txt']
+  revisions = {}
+  parsed = []
+  parse_scp = core.parse_scp
+  monkeypatch.setattr(core, 'parse_scp', lambda soup, scp_id, *args: parsed.append(scp_id) or parse_scp(soup, scp_id, *args))
+
+  with _LocalWiki(lambda path: _wiki_page(path, revisions.get(path, 1))) as wiki:
+    monkeypatch.setattr(scpscraper.session, 'base_url', wiki.url)
+    scpscraper.series_index.clear()
+
+    scpscraper.scrape_scps(0, 10)
+    full = [open(f).read() for f in filelist]
+    assert 'SCP-005 is a box.' in full[0], 'scrape_scps() is not working properly!'
+
+    scpscraper.scrape_scps(0, 10, manifest='scp-manifest.json')
+    del parsed[:]
+
+    # Only the edited page should get parsed again.
+    revisions['/scp-004'] = 2
+    scpscraper.scrape_scps(0, 10, manifest='scp-manifest.json')
+    assert parsed == [4], 'Incremental scrape_scps() is re-parsing unchanged pages!'
+    assert [open(f).read() for f in filelist] == [text.replace('SCP-004 is a box. Revision 1.', 'SCP-004 is a box. Revision 2.') for text in full], 'Incremental scrape_scps() output differs from a full run!'
+
+  # Saving only appends what changed, and closing compacts the manifest back to a line per SCP.
+  manifest = scpscraper.Manifest('scp-manifest.json')
+  assert len(open('scp-manifest.json').readlines()) == 10, 'Manifest is not compacted when a scrape finishes!'
+  manifest.update(4, dict(manifest.get(4, 2), revision=3))
+  manifest.save()
+  assert len(open('scp-manifest.json').readlines()) == 11, 'Manifest.save() is not appending to the manifest!'
+  manifest.close()
+  assert len(open('scp-manifest.json').readlines()) == 10 and scpscraper.Manifest('scp-manifest.json').get(4, 3) is not None, 'Manifest.close() is not compacting the manifest properly!'
+
+  # Truncated or hand-edited lines are skipped instead of breaking the load.
+  with open('scp-manifest.json', 'a') as outfile:
+    outfile.write('{"revision": 5, "last_edited": 0}\n[1, 2]\n"text"\n{"id": "x", "revision": 1, "last_edited": 0, "record": {}}\n{"id": 7, "rev')
+  assert len(scpscraper.Manifest('scp-manifest.json')._entries) == 10, 'Manifest is not skipping bad lines!'
+
+  scpscraper.series_index.clear()
+
+def test_scrape_scps_resume(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  monkeypatch.setattr(scpscraper.series_index, '_fetch', _fake_series)
+  scpscraper.series_index.clear()
+  filelist = ['scp-descrips.txt', 'scp-conprocs.txt', 'scp-titles.txt', 'scp-addenda.txt']
+
+  monkeypatch.setattr(core, 'get_scp', _fake_scp)
+  scpscraper.scrape_scps(0, 40)
+  full = [open(f).read() for f in filelist]
+
+  class Crash(BaseException):
+    pass
+
+  def crashing_scp(scp_id, engine=None):
+    if scp_id == 25:
+      raise Crash()
+    return _fake_scp(scp_id)
+
+  monkeypatch.setattr(core, 'get_scp', crashing_scp)
+  with pytest.raises(Crash):
+    scpscraper.scrape_scps(0, 40, checkpoint_every=10)
+  assert scpscraper.Checkpoint('scp-checkpoint.json').load()['next_id'] == 20, 'scrape_scps() is not checkpointing properly!'
+
+  monkeypatch.setattr(core, 'get_scp', _fake_scp)
+  scpscraper.scrape_scps(0, 40, resume=True, checkpoint_every=10)
+  assert [open(f).read() for f in filelist] == full, 'Resumed scrape_scps() output differs from a full run!'
+  assert not (tmp_path / 'scp-checkpoint.json').exists(), 'scrape_scps() is not removing its checkpoint when done!'
+
+  # A crash after the dedup hashes are saved but before the checkpoint is shouldn't drop the lines written since the last checkpoint.
+  save = core.Checkpoint.save
+  def crashing_save(self, min_skip, max_skip, next_id, *args):
+    if next_id == 20:
+      raise Crash()
+    save(self, min_skip, max_skip, next_id, *args)
+
+  monkeypatch.setattr(core.Checkpoint, 'save', crashing_save)
+  with pytest.raises(Crash):
+    scpscraper.scrape_scps(0, 40, checkpoint_every=10)
+  monkeypatch.setattr(core.Checkpoint, 'save', save)
+  scpscraper.scrape_scps(0, 40, resume=True, checkpoint_every=10)
+  assert [open(f).read() for f in filelist] == full, 'Resumed scrape_scps() is dropping lines whose hashes were saved after the checkpoint!'
+
+  # SCPs that failed after the checkpoint shouldn't be listed twice once resumed.
+  def failing_scp(scp_id, engine=None):
+    if scp_id % 7 == 0:
+      raise ValueError('no page')
+    return _fake_scp(scp_id)
+
+  monkeypatch.setattr(core, 'get_scp', lambda scp_id, engine=None: crashing_scp(scp_id) if scp_id == 25 else failing_scp(scp_id))
+  with pytest.raises(Crash):
+    scpscraper.scrape_scps(0, 40, checkpoint_every=10, failed_file='failed.txt')
+
+  monkeypatch.setattr(core, 'get_scp', failing_scp)
+  scpscraper.scrape_scps(0, 40, resume=True, checkpoint_every=10, failed_file='failed.txt')
+  assert open('failed.txt').read().split() == ['0', '7', '14', '21', '28', '35'], 'Resumed scrape_scps() is listing failed SCPs twice!'
+  scpscraper.series_index.clear()
+
+def test_output_sink(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  monkeypatch.setattr(core, 'get_scp', _fake_scp)
+  monkeypatch.setattr(scpscraper.tag_index, '_fetch', _fake_tag_page)
+  monkeypatch.setattr(scpscraper.series_index, '_fetch', _fake_series)
+  scpscraper.tag_index.clear()
+  scpscraper.series_index.clear()
+
+  class MemorySink(scpscraper.OutputSink):
+    def __init__(self):
+      self.outputs = {}
+
+    def write(self, name, text):
+      self.outputs[name] = self.outputs.get(name, '') + text
+
+  sink = MemorySink()
+  scpscraper.scrape_scps(0, 10, tags=['keter'], sink=sink)
+  assert not (tmp_path / 'scp-descrips.txt').exists(), 'scrape_scps() is writing files when given a sink!'
+
+  scpscraper.scrape_scps(0, 10, tags=['keter'])
+  assert sink.outputs['scp-titles.txt'] == open('scp-titles.txt').read(), 'scrape_scps() is not writing to sinks properly!'
+  scpscraper.series_index.clear()
+  scpscraper.tag_index.clear()
+
+def test_dedup_sink(tmp_path):
+  writes = ['Description: a\n\n', 'Description: b\n', '\n', 'Descr', 'iption: a\n', '\nlast line', ' without newline']
+
+  # What the old rewrite-copy pass would have produced.
+  expected, seen = [], set()
+  for line in ''.join(writes).splitlines(keepends=True):
+    if line not in seen:
+      expected.append(line)
+      seen.add(line)
+
+  with scpscraper.DedupSink(scpscraper.TextFileSink([str(tmp_path / 'out.txt')])) as sink:
+    for text in writes:
+      sink.write(str(tmp_path / 'out.txt'), text)
+  assert open(tmp_path / 'out.txt').read() == ''.join(expected), 'DedupSink is not removing duplicate lines properly!'
+
+  with scpscraper.DedupSink(scpscraper.TextFileSink([str(tmp_path / 'out.txt')]), 'record') as sink:
+    for text in ['SCP-002\n\n', 'SCP-003\n\n', 'SCP-002\n\n']:
+      sink.write(str(tmp_path / 'out.txt'), text)
+  assert open(tmp_path / 'out.txt').read() == 'SCP-002\n\nSCP-003\n\n', 'DedupSink is not removing duplicate records properly!'
+
+def test_parse_scp_engines():
+  page = _wiki_page('/scp-005', 3)
+  variants = [
+    page,
+    page.replace('<div class="scp-image-block', '<div class="not-an-image-block'),
+    page.replace('<p><strong>Item #:</strong>', '<p><!-- note --><strong>Item #:</strong>'),
+    page.replace('<p>SCP-005 in containment.</p>', '<p><em>SCP-005</em> in containment.</p>'),
+    page.replace('<span class="rate-points">', '<span class="rating">'),
+    page.replace('is a box. Revision 3.', 'is a <strong>box</strong>.\n<br />Revision 3. \u2028 Caf\u00e9'),
+    page.replace('<a href="/system:page-tags/tag/scp">scp</a>', '<a href="/system:page-tags/tag/scp">scp</a>\n<a href="/system:page-tags/tag/_cc">_cc</a>'),
+  ]
+
+  for html in variants:
+    expected = scpscraper.parse_scp(html.encode('utf-8'), 5, engine='bs4')
+    assert scpscraper.parse_scp(html.encode('utf-8'), 5, engine='lxml') == expected, 'The lxml parse_scp() engine does not match the bs4 one!'
+    assert scpscraper.parse_scp(scpscraper.BeautifulSoup(html, 'lxml'), 5) == expected, 'parse_scp() is not parsing BeautifulSoup objects properly!'
+
+  # Pages that aren't laid out like SCP pages raise the same error with both engines.
+  broken = [
+    page.replace('id="page-content"', 'id="not-page-content"'),
+    page.replace('<strong>Item #:</strong> SCP-005', '<strong>Item #:</strong><em>SCP-005</em>'),
+  ]
+
+  for html in broken:
+    for engine in scpscraper.PARSER_ENGINES:
+      with pytest.raises(scpscraper.ParseError):
+        scpscraper.parse_scp(html.encode('utf-8'), 5, engine=engine)
+
+  # Fields that don't need the page-content div still work without one.
+  assert scpscraper.parse_scp(broken[0].encode('utf-8'), 5, engine='lxml', fields=['tags'])['tags'] == ['safe', 'scp'], 'parse_scp() is raising for fields nobody asked for!'
+
+def test_scrape_scps_pipeline(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  filelist = ['scp-descrips.txt', 'scp-conprocs.txt', 'scp-titles.txt', 'scp-addenda.txt']
+
+  with _LocalWiki() as wiki:
+    monkeypatch.setattr(scpscraper.session, 'base_url', wiki.url)
+    scpscraper.series_index.clear()
+
+    outputs = []
+    for kwargs in ({}, {'workers': 3, 'parse_workers': 2}, {'workers': 3, 'parse_workers': 2, 'manifest': 'scp-manifest.json'}, {'parse_workers': 2, 'manifest': 'scp-manifest.json', 'ai_dataset': True}):
+      scpscraper.scrape_scps(0, 20, **kwargs)
+      outputs.append([open(f).read() for f in filelist])
+
+  scpscraper.series_index.clear()
+  assert outputs[0][0] != '', 'scrape_scps() is not working properly!'
+  assert outputs[0] == outputs[1] == outputs[2], 'scrape_scps() output differs when parsing on a process pool!'
+  assert 'SCP-XXXX is a box.' in outputs[3][0], 'scrape_scps() is not reusing manifest records properly on a process pool!'
+
+def test_iter_scps(monkeypatch):
+  with _LocalWiki() as wiki:
+    monkeypatch.setattr(scpscraper.session, 'base_url', wiki.url)
+    scpscraper.series_index.clear()
+    scpscraper.tag_index.clear()
+
+    records = scpscraper.iter_scps(range(0, 10), tags=['keter'], fields=['name', 'tags'], workers=2)
+    assert next(records) == {'id': 0, 'name': 'Fake Object 0', 'tags': ['keter', 'scp']}, 'iter_scps() is not yielding records properly!'
+    assert [record['id'] for record in records] == [2, 4, 6, 8], 'iter_scps() is not filtering tags properly!'
+    assert next(scpscraper.iter_scps(3))['content']['Object Class'] == 'Safe', 'iter_scps() is not accepting single IDs!'
+
+  scpscraper.series_index.clear()
+
+def test_scrape_scps_jsonl(monkeypatch, tmp_path):
+  with _LocalWiki() as wiki:
+    monkeypatch.setattr(scpscraper.session, 'base_url', wiki.url)
+    scpscraper.series_index.clear()
+    scpscraper.tag_index.clear()
+
+    output_dir = str(tmp_path / 'jsonl')
+    scpscraper.scrape_scps_jsonl(0, 10, tags=['safe'], output_dir=output_dir, shard_size=1, workers=2)
+    expected = scpscraper.get_scp(5)
+
+  with scpscraper.JSONLReader(output_dir) as reader:
+    assert reader.keys() == [1, 3, 5, 7, 9], 'scrape_scps_jsonl() is not filtering tags properly!'
+    assert len(reader.shards) == 5, 'scrape_scps_jsonl() is not splitting shards properly!'
+    assert reader.get(5) == expected, 'JSONLReader is not reading records back properly!'
+
+    # Each shard should still be an ordinary gzipped JSON Lines file.
+    with gzip.open(tmp_path / 'jsonl' / reader.shards[2], 'rt') as shard:
+      assert shard.read() == json.dumps(expected, ensure_ascii=False) + '\n', 'scrape_scps_jsonl() is not writing valid JSON Lines!'
+
+  scpscraper.series_index.clear()
+
+def test_tag_prefilter(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+
+  with _LocalWiki() as wiki:
+    monkeypatch.setattr(scpscraper.session, 'base_url', wiki.url)
+    scpscraper.series_index.clear()
+    scpscraper.tag_index.clear()
+
+    scpscraper.scrape_scps(0, 20, tags=['safe'], workers=2, tag_cache='tags.json')
+    fetched = sorted(path for path in wiki.requests if path.startswith('/scp-0'))
+    assert fetched == [f'/scp-{i:03d}' for i in range(1, 20, 2)], 'scrape_scps() is downloading SCPs without the requested tags!'
+    assert scpscraper.TagIndex(path='tags.json').get('safe') == set(range(1, 100, 2)), 'TagIndex is not saving or parsing tag pages properly!'
+
+    # A stale tag page can list SCPs that don't have the tag anymore, so pages are still checked.
+    scpscraper.tag_index._tags['safe']['ids'].add(4)
+    scpscraper.scrape_scps_html(0, 6, tags=['safe'])
+    assert open('scp-html.txt').read().count('<div id="page-content">') == 3, 'scrape_scps_html() is not checking tags on downloaded pages!'
+
+  scpscraper.series_index.clear()
+  scpscraper.tag_index.clear()
+
+def test_plan_scps(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+
+  with _LocalWiki() as wiki:
+    monkeypatch.setattr(scpscraper.session, 'base_url', wiki.url)
+    scpscraper.series_index.clear()
+    scpscraper.tag_index.clear()
+
+    plan = scpscraper.plan_scps(range(80, 100), tags=['keter'])
+    assert (plan.ids, plan.skipped_tags, plan.skipped_missing) == ([80, 82, 84, 86, 88, 90, 92, 94], 10, 2), 'plan_scps() is not planning properly!'
+
+    plan = scpscraper.scrape_scps_html(90, 100)
+    fetched = sorted(path for path in wiki.requests if path.startswith('/scp-0'))
+    assert fetched == [f'/scp-{i:03d}' for i in range(90, 95)], "scrape_scps_html() is downloading SCPs that aren't written yet!"
+    assert plan.skipped == 5, 'scrape_scps_html() is not reporting skipped downloads properly!'
+    assert open('scp-html.txt').read().count('<div id="page-content">') == 5, 'scrape_scps_html() is not writing planned SCPs properly!'
+
+  # IDs are kept when their series page can't be grabbed, and the plan says so.
+  def failing_series(number):
+    raise OSError('series page unavailable')
+
+  scpscraper.series_index.clear()
+  monkeypatch.setattr(scpscraper.series_index, '_fetch', failing_series)
+  plan = scpscraper.plan_scps(range(90, 100))
+  assert (plan.ids, plan.skipped_missing, plan.unchecked_missing, plan.failed_series) == (list(range(90, 100)), 0, 10, [1]), 'plan_scps() is not reporting series pages it failed to grab!'
+
+  scpscraper.series_index.clear()
+  scpscraper.tag_index.clear()
+
+def test_metrics(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  monkeypatch.setattr(scpscraper.metrics, 'prometheus_file', str(tmp_path / 'scpscraper.prom'))
+  monkeypatch.setattr(scpscraper.retry_policy, 'retries', 0)
+  scpscraper.metrics.reset()
+
+  def page(path):
+    # SCP-003 is throttled and SCP-005 is missing everything that gets parsed.
+    if path == '/scp-003':
+      return 429
+    if path == '/scp-005':
+      return '<html><body><div id="page-content"></div></body></html>'
+    return _wiki_page(path)
+
+  traces = []
+  hook = lambda scp_id, stage, seconds, error: traces.append((scp_id, stage, error))
+  scpscraper.metrics.add_trace_hook(hook)
+
+  try:
+    with _LocalWiki(page) as wiki:
+      monkeypatch.setattr(scpscraper.session, 'base_url', wiki.url)
+      scpscraper.series_index.clear()
+      scpscraper.scrape_scps(0, 8, workers=2, metrics_file='metrics.json')
+
+  finally:
+    scpscraper.metrics.remove_trace_hook(hook)
+    scpscraper.series_index.clear()
+
+  with open('metrics.json') as infile:
+    summary = json.load(infile)
+
+  assert summary['errors']['fetch'] == {'http_429': 1}, 'Metrics are not counting fetch errors by class!'
+  assert sum(summary['errors']['parse'].values()) == 1, 'Metrics are not counting parse errors!'
+  assert summary['timings']['fetch']['count'] == 8 and summary['timings']['write']['count'] == 6, 'Metrics are not timing stages properly!'
+  assert (summary['counters']['scps_grabbed'], summary['counters']['scps_failed']) == (6, 2), 'Metrics are not counting grabbed SCPs properly!'
+  assert ('003', 'fetch', 'http_429') in traces, 'Metrics are not calling trace hooks properly!'
+  assert 'scpscraper_errors_total{stage="fetch",class="http_429"} 1' in open('scpscraper.prom').read(), 'Metrics are not writing the Prometheus file properly!'
+
+  # Local I/O errors aren't blamed on the network.
+  classes = [scpscraper.error_class(e) for e in (ConnectionResetError(), urllib.error.URLError('unreachable'), socket.gaierror(), OSError(28, 'No space left on device'), PermissionError())]
+  assert classes == ['connection', 'connection', 'connection', 'io', 'io'], 'error_class() is not telling network errors from local ones!'
+
+def test_retries(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  monkeypatch.setattr(scpscraper.retry_policy, 'backoff', 0.001)
+
+  attempts = {}
+  def page(path):
+    attempts[path] = attempts.get(path, 0) + 1
+
+    # SCP-002 is throttled twice before going through, and SCP-004 never does.
+    if path == '/scp-002' and attempts[path] <= 2:
+      return 503
+    if path == '/scp-004':
+      return 500
+    return _wiki_page(path)
+
+  try:
+    with _LocalWiki(page) as wiki:
+      monkeypatch.setattr(scpscraper.session, 'base_url', wiki.url)
+      scpscraper.series_index.clear()
+      scpscraper.scrape_scps(0, 6, workers=2, adaptive=True, failed_file='failed.txt')
+
+  finally:
+    scpscraper.concurrency_limiter.reset(None)
+    scpscraper.series_index.clear()
+
+  assert 'SCP-002 is a box.' in open('scp-descrips.txt').read(), 'Session is not retrying throttled requests!'
+  assert attempts['/scp-004'] == 1 + scpscraper.retry_policy.retries, 'Session is not giving up after its retries!'
+  assert open('failed.txt').read() == '4\n', 'scrape_scps() is not listing failed SCPs properly!'
+
+  policy = scpscraper.RetryPolicy()
+  assert policy.delay(0, '5') == 5 and policy.delay(0, '600') == policy.max_delay, 'RetryPolicy is not honouring Retry-After properly!'
+  assert 0 < policy.parse_retry_after(email.utils.formatdate(time.time() + 30, usegmt=True)) <= 30, 'RetryPolicy is not reading Retry-After dates properly!'
+
+  # A burst of throttled requests should only back off once, and clean requests should ramp back up.
+  limiter = scpscraper.AdaptiveLimiter(8)
+  for _ in range(8):
+    limiter.acquire()
+  for _ in range(8):
+    limiter.release(throttled=True)
+  assert limiter.limit == 4, 'AdaptiveLimiter is not backing off properly!'
+
+  for _ in range(4):
+    limiter.acquire()
+    limiter.release()
+  assert limiter.limit == 5, 'AdaptiveLimiter is not ramping up properly!'
+
+def test_scrape_scps_worker(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  filelist = ['scp-descrips.txt', 'scp-conprocs.txt', 'scp-titles.txt', 'scp-addenda.txt']
+
+  # A lapsed lease hands the range to the next worker, and the first one can't finish it anymore.
+  queue = scpscraper.WorkQueue('leases.db', lease=0)
+  queue.create(0, 10, range_size=5)
+  assert queue.claim('a') == (0, 5) and queue.claim('b') == (0, 5), 'WorkQueue is not handing out lapsed leases!'
+  assert not queue.complete(0, 'a') and queue.complete(0, 'b'), 'WorkQueue is letting workers finish ranges they lost!'
+
+  # Every call closes the connection it opened.
+  connections = []
+  connect = sqlite3.connect
+  monkeypatch.setattr(sqlite3, 'connect', lambda *args, **kwargs: connections.append(connect(*args, **kwargs)) or connections[-1])
+  queue.claim('c')
+  queue.renew(5, 'c')
+  monkeypatch.setattr(sqlite3, 'connect', connect)
+  for db in connections:
+    with pytest.raises(sqlite3.ProgrammingError):
+      db.execute('SELECT 1')
+  assert connections, 'WorkQueue is not connecting to its database!'
+
+  try:
+    with _LocalWiki() as wiki:
+      monkeypatch.setattr(scpscraper.session, 'base_url', wiki.url)
+      scpscraper.series_index.clear()
+      scpscraper.scrape_scps(0, 30, output_dir='single')
+
+      # Two workers splitting the range between them.
+      threads = [threading.Thread(target=scpscraper.scrape_scps_worker, args=('queue.db', 0, 30), kwargs={'range_size': 4, 'owner': owner}) for owner in ('a', 'b')]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+
+  finally:
+    scpscraper.series_index.clear()
+
+  assert scpscraper.WorkQueue('queue.db').done(), 'scrape_scps_worker() is not finishing every range!'
+  scpscraper.merge_scps('queue.db', output_dir='merged')
+
+  for f in filelist:
+    assert open(f'merged/{f}').read() == open(f'single/{f}').read(), f'merge_scps() output is different from a single run for {f}!'
+
+def test_html_archive(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+
+  try:
+    with _LocalWiki() as wiki:
+      monkeypatch.setattr(scpscraper.session, 'base_url', wiki.url)
+      scpscraper.series_index.clear()
+      scpscraper.scrape_scps_html(0, 6, output_dir='plain')
+      scpscraper.scrape_scps_html(0, 6, archive='pages', shard_size=1)
+
+  finally:
+    scpscraper.series_index.clear()
+
+  assert open('scp-html.txt').read() == open('plain/scp-html.txt').read(), 'Archiving is changing the scrape_scps_html() output!'
+
+  with scpscraper.HTMLReader('pages') as reader:
+    assert reader.keys() == list(range(6)) and len(reader.shards) == 6, 'scrape_scps_html() is not archiving pages properly!'
+    assert reader.get(3) == _wiki_page('/scp-003').encode(), 'HTMLReader is not reading pages back properly!'
+
+  # Re-parsing the archive shouldn't need the wiki at all.
+  records = list(scpscraper.parse_archive('pages', ids=[2, 3, 40]))
+  assert records == [scpscraper.parse_scp(_wiki_page(f'/scp-{i:03d}'), i) for i in (2, 3)], 'parse_archive() is not parsing archived pages properly!'
+
+def test_compact_scp():
+  record = scpscraper.parse_scp(_wiki_page('/scp-003'), 3)
+  record['content']['Déscription'] = 'Ünïcode text.'
+  record['name'] = 'Fake Object 3'
+
+  compact = scpscraper.CompactSCP.from_dict(record)
+  assert compact.to_dict() == record and compact == record, 'CompactSCP is not converting back to the same dictionary!'
+  assert list(compact.to_dict()) == list(record), 'CompactSCP is not keeping the dictionary order!'
+  assert compact['tags'] == record['tags'] and compact.section('Déscription') == 'Ünïcode text.', 'CompactSCP is not reading like a dictionary!'
+
+  # Tags are shared between records instead of copied.
+  other = scpscraper.CompactSCP.from_dict(scpscraper.parse_scp(_wiki_page('/scp-005'), 5))
+  assert other.tags[0] is compact.tags[0], 'CompactSCP is not sharing tag strings!'
+
+  partial = {'id': 3, 'tags': record['tags']}
+  assert scpscraper.CompactSCP.from_dict(partial).to_dict() == partial, 'CompactSCP is not converting partial records back properly!'
+
+def test_build_dataset(tmp_path):
+  with scpscraper.ShardWriter(str(tmp_path / 'jsonl')) as writer:
+    for i in range(20):
+      writer.add(i, json.dumps(_fake_scp(i)).encode())
+    # An exact copy of SCP-004's document.
+    writer.add(40, json.dumps(_fake_scp(4)).encode())
+
+  built = {}
+  for processes, shuffle_buffer in ((0, 0), (2, 0), (2, 8)):
+    output_dir = str(tmp_path / f'dataset-{processes}-{shuffle_buffer}')
+    stats = scpscraper.build_dataset(str(tmp_path / 'jsonl'), output_dir, tags=['keter'], shard_size=1000, processes=processes, shuffle_buffer=shuffle_buffer)
+
+    documents = []
+    for shard in stats['shards']:
+      with gzip.open(f'{output_dir}/{shard["name"]}', 'rt') as infile:
+        documents += [json.loads(line) for line in infile]
+    built[processes, shuffle_buffer] = documents
+
+  assert [d['id'] for d in built[0, 0]] == list(range(0, 20, 2)), 'build_dataset() is not filtering tags or dropping duplicates properly!'
+  assert built[0, 0] == built[2, 0], 'build_dataset() output depends on the number of processes!'
+  assert built[2, 8] != built[0, 0] and sorted(built[2, 8], key=lambda d: d['id']) == built[0, 0], 'build_dataset() is not shuffling properly!'
+  assert built[0, 0][2]['text'] == 'SCP-XXXX: Fake Object 4\n\nItem #: SCP-XXXX\n\nSpecial Containment Procedures: Keep SCP-XXXX in a box.\n\nDescription: SCP-XXXX is object number 4.\n\nAddendum 1: Nothing to report.', 'build_dataset() is not redacting documents properly!'
+  assert (stats['documents'], stats['duplicates'], stats['skipped']) == (10, 1, 10) and len(stats['shards']) > 1, 'build_dataset() is not counting documents properly!'
+  assert sum(shard['bytes'] for shard in stats['shards']) == stats['bytes'], 'build_dataset() is not counting shard statistics properly!'
+
+  # A smaller re-run doesn't leave shards from the bigger one behind.
+  for count in (20, 2):
+    with scpscraper.ShardWriter(str(tmp_path / 'rerun'), max_shard_bytes=100) as writer:
+      for i in range(count):
+        writer.add(i, json.dumps(_fake_scp(i)).encode())
+  assert sorted(p.name for p in (tmp_path / 'rerun').iterdir()) == ['scps-00000.jsonl.gz', 'scps-00001.jsonl.gz', 'scps.index.json'], 'ShardWriter is leaving stale shards behind!'
+
+def test_fields(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  html = _wiki_page('/scp-003')
+  full = scpscraper.parse_scp(html, 3)
+
+  for engine in scpscraper.PARSER_ENGINES:
+    assert scpscraper.parse_scp(html, 3, engine, fields=['tags', 'revision']) == {'id': 3, 'tags': full['tags'], 'revision': full['revision']}, f'parse_scp() is not selecting fields properly with {engine}!'
+
+  try:
+    with _LocalWiki() as wiki:
+      monkeypatch.setattr(scpscraper.session, 'base_url', wiki.url)
+      scpscraper.series_index.clear()
+
+      # Sections alone shouldn't need the series page.
+      assert scpscraper.get_scp(3, fields=['content']) == {'id': 3, 'content': full['content']}, 'get_scp() is not selecting fields properly!'
+      assert not any(path.startswith('/scp-series') for path in wiki.requests), 'get_scp() is looking up names nobody asked for!'
+
+      # Titles alone shouldn't need the articles.
+      scpscraper.scrape_scps(0, 10, output_dir='full')
+      del wiki.requests[:]
+      for parse_workers in (0, 2):
+        scpscraper.scrape_scps(0, 10, fields=['name'], parse_workers=parse_workers, output_dir=f'titles-{parse_workers}')
+      assert not any(path.startswith('/scp-0') for path in wiki.requests), 'scrape_scps() is downloading articles for titles alone!'
+
+  finally:
+    scpscraper.series_index.clear()
+
+  for parse_workers in (0, 2):
+    assert open(f'titles-{parse_workers}/scp-titles.txt').read() == open('full/scp-titles.txt').read() != '', 'scrape_scps() is not writing titles properly with fields!'
+    assert open(f'titles-{parse_workers}/scp-descrips.txt').read() == '', 'scrape_scps() is writing fields nobody asked for!'
+
+def test_page_regions():
+  tricky = '<html><body><div id="side-bar"><div>Menu</div></div><div id="page-content"><p>a &amp; b &lt; c\xa0é<br>d<!-- note --></p><table><tr><td>1<td>2</table><p>unclosed<div class="x">q</div></div><div class="page-tags"><span>\n<a>t1</a>\n<a>t2</a></span></div></body></html>'
+
+  for html in (_wiki_page('/scp-003'), tricky):
+    soup = scpscraper.BeautifulSoup(html.encode(), 'lxml')
+    expected_tags = [tag.string for tag in soup.find('div', {'class': 'page-tags'}).find('span') if tag.string != '\n']
+
+    content, page_tags = core._page_regions(html.encode())
+    assert str(content) == str(soup.find('div', id='page-content')), 'lxml_backend.page_regions() is not extracting page-content like BeautifulSoup!'
+    assert page_tags == expected_tags, 'lxml_backend.page_regions() is not extracting tags like BeautifulSoup!'
+
+def test_gdrive_sync(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  drive = tmp_path / 'drive'
+  drive.mkdir()
+  monkeypatch.setattr(scpscraper.gdrive, 'drive_root', str(drive))
+
+  (tmp_path / 'shards').mkdir()
+  for i in range(3):
+    (tmp_path / 'shards' / f'part-{i}.txt').write_text(f'shard {i}\n' * 100)
+
+  stats = scpscraper.gdrive.copy_to_drive('shards')
+  assert stats['copied'] == 3, 'gdrive.copy_to_drive() is not copying new files!'
+
+  # Copying again only copies what changed, and works with the directory already there.
+  (tmp_path / 'shards' / 'part-1.txt').write_text('changed\n')
+  (tmp_path / 'shards' / 'part-3.txt').write_text('new\n')
+  stats = scpscraper.gdrive.copy_to_drive('shards')
+  assert (stats['copied'], stats['skipped']) == (2, 2), 'gdrive.copy_to_drive() is not skipping unchanged files!'
+  assert (drive / 'shards' / 'part-1.txt').read_text() == 'changed\n', 'gdrive.copy_to_drive() is not copying changed files!'
+
+  # Touching a file without changing it only costs a hash.
+  (tmp_path / 'shards' / 'part-0.txt').write_text('shard 0\n' * 100)
+  assert scpscraper.gdrive.copy_to_drive('shards')['copied'] == 0, 'gdrive.copy_to_drive() is copying files whose contents did not change!'
+
+  (tmp_path / 'local').mkdir()
+  monkeypatch.chdir(tmp_path / 'local')
+  scpscraper.gdrive.copy_from_drive('shards')
+  assert sorted(p.name for p in (tmp_path / 'local' / 'shards').iterdir()) == [scpscraper.gdrive.SYNC_MANIFEST, 'part-0.txt', 'part-1.txt', 'part-2.txt', 'part-3.txt'], 'gdrive.copy_from_drive() is not copying directories properly!'
+
+  # The manifest lives with the copy, not wherever the copy was made from.
+  assert not (tmp_path / 'local' / scpscraper.gdrive.SYNC_MANIFEST).exists(), 'gdrive.copy_from_drive() is keeping its manifest in the working directory!'
+  assert scpscraper.gdrive.copy_from_drive('shards')['copied'] == 0, 'gdrive.copy_from_drive() is copying unchanged files!'
+
+  # Source files named like temporary files are copied, and an interrupted copy's temporary file isn't deleted as if it was the user's.
+  monkeypatch.chdir(tmp_path)
+  (tmp_path / 'shards' / 'part-4.tmp').write_text('not a temporary file\n')
+  (drive / 'shards' / '.part-0.txt.abc123.scpscraper-tmp').write_text('half a copy')
+  stats = scpscraper.gdrive.copy_to_drive('shards', delete=True)
+  assert (drive / 'shards' / 'part-4.tmp').read_text() == 'not a temporary file\n' and (stats['copied'], stats['deleted']) == (1, 0), 'gdrive.sync() is mixing up temporary files with real ones!'
+
+def test_search_index(tmp_path):
+  with scpscraper.ShardWriter(str(tmp_path / 'jsonl')) as writer:
+    for i in range(20):
+      record = dict(_fake_scp(i), rating=i * 10, revision=1)
+      writer.add(i, (json.dumps(record) + '\n').encode('utf-8'))
+
+  path = str(tmp_path / 'index.db')
+  assert scpscraper.build_index(str(tmp_path / 'jsonl'), path) == {'added': 20, 'updated': 0, 'unchanged': 0}, 'build_index() is not indexing every SCP!'
+  assert scpscraper.build_index(str(tmp_path / 'jsonl'), path)['unchanged'] == 20, 'build_index() is re-indexing unchanged SCPs!'
+
+  with scpscraper.SearchIndex(path) as index:
+    assert index.get(3) == dict(_fake_scp(3), rating=30, revision=1), 'SearchIndex is not keeping records as they were!'
+    assert index.ids(tags=['keter']) == list(range(0, 20, 2)), 'SearchIndex is not finding SCPs by tag!'
+    assert index.ids('box', tags=['safe'], section='Special Containment Procedures', min_rating=100) == [11, 13, 15, 17, 19], 'SearchIndex is not combining queries properly!'
+    assert index.ids('box', section='Description') == [], 'SearchIndex is not restricting text queries to a section!'
+    assert index.ids('"number 7"') == [7], 'SearchIndex is not matching phrases!'
+
+    # A new revision replaces everything indexed for the SCP.
+    assert not index.add(dict(_fake_scp(7), rating=70, revision=1)), 'SearchIndex is re-indexing SCPs at the same revision!'
+    assert index.add({'id': 7, 'rating': 5, 'revision': 2, 'content': {'Description': 'Now a bucket.'}, 'tags': ['euclid']}), 'SearchIndex is not re-indexing new revisions!'
+    assert index.ids('"number 7"') == [] and index.ids('bucket') == [7], 'SearchIndex is keeping old sections around!'
+    assert index.ids(tags=['euclid']) == [7] and 7 not in index.ids(min_rating=10), 'SearchIndex is keeping old tags or ratings around!'
+    assert index.tags() == {'euclid': 1, 'keter': 10, 'safe': 9}, 'SearchIndex.tags() is not counting tags properly!'